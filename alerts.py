@@ -0,0 +1,244 @@
+# farmer alerts (SMS / WhatsApp / webhooks) for sensor errors, ESP failures and rain vetoes
+# the control loops call event()/clear(), which only drop a tuple on a bounded
+# queue; a background dispatcher does everything else:
+#   - debounce: a condition alerts once when it starts, then at most one
+#     reminder per REPEAT_INTERVAL while it keeps happening; it only counts as
+#     resolved after CLEAR_HOLD seconds without recurring, so flapping stays one alert
+#   - batching: messages for the same recipient within BATCH_WINDOW go out as one
+#   - per-channel rate limits (token buckets) and retries with backoff
+#
+#   python3 alerts.py --flaps 1000     (ESP flapping simulation with a stub gateway)
+
+import time
+import json
+import heapq
+import queue
+import argparse
+import threading
+
+REPEAT_INTERVAL = 3600     # seconds between reminders for a condition that keeps occurring
+CLEAR_HOLD = 600           # seconds a condition must stay away before it counts as resolved
+BATCH_WINDOW = 30          # seconds messages for one recipient are collected into one
+TICK = 1.0                 # dispatcher wake-up interval
+MAX_RETRIES = 5
+RETRY_BASE = 10            # seconds, doubled on every retry
+QUEUE_SIZE = 1000
+
+RATE_LIMITS = {            # channel -> (messages, per seconds)
+    "sms": (5, 3600),
+    "whatsapp": (20, 3600),
+    "webhook": (60, 3600),
+}
+
+
+# ------------ GATEWAYS ------------
+# a gateway has send(address, text) and raises on failure
+
+class StubGateway:
+    """Keeps messages in memory instead of sending them (tests, simulations)."""
+
+    def __init__(self, fail_first=0):
+        self.sent = []
+        self.fail_first = fail_first
+
+    def send(self, address, text):
+        if self.fail_first > 0:
+            self.fail_first -= 1
+            raise RuntimeError("stub gateway failure")
+        self.sent.append((address, text))
+
+
+class WebhookGateway:
+    """POSTs {"to": address, "text": text} as JSON to an SMS/WhatsApp provider or bridge."""
+
+    def __init__(self, url, timeout=10):
+        self.url = url
+        self.timeout = timeout
+
+    def send(self, address, text):
+        import requests
+        r = requests.post(self.url, data=json.dumps({"to": address, "text": text}),
+                          headers={"Content-Type": "application/json"}, timeout=self.timeout)
+        if r.status_code >= 300:
+            raise RuntimeError(f"gateway returned {r.status_code}")
+
+
+class TokenBucket:
+    def __init__(self, count, per, now):
+        self.capacity = count
+        self.rate = count / per
+        self.tokens = float(count)
+        self.stamp = now
+
+    def take(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+# ------------ DISPATCHER ------------
+
+class Alerts:
+    def __init__(self, recipients, gateways, clock=time.time, rate_limits=RATE_LIMITS):
+        # recipients: [(channel, address)], gateways: channel -> gateway
+        self.recipients = [r for r in recipients if r[0] in gateways]
+        self.gateways = gateways
+        self.clock = clock
+        self.q = queue.Queue(QUEUE_SIZE)
+        self.conditions = {}    # key -> {"since", "last_seen", "last_sent", "count", "message"}
+        self.raised = set()     # keys event() has queued since their last clear(), caller side
+        self.pending = {}       # (channel, address) -> [first_queued_at, [lines]]
+        self.retries = []       # heap of (due, attempt, channel, address, text)
+        now = clock()
+        self.buckets = {ch: TokenBucket(*rate_limits.get(ch, (60, 3600)), now) for ch in gateways}
+        self.stats = {"events": 0, "dropped": 0, "sent": 0, "retries": 0, "failed": 0}
+
+    @property
+    def enabled(self):
+        return bool(self.recipients)
+
+    def start(self):
+        if self.enabled:
+            threading.Thread(target=self._run, name="alerts", daemon=True).start()
+
+    # ---- called from the control loops: never blocks ----
+
+    def event(self, key, message):
+        """Report that condition `key` is happening."""
+        if not self.recipients:
+            return
+        try:
+            self.q.put_nowait((self.clock(), key, message))
+            self.raised.add(key)
+        except queue.Full:
+            self.stats["dropped"] += 1
+
+    def clear(self, key):
+        """Report that condition `key` is not happening (cheap no-op if it never was)."""
+        # `raised` covers an event still in the queue, which `conditions` does not show yet
+        if key in self.raised or key in self.conditions:
+            self.raised.discard(key)
+            try:
+                self.q.put_nowait((self.clock(), key, None))
+            except queue.Full:
+                self.stats["dropped"] += 1
+
+    # ---- dispatcher ----
+
+    def _run(self):
+        while True:
+            try:
+                try:
+                    item = self.q.get(timeout=TICK)
+                    self._handle(*item)
+                    while True:
+                        self._handle(*self.q.get_nowait())
+                except queue.Empty:
+                    pass
+                self.process(self.clock())
+            except Exception as e:
+                print("Alert dispatcher error:", e)
+
+    def _handle(self, ts, key, message):
+        c = self.conditions.get(key)
+        if message is None:                     # clear
+            if c:
+                c["cleared_at"] = c.get("cleared_at") or ts
+            return
+        self.stats["events"] += 1
+        if c is None:
+            self.conditions[key] = {"since": ts, "last_seen": ts, "last_sent": ts,
+                                    "count": 1, "message": message, "cleared_at": None}
+            self._queue(ts, f"ALERT: {message}")
+            return
+        c["last_seen"] = ts
+        c["count"] += 1
+        c["message"] = message
+        c["cleared_at"] = None                  # came back before CLEAR_HOLD: same alert
+
+    def _queue(self, now, line):
+        for r in self.recipients:
+            slot = self.pending.setdefault(r, [now, []])
+            slot[1].append(line)
+
+    def process(self, now):
+        """Reminders, resolutions, batch flushes and retries that are due at `now`."""
+        for key, c in list(self.conditions.items()):
+            if c["cleared_at"] is not None and now - c["cleared_at"] >= CLEAR_HOLD:
+                del self.conditions[key]
+                self._queue(now, f"RESOLVED: {key} (occurred {c['count']}x)")
+            elif now - c["last_sent"] >= REPEAT_INTERVAL and c["last_seen"] > c["last_sent"]:
+                c["last_sent"] = now
+                self._queue(now, f"STILL ACTIVE: {c['message']} (occurred {c['count']}x)")
+
+        for (channel, address), (first, lines) in list(self.pending.items()):
+            if now - first < BATCH_WINDOW:
+                continue
+            if not self.buckets[channel].take(now):
+                continue                         # rate limited: keep collecting
+            del self.pending[(channel, address)]
+            self._send(now, 0, channel, address, "\n".join(lines))
+
+        while self.retries and self.retries[0][0] <= now:
+            _, attempt, channel, address, text = heapq.heappop(self.retries)
+            self._send(now, attempt, channel, address, text)
+
+    def _send(self, now, attempt, channel, address, text):
+        try:
+            self.gateways[channel].send(address, text)
+            self.stats["sent"] += 1
+        except Exception as e:
+            if attempt + 1 >= MAX_RETRIES:
+                self.stats["failed"] += 1
+                print(f"Alert to {address} via {channel} failed:", e)
+            else:
+                self.stats["retries"] += 1
+                heapq.heappush(self.retries, (now + RETRY_BASE * 2 ** attempt, attempt + 1,
+                                              channel, address, text))
+
+
+# ------------ SIMULATION ------------
+
+def simulate(flaps=1000, hours=1.0):
+    """An ESP that goes unreachable/reachable `flaps` times per hour."""
+    now = [0.0]
+    sms = StubGateway(fail_first=2)
+    a = Alerts([("sms", "+910000000000")], {"sms": sms}, clock=lambda: now[0])
+    total = int(flaps * hours)
+    step = 3600.0 / flaps
+    in_loop = 0.0              # time the control loop itself spends on event()/clear()
+    for i in range(total):
+        now[0] = i * step
+        t0 = time.perf_counter()
+        a.event("esp_unreachable", "ESP pump node unreachable")
+        in_loop += time.perf_counter() - t0
+        a._handle(*a.q.get_nowait())
+        now[0] += step / 2
+        t0 = time.perf_counter()
+        a.clear("esp_unreachable")
+        in_loop += time.perf_counter() - t0
+        a._handle(*a.q.get_nowait())
+        if i % 10 == 0:
+            a.process(now[0])
+    # then the ESP stays up for the rest of the day
+    for k in range(int(hours * 3600), int(hours * 3600) + 86400, int(TICK * 10)):
+        a.process(k)
+    return {"flaps": total, "messages": len(sms.sent), "gateway_retries": a.stats["retries"],
+            "loop_cost_per_call_us": round(in_loop / (2 * total) * 1e6, 2), "log": sms.sent}
+
+def main():
+    ap = argparse.ArgumentParser(description="Alert dispatcher simulation")
+    ap.add_argument("--flaps", type=int, default=1000, help="ESP flaps per hour")
+    ap.add_argument("--hours", type=float, default=1.0)
+    args = ap.parse_args()
+    res = simulate(args.flaps, args.hours)
+    for addr, text in res.pop("log"):
+        print(f"-> {addr}: {text!r}")
+    for k, v in res.items():
+        print(f"  {k}: {v}")
+
+if __name__ == "__main__":
+    main()
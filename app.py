@@ -4,10 +4,12 @@ import time
 import json
 import threading
 import traceback
-from http.server import BaseHTTPRequestHandler, HTTPServer
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from urllib.parse import urlparse, parse_qs
 import requests
+import os
 import sys
+import hmac
 from datetime import datetime, timezone, timedelta
 
 # Hardware
@@ -15,17 +17,40 @@ import board
 import adafruit_dht
 import RPi.GPIO as GPIO
 
+from policy import is_rain_description, COOLDOWN
+from history import History, export, ENCODERS, TABLES
+from journal import Journal
+from geoweather import CellCache
+import debug
+from soil_adc import SoilProbes, MCP3008
+from alerts import Alerts, WebhookGateway
+from pumplink import PumpLink
+from sensor_proc import SensorProcess
+from scheduler import Scheduler
+from soil_edge import EdgeInput
+from dht_filter import DHTFilter
+from rules import RuleEngine, RuleError, default_profile, FEATURES
+from governor import Governor
+
 # ---------------- CONFIG ----------------
 
 ESP_HOST = "esp-pump.local"    # mDNS hostname for ESP8266
 ESP_PORT = 5001
+ZONE = "main"                  # zone name used in the pump journal
+PUMP_LINK = True               # keep a persistent TCP control channel to the ESP (HTTP /water is the fallback)
+PUMP_LINK_PORT = 5002
+ZONES = {}                     # zone -> {"windows": ["05:00-07:00"], "min_interval": seconds}; overrides rules set via /schedule/zone
+ZONE_STAGGER = 30              # seconds between consecutive pump runs, so zones never draw water together
+PROFILES_PATH = "profiles.json"  # crop profiles + zone -> {"profile", "planted", "probe", "lat", "lon"}, edited via /profiles
 
 OPENWEATHER_API_KEY = ""
 CITY = "Bengaluru,IN"             # Default city with country code (city,country)
+LOCATION = None                   # (lat, lon) of the farm; when set, weather is fetched per geohash cell instead of by CITY
 
 TEMP_THRESHOLD = 30.0
 SOIL_DRY_THRESHOLD = 30
 PUMP_TIME = 5
+RAIN_HORIZON = 24     # hours of forecast that veto auto-watering
 AUTO_ENABLED = True
 
 SENSOR_POLL = 2
@@ -33,19 +58,53 @@ AUTO_POLL = 10
 WEATHER_POLL = 300  # 5 minutes
 
 DHT_PIN = board.D4
+DHT_FILTER = True             # Hampel outlier rejection on DHT readings before they reach auto_loop
 SOIL_PIN = 17
 
+SENSOR_PROCESS = True         # read the DHT in a separate process (shared-memory hand-off) instead of sensor_loop
+SENSOR_CPU = None             # core to pin that process to, e.g. 3 (None = any)
+
+SOIL_MODE = "digital"         # "digital" (DO pin on SOIL_PIN) or "adc" (analog probes on an MCP3008)
+SOIL_EDGE = True              # digital mode: react to edges on SOIL_PIN instead of sampling it every SENSOR_POLL
+SOIL_PROBES = {0: None}       # ADC channel -> calibration [(raw, percent), ...]; None = soil_adc default
+
 PORT = 5000
 
+DEBUG_TOKEN = ""             # enables /debug/profile, /debug/memory and /debug/load when set (pass ?token=...)
+GOVERNOR = True              # stretch background work and shed dashboard polling when the Pi is hot/loaded
+
+ALERT_RECIPIENTS = []         # [(channel, address)], e.g. [("sms", "+9198xxxxxxxx"), ("whatsapp", "+9198xxxxxxxx")]
+ALERT_GATEWAYS = {}           # channel -> webhook URL of the SMS/WhatsApp provider
+DHT_STALE_ALERT = 120         # seconds without a good DHT read before alerting
+
+HISTORY_DB = "history.db"    # sensor readings + pump journal, exported via /export
+
 # ----------------------------------------
 
 GPIO.setmode(GPIO.BCM)
 GPIO.setup(SOIL_PIN, GPIO.IN)
 
-dht = adafruit_dht.DHT11(DHT_PIN, use_pulseio=False)
+def make_dht():
+    return adafruit_dht.DHT11(DHT_PIN, use_pulseio=False)
+
+# with SENSOR_PROCESS the DHT is only opened inside the acquisition process
+sensor_proc = SensorProcess(make_dht, SENSOR_POLL, cpu=SENSOR_CPU) if SENSOR_PROCESS else None
+dht = None if sensor_proc else make_dht()
+
+soil_probes = SoilProbes(MCP3008(), SOIL_PROBES) if SOIL_MODE == "adc" else None
+
+governor = Governor() if GOVERNOR else None
+history = History(HISTORY_DB, governor.interval if governor else None)   # commits less often under pressure
+journal = Journal(HISTORY_DB)
+pump_busy_until = 0.0   # set at startup if a journalled run may still be on
+alerts = Alerts(ALERT_RECIPIENTS, {ch: WebhookGateway(url) for ch, url in ALERT_GATEWAYS.items()})
+pump_link = PumpLink(ESP_HOST, PUMP_LINK_PORT) if PUMP_LINK else None
 
 lock = threading.Lock()
-latest = {"temperature": None, "humidity": None, "soil": None, "error": "Initializing"}
+latest = {"temperature": None, "humidity": None, "raw_temperature": None, "raw_humidity": None,
+          "soil": None, "soil_probes": None, "soil_changed_at": None, "error": "Initializing"}
+dht_filter = DHTFilter() if DHT_FILTER else None   # guarded by lock
+decision_wake = threading.Event()   # set to run auto_loop now instead of at its next AUTO_POLL
 # weather now includes forecast summary, boolean for rain next 24h, and rain_times list
 weather = {
     "enabled": bool(OPENWEATHER_API_KEY),
@@ -54,42 +113,83 @@ weather = {
     "temp": None,
     "description": None,
     "rain_next_24h": False,
-    "rain_times": []   # human-readable times within next 24h where rain is predicted
+    "rain_times": [],   # human-readable times within next 24h where rain is predicted
+    "zone_rain": {}     # zone -> rain flag from the zone's own cell (zones with lat/lon)
 }
 settings = {
     "TEMP_THRESHOLD": TEMP_THRESHOLD,
     "SOIL_DRY_THRESHOLD": SOIL_DRY_THRESHOLD,
     "PUMP_TIME": PUMP_TIME,
+    "RAIN_HORIZON": RAIN_HORIZON,
     "AUTO_ENABLED": AUTO_ENABLED
 }
 
 # ------------ SENSOR LOOP ------------
 def read_soil():
-    v = GPIO.input(SOIL_PIN)
+    if soil_probes:
+        # analog: mean of the calibrated probes, per-probe values go to latest["soil_probes"]
+        values, err = soil_probes.read()
+        if err:
+            raise RuntimeError(err)
+        with lock:
+            latest["soil_probes"] = values
+        return soil_probes.mean()
+    v = soil_edge.level if soil_edge else GPIO.input(SOIL_PIN)
     return 100 if v == 0 else 0   # 0=wet, 1=dry
 
+def on_soil_edge(level, ts):
+    """Debounced dry/wet transition on SOIL_PIN: record it at its edge time and wake auto_loop."""
+    soil = 100 if level == 0 else 0
+    with lock:
+        latest["soil"] = soil
+        latest["soil_changed_at"] = ts
+        reading = (latest["temperature"], latest["humidity"], soil)
+    history.add_reading(ts, *reading)
+    print("Soil is now", "wet" if soil else "dry")
+    decision_wake.set()
+
+soil_edge = EdgeInput(GPIO, SOIL_PIN, on_soil_edge) if SOIL_MODE == "digital" and SOIL_EDGE else None
+
 def sensor_loop():
     global latest
+    last_dht_ok = time.time()
     while True:
         try:
             temp = None
             hum = None
-            try:
-                temp = dht.temperature
-                hum = dht.humidity
-            except RuntimeError:
-                # intermittent DHT failures are normal; keep previous values
-                pass
+            if sensor_proc:
+                # newest good sample published by the acquisition process since the last pass
+                temp, hum = sensor_proc.poll()
+            else:
+                try:
+                    temp = dht.temperature
+                    hum = dht.humidity
+                except RuntimeError:
+                    # intermittent DHT failures are normal; keep previous values
+                    pass
+
+            if temp is not None:
+                last_dht_ok = time.time()
+                alerts.clear("dht_stale")
+            elif time.time() - last_dht_ok > DHT_STALE_ALERT:
+                alerts.event("dht_stale", f"No temperature/humidity reading for {int(time.time() - last_dht_ok)}s")
 
             soil = None
             try:
                 soil = read_soil()
+                alerts.clear("soil_error")
             except Exception as e:
                 with lock:
                     latest["error"] = f"Soil read error: {e}"
+                alerts.event("soil_error", f"Soil read error: {e}")
 
             with lock:
                 if temp is not None:
+                    latest["raw_temperature"] = float(temp)
+                    latest["raw_humidity"] = float(hum)
+                    if dht_filter:
+                        # a spike is replaced by the window median, so it cannot trigger the pump
+                        temp, hum = dht_filter.update(float(temp), float(hum))
                     latest["temperature"] = float(temp)
                     latest["humidity"] = float(hum)
                     latest["error"] = None
@@ -97,20 +197,29 @@ def sensor_loop():
                     if latest["temperature"] is None:
                         latest["error"] = "Sensor warming up"
                 latest["soil"] = soil
+                reading = (latest["temperature"], latest["humidity"], soil)
+            history.add_reading(time.time(), *reading)
 
         except Exception as e:
             with lock:
                 latest["error"] = f"Sensor thread error: {e}"
+            alerts.event("sensor_error", f"Sensor thread error: {e}")
             traceback.print_exc()
         time.sleep(SENSOR_POLL)
 
 # ------------ WEATHER LOOP (current + 24h forecast) ------------
 
-def fetch_current_weather():
+def _where(lat, lon):
+    """Query string selecting the location: coordinates if given, else CITY."""
+    if lat is not None:
+        return f"lat={lat:.4f}&lon={lon:.4f}"
+    return f"q={CITY}"
+
+def fetch_current_weather(lat=None, lon=None):
     """Fetch current weather (same as before). Returns JSON or None."""
-    if not OPENWEATHER_API_KEY or not CITY:
+    if not OPENWEATHER_API_KEY or (lat is None and not CITY):
         return None
-    url = f"https://api.openweathermap.org/data/2.5/weather?q={CITY}&appid={OPENWEATHER_API_KEY}&units=metric"
+    url = f"https://api.openweathermap.org/data/2.5/weather?{_where(lat, lon)}&appid={OPENWEATHER_API_KEY}&units=metric"
     try:
         r = requests.get(url, timeout=8)
         if r.status_code == 200:
@@ -121,11 +230,11 @@ def fetch_current_weather():
         print("Weather error (current):", e)
     return None
 
-def fetch_forecast_3h():
+def fetch_forecast_3h(lat=None, lon=None):
     """Fetch 3-hourly forecast (5-day) and return JSON or None."""
-    if not OPENWEATHER_API_KEY or not CITY:
+    if not OPENWEATHER_API_KEY or (lat is None and not CITY):
         return None
-    url = f"https://api.openweathermap.org/data/2.5/forecast?q={CITY}&appid={OPENWEATHER_API_KEY}&units=metric"
+    url = f"https://api.openweathermap.org/data/2.5/forecast?{_where(lat, lon)}&appid={OPENWEATHER_API_KEY}&units=metric"
     try:
         r = requests.get(url, timeout=8)
         if r.status_code == 200:
@@ -136,12 +245,30 @@ def fetch_forecast_3h():
         print("Weather error (forecast):", e)
     return None
 
-def analyze_forecast_for_24h(forecast_json):
-    """Given forecast JSON (list of 3-hour entries), return (rain_next_24h:bool, rain_times:list[str])."""
+def fetch_cell(lat, lon):
+    """Current weather + forecast for a geohash cell centre; None if both failed."""
+    cur = fetch_current_weather(lat, lon)
+    fc = fetch_forecast_3h(lat, lon)
+    if cur is None and fc is None:
+        return None
+    return cur, fc
+
+# one upstream fetch per cell per WEATHER_POLL, shared by every farm/zone located in it
+weather_cells = CellCache(fetch_cell, ttl=WEATHER_POLL)
+
+def fetch_weather():
+    """(current, forecast) JSON for LOCATION via the cell cache, or for CITY."""
+    if LOCATION:
+        return weather_cells.get(*LOCATION) or (None, None)
+    return fetch_current_weather(), fetch_forecast_3h()
+
+def analyze_forecast_for_24h(forecast_json, hours=24):
+    """Given forecast JSON (list of 3-hour entries), return (rain_next_24h:bool, rain_times:list[str]).
+    Only the next `hours` hours are considered (the RAIN_HORIZON setting)."""
     if not forecast_json or "list" not in forecast_json:
         return False, []
     now = datetime.now(timezone.utc)
-    end = now + timedelta(hours=24)
+    end = now + timedelta(hours=hours)
     rain_times = []
     for entry in forecast_json["list"]:
         # entry example: { "dt": 169..., "main": {...}, "weather": [ { "main": "Rain", "description":"light rain"} ], "rain": {"3h": 0.5} }
@@ -178,84 +305,160 @@ def weather_loop():
         return
     weather["enabled"] = True
 
-    # fetch immediately
-    try:
-        cur = fetch_current_weather()
-        fc = fetch_forecast_3h()
-        with lock:
-            if cur:
-                desc = cur.get("weather", [{}])[0].get("description")
-                weather["summary"] = desc
-                weather["description"] = cur.get("weather", [{}])[0].get("main")
-                weather["temp"] = cur.get("main", {}).get("temp")
-                weather["rain"] = ("rain" in (desc or "").lower() or "shower" in (desc or "").lower() or "drizzle" in (desc or "").lower() or "thunder" in (desc or "").lower())
-            else:
-                weather["summary"] = "Unable to fetch"
-                weather["rain"] = False
-
-            # forecast analysis
-            rain_24, rain_times = analyze_forecast_for_24h(fc)
-            weather["rain_next_24h"] = rain_24
-            weather["rain_times"] = rain_times
-    except Exception as e:
-        print("Weather thread initial error:", e)
-
+    # fetch immediately, then every WEATHER_POLL (stretched by the governor under pressure)
     while True:
         try:
-            time.sleep(WEATHER_POLL)
-            cur = fetch_current_weather()
-            fc = fetch_forecast_3h()
-            with lock:
-                if cur:
-                    desc = cur.get("weather", [{}])[0].get("description")
-                    weather["summary"] = desc
-                    weather["description"] = cur.get("weather", [{}])[0].get("main")
-                    weather["temp"] = cur.get("main", {}).get("temp")
-                    weather["rain"] = ("rain" in (desc or "").lower() or "shower" in (desc or "").lower() or "drizzle" in (desc or "").lower() or "thunder" in (desc or "").lower())
-                else:
-                    weather["summary"] = None
-                    weather["rain"] = False
-
-                rain_24, rain_times = analyze_forecast_for_24h(fc)
-                weather["rain_next_24h"] = rain_24
-                weather["rain_times"] = rain_times
+            fetch_and_update_weather()
         except Exception as e:
             print("Weather loop error:", e)
             traceback.print_exc()
+        time.sleep(governor.interval(WEATHER_POLL) if governor else WEATHER_POLL)
 
 # ------------ PUMP CONTROL ------------
-def trigger_pump(seconds):
+def trigger_pump(seconds, source="manual", inputs=None, zone=ZONE):
+    seconds = int(seconds)
+    run_id = journal.run_started(zone, seconds, source, inputs)
+    started = time.time()
+    ok = False
+    if pump_link and pump_link.connected:
+        # one round trip on the open channel; no HTTP retry if the ack is lost,
+        # since the node may already have switched the relay on
+        print(f"Pump link: water {seconds}s")
+        ok = pump_link.water(seconds)
+        if ok:
+            alerts.clear("esp_error")
+        else:
+            alerts.event("esp_error", "Pump node did not acknowledge command")
+        journal.run_finished(zone, run_id, seconds, ok, time.time() - started)
+        return ok
     try:
-        url = f"http://{ESP_HOST}:{ESP_PORT}/water?seconds={int(seconds)}"
+        url = f"http://{ESP_HOST}:{ESP_PORT}/water?seconds={seconds}"
         print("Calling:", url)
         r = requests.get(url, timeout=4)
-        return r.status_code == 200
+        ok = r.status_code == 200
+        alerts.clear("esp_unreachable")
+        if ok:
+            alerts.clear("esp_error")
+        else:
+            alerts.event("esp_error", f"Pump node rejected command: HTTP {r.status_code}")
     except Exception as e:
         print("ESP unreachable:", e)
-        return False
+        alerts.event("esp_unreachable", f"Pump node {ESP_HOST} unreachable")
+    journal.run_finished(zone, run_id, seconds, ok, time.time() - started)
+    return ok
 
 # ------------ AUTO WATERING ------------
+# the decision rules are per-zone crop profiles (rules.py); "default" is the
+# original threshold rule built from settings and recompiled when they change
+engine = RuleEngine([default_profile(TEMP_THRESHOLD, SOIL_DRY_THRESHOLD, PUMP_TIME)])
+zone_profiles = {ZONE: {"profile": "default"}}     # replaced as a whole, never mutated
+
+def check_zone_location(zone, c):
+    """Raise ValueError unless a zone config has both lat and lon (in range) or neither."""
+    if "lat" not in c and "lon" not in c:
+        return
+    lat, lon = c.get("lat"), c.get("lon")
+    for v, lim in ((lat, 90), (lon, 180)):
+        if isinstance(v, bool) or not isinstance(v, (int, float)) or not -lim <= v <= lim:
+            raise ValueError(f"zone {zone}: lat/lon must be numbers within ±90/±180, got {lat!r}, {lon!r}")
+
+def load_profiles():
+    global zone_profiles
+    try:
+        with open(PROFILES_PATH) as f:
+            saved = json.load(f)
+    except FileNotFoundError:
+        saved = {}
+    engine.load(saved.get("profiles", []))
+    zones = dict(zone_profiles, **saved.get("zones", {}))
+    channels = set(SOIL_PROBES) if soil_probes else set()
+    for zone, c in zones.items():
+        if "probe" in c and c["probe"] not in channels:
+            print(f"Zone {zone}: soil probe {c['probe']} is not configured, using the main soil sensor")
+        try:
+            check_zone_location(zone, c)
+        except ValueError as e:
+            print(f"{e}; using the farm's weather")
+            zones[zone] = {k: v for k, v in c.items() if k not in ("lat", "lon")}
+    zone_profiles = zones
+
+def save_profiles():
+    tmp = PROFILES_PATH + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump({"profiles": [p for p in engine.specs() if p["name"] != "default"],
+                   "zones": zone_profiles}, f, indent=1)
+    os.replace(tmp, PROFILES_PATH)
+
+def zone_features(zones):
+    """Feature columns (rules.FEATURES) for [(zone, profile)], one entry per zone."""
+    now = time.time()
+    n = len(zones)
+    with lock:
+        temp, hum, soil = latest["temperature"], latest["humidity"], latest["soil"]
+        probes = latest["soil_probes"] or {}
+        rain = weather.get("rain_next_24h", False) or weather.get("rain", False)
+        zone_rain = weather["zone_rain"]
+    cfg = zone_profiles
+    last_runs = {z: c["last_run"] for z, c in scheduler.status()["zones"].items()}
+    soils, rains, days, since = [], [], [], []
+    for zone, _ in zones:
+        zc = cfg.get(zone, {})
+        soils.append(probes.get(zc["probe"], soil) if "probe" in zc else soil)
+        rains.append(zone_rain.get(zone, rain))
+        planted = parse_time(zc.get("planted"))
+        days.append(None if planted is None else (now - planted) / 86400)
+        last = last_runs.get(zone)
+        since.append(1e9 if last is None else (now - last) / 3600)
+    return {"temperature": [temp] * n, "humidity": [hum] * n, "soil": soils, "rain": rains,
+            "hour": [time.localtime(now).tm_hour] * n, "day": days, "since_water": since}
+
+def decide(zones):
+    """[(zone, profile)] -> [(outcome, seconds, inputs)] for one batch."""
+    features = zone_features(zones)
+    out = []
+    for i, (d, (zone, profile)) in enumerate(zip(engine.evaluate(zones, features), zones)):
+        inputs = {k: v[i] for k, v in features.items()}
+        inputs.update(profile=profile, stage=d[2])
+        out.append((d[0], d[1], inputs))
+    return out
+
+def still_wanted(job):
+    """Scheduler re-check for an auto job that had to wait (window, min interval, other zones)."""
+    profile = zone_profiles.get(job.zone, {}).get("profile", "default")
+    return settings["AUTO_ENABLED"] and decide([(job.zone, profile)])[0][0] == "water"
+
+def run_job(job):
+    print(f"SCHEDULE: {job.kind} job {job.id} -> zone {job.zone} for {job.seconds}s")
+    return trigger_pump(job.seconds, job.kind, job.data, zone=job.zone)
+
+scheduler = Scheduler(run_job, still_wanted, HISTORY_DB, stagger=ZONE_STAGGER)
+
 def auto_loop():
     while True:
+        decision_wake.clear()
         try:
             with lock:
-                t = latest["temperature"]
-                s = latest["soil"]
-                temp_th = settings["TEMP_THRESHOLD"]
-                soil_th = settings["SOIL_DRY_THRESHOLD"]
-                sec = settings["PUMP_TIME"]
                 auto = settings["AUTO_ENABLED"]
-                rain = weather.get("rain_next_24h", False) or weather.get("rain", False)
 
-            if auto and t is not None and s is not None:
-                if (t > temp_th or s < soil_th) and not rain:
-                    print("AUTO WATER: Triggering pump")
-                    trigger_pump(sec)
-                    time.sleep(sec + 3)
+            if auto and time.time() >= pump_busy_until:
+                zones = [(z, c.get("profile", "default")) for z, c in zone_profiles.items()]
+                vetoed = []
+                for (zone, _), (outcome, seconds, inputs) in zip(zones, decide(zones)):
+                    journal.decision(zone, outcome, inputs)
+                    if outcome == "veto":
+                        vetoed.append(zone)
+                    elif outcome == "water":
+                        # the scheduler runs it now, or when the zone's window/interval and the
+                        # stagger allow (re-checking the rules first if it had to wait)
+                        scheduler.submit_reactive(zone, seconds, inputs)
+                if vetoed:
+                    alerts.event("rain_veto", f"Auto-watering paused: rain expected ({', '.join(vetoed)})")
+                else:
+                    alerts.clear("rain_veto")
 
         except Exception as e:
             print("Auto loop error:", e)
-        time.sleep(AUTO_POLL)
+        decision_wake.wait(AUTO_POLL)
 
 # ------------ WEB UI (ENHANCED PREMIUM DESIGN) ------------
 HTML = """<!doctype html>
@@ -722,13 +925,23 @@ input::placeholder {
 
       <div class="input-group" style="margin-top: 24px;">
         <label class="input-label">Location</label>
-        <select id="city">
-          <option value="Bengaluru,IN">Bengaluru</option>
-          <option value="Hyderabad,IN">Hyderabad</option>
-          <option value="Mumbai,IN">Mumbai</option>
-          <option value="Chennai,IN">Chennai</option>
+        <select id="city" onchange="pickCity()">
+          <option value="12.9716,77.5946">Bengaluru</option>
+          <option value="17.3850,78.4867">Hyderabad</option>
+          <option value="19.0760,72.8777">Mumbai</option>
+          <option value="13.0827,80.2707">Chennai</option>
         </select>
       </div>
+      <div class="settings-grid">
+        <div class="input-group">
+          <label class="input-label">Latitude</label>
+          <input id="lat" type="number" step="0.0001" value="12.9716" />
+        </div>
+        <div class="input-group">
+          <label class="input-label">Longitude</label>
+          <input id="lon" type="number" step="0.0001" value="77.5946" />
+        </div>
+      </div>
       <button onclick="saveCity()" class="btn btn-secondary" style="width: 100%;">Update Location</button>
     </div>
 
@@ -771,6 +984,11 @@ input::placeholder {
         <label class="input-label">Auto Pump Time (s)</label>
         <input id="thp" type="number" />
       </div>
+
+      <div class="input-group">
+        <label class="input-label">Rain Veto Horizon (h)</label>
+        <input id="thr" type="number" />
+      </div>
     </div>
     
     <button onclick="save()" class="btn" style="width: 100%;">💾 Save Settings</button>
@@ -778,9 +996,16 @@ input::placeholder {
 </div>
 
 <script>
+let next = 2000;   // ms until the next refresh; the agent may ask for longer with 503 + Retry-After
+function busy(r){
+  if (r.status !== 503) return false;
+  next = (parseInt(r.headers.get('Retry-After')) || 10) * 1000;
+  return true;
+}
 async function load(){
+  next = 2000;
   try{
-    let r=await fetch('/sensor'); let d=await r.json();
+    let r=await fetch('/sensor'); if (busy(r)) return; let d=await r.json();
     document.getElementById('t').innerText = d.temperature !== null ? d.temperature.toFixed(1) + '°C' : '--°';
     document.getElementById('h').innerText = d.humidity !== null ? d.humidity.toFixed(0) + '%' : '--%';
     document.getElementById('s').innerText = d.soil !== null ? d.soil + '%' : '--%';
@@ -794,7 +1019,7 @@ async function load(){
       statusEl.innerHTML = '✅ System Online';
     }
 
-    let w = await fetch('/weather'); w = await w.json();
+    let w = await fetch('/weather'); if (busy(w)) return; w = await w.json();
     document.getElementById('wtemp').innerText = w.temp !== null ? Math.round(w.temp) + '°' : '--°';
     document.getElementById('wdesc').innerText = w.summary || 'No data';
 
@@ -842,7 +1067,8 @@ async function save(){
   let data = { 
     TEMP_THRESHOLD: parseFloat(document.getElementById('tht').value), 
     SOIL_DRY_THRESHOLD: parseInt(document.getElementById('ths').value), 
-    PUMP_TIME: parseInt(document.getElementById('thp').value) 
+    PUMP_TIME: parseInt(document.getElementById('thp').value),
+    RAIN_HORIZON: parseFloat(document.getElementById('thr').value)
   };
   await fetch('/settings',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify(data)});
   
@@ -856,9 +1082,16 @@ async function save(){
   }, 2000);
 }
 
+function pickCity(){
+  const [lat, lon] = document.getElementById('city').value.split(',');
+  document.getElementById('lat').value = lat;
+  document.getElementById('lon').value = lon;
+}
+
 async function saveCity(){
-  let c = document.getElementById('city').value;
-  await fetch('/setcity?c='+c);
+  let lat = document.getElementById('lat').value;
+  let lon = document.getElementById('lon').value;
+  await fetch('/setlocation?lat='+lat+'&lon='+lon);
   
   const btn = event.target;
   btn.innerHTML = '⏳ Updating...';
@@ -876,10 +1109,11 @@ async function loadSettings(){
   document.getElementById('tht').value = d.TEMP_THRESHOLD;
   document.getElementById('ths').value = d.SOIL_DRY_THRESHOLD;
   document.getElementById('thp').value = d.PUMP_TIME;
+  document.getElementById('thr').value = d.RAIN_HORIZON;
 }
 
-setInterval(load, 2000); 
-load(); 
+async function tick(){ await load(); setTimeout(tick, next); }
+tick();
 loadSettings();
 </script>
 
@@ -893,10 +1127,123 @@ class Handler(BaseHTTPRequestHandler):
         self.send_header("Content-Type","application/json")
         self.end_headers()
 
+    def _stream(self, ctype, chunks, headers=()):
+        """Send a generator of byte chunks with chunked transfer encoding."""
+        self.protocol_version = "HTTP/1.1"
+        self.send_response(200)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.send_header("Connection", "close")
+        for k, v in headers:
+            self.send_header(k, v)
+        self.end_headers()
+        try:
+            for chunk in chunks:
+                if chunk:
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            chunks.close()
+        self.close_connection = True
+
+    def _export(self, q):
+        fmt = q.get("format", ["csv"])[0]
+        table = q.get("kind", ["readings"])[0]
+        try:
+            start = parse_time(q.get("from", [""])[0])
+            end = parse_time(q.get("to", [""])[0])
+        except ValueError:
+            fmt = None
+        if fmt not in ENCODERS or table not in TABLES:
+            self._json(400)
+            self.wfile.write(b'"bad export parameters"')
+            return
+        # gzip=1 downloads a .gz file; otherwise compress on the wire if the client accepts it
+        as_file = q.get("gzip", ["0"])[0] == "1"
+        on_wire = not as_file and "gzip" in self.headers.get("Accept-Encoding", "")
+        ctype, chunks = export(history, table, start, end, fmt, as_file or on_wire)
+        name = f"{table}.{fmt}" + (".gz" if as_file else "")
+        headers = [("Content-Disposition", f'attachment; filename="{name}"')]
+        if on_wire:
+            headers.append(("Content-Encoding", "gzip"))
+        self._stream(ctype, chunks, headers)
+
+    def _admit(self, p, q):
+        """False (503 + Retry-After already sent) if the governor sheds this GET."""
+        if not governor:
+            return True
+        if p in ("/export", "/debug/profile") or (p == "/profiles" and q.get("eval", ["0"])[0] == "1"):
+            kind = "heavy"
+        elif p in ("/sensor", "/weather", "/schedule", "/profiles", "/journal"):
+            kind = "poll"
+        else:
+            kind = "control"     # page, pump, watering, settings, metrics: never shed
+        ok, retry = governor.admit(kind)
+        if not ok:
+            self.send_response(503)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Retry-After", str(retry))
+            self.end_headers()
+            self.wfile.write(json.dumps({"error": "busy", "level": governor.level, "retry_after": retry}).encode())
+        return ok
+
+    def _debug(self, p, q):
+        token = q.get("token", [""])[0] or self.headers.get("X-Debug-Token", "")
+        if not DEBUG_TOKEN or not hmac.compare_digest(token.encode(), DEBUG_TOKEN.encode()):
+            self.send_response(404)
+            self.end_headers()
+            return
+        if p == "/debug/profile":
+            try:
+                secs = float(q.get("seconds", ["5"])[0])
+            except ValueError:
+                secs = 5
+            out = debug.profile(secs)
+            if out is None:
+                self._json(409)
+                self.wfile.write(b'"profile already running"')
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain")
+            self.end_headers()
+            self.wfile.write(out.encode())
+            return
+        if p == "/debug/memory":
+            out = debug.memory(stop=q.get("stop", ["0"])[0] == "1")
+            self._json()
+            self.wfile.write(json.dumps(out).encode())
+            return
+        if p == "/debug/load" and governor:
+            # simulated pressure for drills: ?temp=82&mem_free=0.05, ?throttled=1, ?clear=1
+            if q.get("clear", ["0"])[0] == "1":
+                governor.clear_simulation()
+            else:
+                try:
+                    sig = {k: float(v[0]) for k, v in q.items() if k != "token"}
+                except ValueError:
+                    self._json(400)
+                    self.wfile.write(b'"bad signal value"')
+                    return
+                for k in ("throttled", "on_battery"):
+                    if k in sig:
+                        sig[k] = bool(sig[k])
+                governor.simulate(**sig)
+            # only the governor thread reads signals; the level follows within a few polls
+            self._json()
+            self.wfile.write(json.dumps(governor.metrics()).encode())
+            return
+        self.send_response(404)
+        self.end_headers()
+
     def do_GET(self):
+        global CITY, LOCATION
         parsed = urlparse(self.path)
         p = parsed.path
         q = parse_qs(parsed.query)
+        if not self._admit(p, q):
+            return
 
         if p == "/":
             self.send_response(200)
@@ -908,6 +1255,10 @@ class Handler(BaseHTTPRequestHandler):
         if p == "/sensor":
             with lock:
                 out = dict(latest)
+                if dht_filter:
+                    out["filter"] = dht_filter.stats()
+            if sensor_proc:
+                out["dht"] = sensor_proc.stats()
             self._json()
             self.wfile.write(json.dumps(out).encode())
             return
@@ -920,7 +1271,9 @@ class Handler(BaseHTTPRequestHandler):
                     "temp": weather.get("temp"),
                     "description": weather.get("description"),
                     "rain_next_24h": weather.get("rain_next_24h"),
-                    "rain_times": weather.get("rain_times", [])
+                    "rain_times": weather.get("rain_times", []),
+                    "cell": weather_cells.cell_of(*LOCATION) if LOCATION else None,
+                    "zone_rain": weather["zone_rain"]
                 }
             self._json()
             self.wfile.write(json.dumps(out).encode())
@@ -928,74 +1281,289 @@ class Handler(BaseHTTPRequestHandler):
 
         if p == "/water":
             sec = int(q.get("seconds",[PUMP_TIME])[0])
-            threading.Thread(target=trigger_pump,args=(sec,),daemon=True).start()
+            threading.Thread(target=trigger_pump,args=(sec,),name="manual_pump",daemon=True).start()
             self._json()
             self.wfile.write(b'"OK"')
             return
 
         if p == "/setcity":
-            global CITY
             CITY = q.get("c",[""])[0]
+            LOCATION = None
             threading.Thread(target=fetch_and_update_weather, daemon=True).start()
             self._json()
             self.wfile.write(b'"OK"')
             return
 
+        if p == "/setlocation":
+            try:
+                lat = float(q.get("lat",[""])[0])
+                lon = float(q.get("lon",[""])[0])
+                if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+                    raise ValueError
+            except ValueError:
+                self._json(400)
+                self.wfile.write(b'"bad lat/lon"')
+                return
+            LOCATION = (lat, lon)
+            threading.Thread(target=fetch_and_update_weather, daemon=True).start()
+            self._json()
+            self.wfile.write(json.dumps({"cell": weather_cells.cell_of(lat, lon)}).encode())
+            return
+
         if p == "/settings":
             with lock:
                 self._json()
                 self.wfile.write(json.dumps(settings).encode())
             return
 
+        if p == "/export":
+            self._export(q)
+            return
+
+        if p.startswith("/debug/"):
+            self._debug(p, q)
+            return
+
+        if p == "/metrics":
+            out = {"governor": governor.metrics() if governor else None,
+                   "scheduler": scheduler.status()}
+            if sensor_proc:
+                out["dht"] = sensor_proc.stats()
+            self._json()
+            self.wfile.write(json.dumps(out).encode())
+            return
+
+        if p == "/pump":
+            out = {"link": bool(pump_link and pump_link.connected)}
+            if pump_link:
+                out.update(pump_link.state)
+                out["reconnects"] = pump_link.reconnects
+            self._json()
+            self.wfile.write(json.dumps(out).encode())
+            return
+
+        if p == "/profiles":
+            out = {"profiles": engine.specs(source=q.get("source", ["0"])[0] == "1"),
+                   "zones": zone_profiles, "features": FEATURES}
+            if q.get("eval", ["0"])[0] == "1":
+                zones = [(z, c.get("profile", "default")) for z, c in zone_profiles.items()]
+                out["decisions"] = {z: {"outcome": o, "seconds": sec, "inputs": i}
+                                    for (z, _), (o, sec, i) in zip(zones, decide(zones))}
+            self._json()
+            self.wfile.write(json.dumps(out).encode())
+            return
+
+        if p == "/schedule":
+            try:
+                limit = int(q.get("limit", ["50"])[0])
+            except ValueError:
+                limit = 50
+            out = dict(scheduler.status(), upcoming=scheduler.upcoming(limit, q.get("zone", [None])[0]))
+            self._json()
+            self.wfile.write(json.dumps(out).encode())
+            return
+
+        if p == "/journal":
+            try:
+                out = journal.query(parse_time(q.get("from", [""])[0]), parse_time(q.get("to", [""])[0]),
+                                    q.get("zone", [None])[0], q.get("kind", [None])[0],
+                                    int(q.get("limit", ["1000"])[0]))
+            except ValueError:
+                self._json(400)
+                self.wfile.write(b'"bad journal parameters"')
+                return
+            self._json()
+            self.wfile.write(json.dumps(out).encode())
+            return
+
         self.send_response(404)
         self.end_headers()
 
     def do_POST(self):
+        global zone_profiles
         if self.path == "/settings":
             ln = int(self.headers.get("Content-Length",0))
             body = self.rfile.read(ln).decode()
-            data = json.loads(body)
-            with lock:
-                if "TEMP_THRESHOLD" in data:
-                    settings["TEMP_THRESHOLD"] = float(data["TEMP_THRESHOLD"])
-                if "SOIL_DRY_THRESHOLD" in data:
-                    settings["SOIL_DRY_THRESHOLD"] = int(data["SOIL_DRY_THRESHOLD"])
-                if "PUMP_TIME" in data:
-                    settings["PUMP_TIME"] = int(data["PUMP_TIME"])
+            try:
+                data = json.loads(body)
+                with lock:
+                    # validated on a copy: settings only change once the default profile compiles
+                    new = dict(settings)
+                    if "TEMP_THRESHOLD" in data:
+                        new["TEMP_THRESHOLD"] = float(data["TEMP_THRESHOLD"])
+                    if "SOIL_DRY_THRESHOLD" in data:
+                        new["SOIL_DRY_THRESHOLD"] = int(data["SOIL_DRY_THRESHOLD"])
+                    if "PUMP_TIME" in data:
+                        new["PUMP_TIME"] = int(data["PUMP_TIME"])
+                    if "RAIN_HORIZON" in data:
+                        new["RAIN_HORIZON"] = float(data["RAIN_HORIZON"])
+                        if not 0 <= new["RAIN_HORIZON"] <= 120:
+                            raise ValueError("RAIN_HORIZON must be 0-120 hours")
+                    engine.load([default_profile(new["TEMP_THRESHOLD"], new["SOIL_DRY_THRESHOLD"],
+                                                 new["PUMP_TIME"])])
+                    horizon_changed = new["RAIN_HORIZON"] != settings["RAIN_HORIZON"]
+                    settings.update(new)
+            except (ValueError, TypeError, AttributeError) as e:
+                self._json(400)
+                self.wfile.write(json.dumps(f"bad settings: {e}").encode())
+                return
+            if horizon_changed:
+                threading.Thread(target=fetch_and_update_weather, daemon=True).start()
             self._json()
             self.wfile.write(b'"OK"')
             return
 
+        if self.path == "/profiles":
+            # {"profiles": [spec, ...], "zones": {zone: {"profile", "planted", "probe", "lat", "lon"}}, "remove": [name]}
+            ln = int(self.headers.get("Content-Length", 0))
+            try:
+                data = json.loads(self.rfile.read(ln).decode() or "{}")
+                specs = data.get("profiles", [])
+                remove = set(data.get("remove", []))
+                zones = dict(zone_profiles, **data.get("zones", {}))
+                known = (set(engine.profiles) - remove) | {p.get("name") for p in specs}
+                unknown = {z: c.get("profile") for z, c in zones.items() if c.get("profile", "default") not in known}
+                if "default" in remove:
+                    raise RuleError("the default profile cannot be removed")
+                if any(p.get("name") == "default" for p in specs):
+                    raise RuleError("the default profile is built from /settings; post a profile with another name")
+                if unknown:
+                    raise RuleError(f"zones with an unknown profile: {unknown}")
+                channels = set(SOIL_PROBES) if soil_probes else set()
+                bad = {z: c["probe"] for z, c in zones.items() if "probe" in c and c["probe"] not in channels}
+                if bad:
+                    raise RuleError(f"zones with an unknown soil probe: {bad} (ADC channels: {sorted(channels)})")
+                for z, c in zones.items():
+                    parse_time(c.get("planted"))
+                    check_zone_location(z, c)
+                # compiled off to the side, then swapped in with one assignment
+                engine.load(specs, remove=remove)
+            except (ValueError, TypeError, AttributeError, RecursionError) as e:
+                self._json(400)
+                self.wfile.write(json.dumps(f"bad profiles: {e}").encode())
+                return
+            zone_profiles = zones
+            save_profiles()
+            decision_wake.set()
+            self._json()
+            self.wfile.write(json.dumps({"profiles": sorted(engine.profiles), "zones": zone_profiles}).encode())
+            return
+
+        if self.path in ("/schedule", "/schedule/zone"):
+            ln = int(self.headers.get("Content-Length", 0))
+            try:
+                data = json.loads(self.rfile.read(ln).decode() or "{}")
+                if self.path == "/schedule/zone":
+                    scheduler.set_zone(data["zone"], data.get("windows"), data.get("min_interval", 0))
+                    out = "OK"
+                elif "cancel" in data:
+                    out = {"cancelled": scheduler.cancel(int(data["cancel"]))}
+                else:
+                    # one job, or {"jobs": [...]}; "at" (unix or ISO) or "in" (seconds from now)
+                    specs = []
+                    for j in data.get("jobs", [data]):
+                        due = parse_time(str(j.get("at", "")))
+                        if due is None and "in" in j:
+                            due = time.time() + float(j["in"])
+                        specs.append({"zone": j.get("zone", ZONE), "seconds": int(j.get("seconds", PUMP_TIME)),
+                                      "due": due, "every": j.get("every"), "kind": "scheduled"})
+                    out = {"ids": scheduler.add_many(specs)}
+            except (ValueError, KeyError, TypeError) as e:
+                self._json(400)
+                self.wfile.write(json.dumps(f"bad schedule request: {e}").encode())
+                return
+            self._json()
+            self.wfile.write(json.dumps(out).encode())
+            return
+
         self.send_response(404)
         self.end_headers()
 
+def parse_time(v):
+    """Unix seconds or an ISO date/datetime (local time) -> unix seconds; '' -> None."""
+    if not v:
+        return None
+    try:
+        return float(v)
+    except ValueError:
+        return datetime.fromisoformat(v).timestamp()
+
 # Helper for immediate weather update
 def fetch_and_update_weather():
     global weather
-    cur = fetch_current_weather()
-    fc = fetch_forecast_3h()
+    cur, fc = fetch_weather()
+    if cur is None and fc is None:
+        alerts.event("weather_unavailable", f"Weather data unavailable for {LOCATION or CITY}; rain veto is off")
+    else:
+        alerts.clear("weather_unavailable")
     with lock:
         if cur:
             desc = cur.get("weather", [{}])[0].get("description")
             weather["summary"] = desc
             weather["description"] = cur.get("weather", [{}])[0].get("main")
             weather["temp"] = cur.get("main", {}).get("temp")
-            weather["rain"] = ("rain" in (desc or "").lower() or "shower" in (desc or "").lower() or "drizzle" in (desc or "").lower() or "thunder" in (desc or "").lower())
+            weather["rain"] = is_rain_description(desc)
         else:
             weather["summary"] = None
             weather["rain"] = False
-        rain_24, rain_times = analyze_forecast_for_24h(fc)
+        rain_24, rain_times = analyze_forecast_for_24h(fc, settings["RAIN_HORIZON"])
         weather["rain_next_24h"] = rain_24
         weather["rain_times"] = rain_times
 
+    # zones with their own lat/lon take the rain flag from their cell; zones in
+    # the same cell share one fetch. A cell with no data falls back to the farm's flag.
+    zone_rain = {}
+    for zone, c in zone_profiles.items():
+        if "lat" not in c:
+            continue
+        data = weather_cells.get(c["lat"], c["lon"])
+        if data:
+            zcur, zfc = data
+            desc = zcur.get("weather", [{}])[0].get("description") if zcur else None
+            zone_rain[zone] = (is_rain_description(desc) or
+                               analyze_forecast_for_24h(zfc, settings["RAIN_HORIZON"])[0])
+    with lock:
+        weather["zone_rain"] = zone_rain
+
 # ------------ MAIN ------------
 def main():
-    threading.Thread(target=sensor_loop, daemon=True).start()
-    threading.Thread(target=weather_loop, daemon=True).start()
-    threading.Thread(target=auto_loop, daemon=True).start()
-
-    # start webserver
-    server = HTTPServer(("0.0.0.0", PORT), Handler)
+    global pump_busy_until
+    if sensor_proc:
+        sensor_proc.start()    # fork before any thread is running
+    for run in journal.reconcile():
+        print(f"{'Pump' if run['closed'] else 'Unfinished pump'} run from "
+              f"{datetime.fromtimestamp(run['started'])} ({run['seconds']}s)",
+              "may still be running" if run["still_running"] else "reconciled")
+        if run["still_running"]:
+            pump_busy_until = max(pump_busy_until, run["started"] + run["seconds"])
+    scheduler.hold(pump_busy_until + ZONE_STAGGER)    # persisted jobs wait for it too
+    journal.start()
+    alerts.start()
+    if governor:
+        governor.start()
+    try:
+        load_profiles()
+    except (ValueError, OSError) as e:
+        print("Could not load crop profiles:", e)
+    for zone, rules in ZONES.items():
+        scheduler.set_zone(zone, rules.get("windows"), rules.get("min_interval", 0))
+    if ZONE not in scheduler.zones:
+        scheduler.set_zone(ZONE, None, COOLDOWN)    # same pause after a run as before the scheduler
+    scheduler.start()
+    if pump_link:
+        pump_link.start()
+    if soil_probes:
+        soil_probes.start()
+    if soil_edge:
+        soil_edge.start()
+    threading.Thread(target=sensor_loop, name="sensor_loop", daemon=True).start()
+    threading.Thread(target=weather_loop, name="weather_loop", daemon=True).start()
+    threading.Thread(target=auto_loop, name="auto_loop", daemon=True).start()
+
+    history.start()
+
+    # start webserver (threaded, so a long /export does not stall the dashboard)
+    server = ThreadingHTTPServer(("0.0.0.0", PORT), Handler)
     print(f"Smart Irrigation System running on port {PORT}")
     print(f"Open http://localhost:{PORT} in your browser")
     try:
@@ -5,9 +5,19 @@
 #define WIFI_PASSWORD ""
 
 #define RELAY_PIN D1          // Relay connected to D1 (GPIO5)
-#define SERVER_PORT 5001      // Port ESP listens on
+#define SERVER_PORT 5001      // Port ESP listens on (HTTP /water, fallback)
+#define LINK_PORT 5002        // Persistent control channel from the Pi (see pumplink.py)
+#define MAX_SECONDS 20
+#define STATE_EVERY_MS 5000   // unsolicited state push interval
 
 ESP8266WebServer server(SERVER_PORT);
+WiFiServer linkServer(LINK_PORT);
+WiFiClient link;
+String linkBuf;
+
+unsigned long relayOffAt = 0; // millis() when the relay switches off, 0 = off
+bool relayOn = false;
+unsigned long lastStatePush = 0;
 
 // Connect to WiFi
 void connectWiFi() {
@@ -26,7 +36,104 @@ void connectWiFi() {
   Serial.println(WiFi.localIP());   // RPi will talk to this IP
 }
 
-// Trigger Water Pump Handler
+// ----- Relay (non-blocking: loop() switches it off when the time is up) -----
+
+void relayStart(int secs) {
+  digitalWrite(RELAY_PIN, LOW);   // Relay ON
+  relayOn = true;
+  relayOffAt = millis() + (unsigned long)secs * 1000;
+}
+
+void relayStop() {
+  digitalWrite(RELAY_PIN, HIGH);  // Relay OFF
+  relayOn = false;
+  relayOffAt = 0;
+}
+
+// ----- Control channel: newline-delimited JSON over TCP -----
+
+void linkSend(const String &msg) {
+  if (link && link.connected()) {
+    link.print(msg);
+    link.print("\n");
+  }
+}
+
+void sendState() {
+  long remaining = relayOn ? (long)(relayOffAt - millis()) : 0;
+  linkSend("{\"type\":\"state\",\"relay\":" + String(relayOn ? 1 : 0) +
+           ",\"remaining\":" + String(remaining / 1000.0, 1) +
+           ",\"rssi\":" + String(WiFi.RSSI()) +
+           ",\"uptime\":" + String(millis() / 1000) + "}");
+  lastStatePush = millis();
+}
+
+// value of "key": in a flat JSON object (numbers and simple strings only)
+String jsonField(const String &msg, const String &key) {
+  int i = msg.indexOf("\"" + key + "\":");
+  if (i < 0) return "";
+  i += key.length() + 3;
+  if (msg[i] == '"') {
+    int j = msg.indexOf('"', i + 1);
+    return msg.substring(i + 1, j);
+  }
+  int j = i;
+  while (j < (int)msg.length() && msg[j] != ',' && msg[j] != '}') j++;
+  return msg.substring(i, j);
+}
+
+void handleLinkMessage(const String &msg) {
+  String id = jsonField(msg, "id");
+  String cmd = jsonField(msg, "cmd");
+  if (id.length() == 0) id = "0";
+
+  if (cmd == "water") {
+    int secs = jsonField(msg, "seconds").toInt();
+    if (secs <= 0 || secs > MAX_SECONDS) {
+      linkSend("{\"ack\":" + id + ",\"ok\":false,\"error\":\"invalid seconds\"}");
+      return;
+    }
+    Serial.printf("💧 Pump TRIGGERED by Raspberry Pi (link) → %d seconds\n", secs);
+    relayStart(secs);
+    linkSend("{\"ack\":" + id + ",\"ok\":true,\"relay\":1}");
+    sendState();
+  } else if (cmd == "stop") {
+    relayStop();
+    linkSend("{\"ack\":" + id + ",\"ok\":true,\"relay\":0}");
+    sendState();
+  } else if (cmd == "ping") {
+    linkSend("{\"ack\":" + id + ",\"ok\":true,\"relay\":" + String(relayOn ? 1 : 0) + "}");
+  } else {
+    linkSend("{\"ack\":" + id + ",\"ok\":false,\"error\":\"unknown command\"}");
+  }
+}
+
+void serviceLink() {
+  // a new connection from the Pi replaces the old one (e.g. after a Pi reboot)
+  WiFiClient incoming = linkServer.available();
+  if (incoming) {
+    if (link) link.stop();
+    link = incoming;
+    link.setNoDelay(true);
+    linkBuf = "";
+    Serial.println("Control link connected");
+    sendState();
+  }
+  if (!link || !link.connected()) return;
+
+  while (link.available()) {
+    char c = link.read();
+    if (c == '\n') {
+      if (linkBuf.length()) handleLinkMessage(linkBuf);
+      linkBuf = "";
+    } else if (linkBuf.length() < 256) {
+      linkBuf += c;
+    }
+  }
+  if (millis() - lastStatePush >= STATE_EVERY_MS) sendState();
+}
+
+// Trigger Water Pump Handler (HTTP fallback)
 void handleWater() {
   if (!server.hasArg("seconds")) {
     server.send(400, "application/json", "{\"error\":\"missing seconds parameter\"}");
@@ -34,7 +141,7 @@ void handleWater() {
   }
 
   int secs = server.arg("seconds").toInt();
-  if (secs <= 0 || secs > 20) {
+  if (secs <= 0 || secs > MAX_SECONDS) {
     server.send(400, "application/json", "{\"error\":\"invalid seconds\"}");
     return;
   }
@@ -42,9 +149,8 @@ void handleWater() {
   // ----- PRINT STATEMENT FOR RASPBERRY PI TRIGGER -----
   Serial.printf("💧 Pump TRIGGERED by Raspberry Pi → %d seconds\n", secs);
 
-  digitalWrite(RELAY_PIN, LOW);   // Relay ON
-  delay(secs * 1000);
-  digitalWrite(RELAY_PIN, HIGH);  // Relay OFF
+  relayStart(secs);
+  sendState();
 
   server.send(200, "application/json",
               "{\"status\":\"ok\",\"pump_seconds\":" + String(secs) + "}");
@@ -64,11 +170,20 @@ void setup() {
 
   server.on("/water", handleWater);
   server.begin();
+  linkServer.begin();
+  linkServer.setNoDelay(true);
 
-  Serial.printf("Server running on port %d\n", SERVER_PORT);
+  Serial.printf("Server running on port %d, control link on port %d\n", SERVER_PORT, LINK_PORT);
 }
 
 // Loop
 void loop() {
   server.handleClient();   // Handle /water requests
-}
\ No newline at end of file
+  serviceLink();           // Handle control channel commands
+
+  if (relayOn && (long)(millis() - relayOffAt) >= 0) {
+    relayStop();
+    Serial.println("Pump OFF");
+    sendState();
+  }
+}
@@ -0,0 +1,88 @@
+# on-demand profiling and memory snapshots for the running agent
+# nothing here runs until a /debug endpoint is called: the sampler thread only
+# exists for the requested number of seconds, and tracemalloc is only started
+# by the first /debug/memory call (and can be stopped again)
+
+import sys
+import time
+import threading
+import tracemalloc
+from collections import Counter
+
+SAMPLE_INTERVAL = 0.01     # seconds between stack samples (~100 Hz)
+MAX_PROFILE_SECONDS = 60
+MAX_STACK_DEPTH = 64
+TOP_N = 25
+
+_profile_lock = threading.Lock()     # one profile at a time
+_memory_lock = threading.Lock()
+_last_snapshot = None
+
+
+def _stack(frame, thread_name):
+    parts = []
+    while frame is not None and len(parts) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        parts.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{code.co_firstlineno})")
+        frame = frame.f_back
+    parts.append(thread_name)
+    return ";".join(reversed(parts))
+
+def profile(seconds, interval=SAMPLE_INTERVAL):
+    """Sample every thread's stack for `seconds` and return collapsed stacks.
+
+    Output is one "thread;outer;...;inner count" line per distinct stack, the
+    format flamegraph.pl and speedscope read. Returns None if a profile is
+    already running.
+    """
+    seconds = max(0.1, min(float(seconds), MAX_PROFILE_SECONDS))
+    if not _profile_lock.acquire(blocking=False):
+        return None
+    try:
+        me = threading.get_ident()
+        counts = Counter()
+        end = time.monotonic() + seconds
+        while time.monotonic() < end:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident != me:
+                    counts[_stack(frame, names.get(ident, f"thread-{ident}"))] += 1
+            time.sleep(interval)
+        return "".join(f"{stack} {n}\n" for stack, n in counts.most_common())
+    finally:
+        _profile_lock.release()
+
+def memory(stop=False, limit=TOP_N):
+    """Top allocators and the change since the previous call, as a dict.
+
+    The first call starts tracemalloc, so it can only report allocations made
+    after it. stop=True stops tracing and drops the saved snapshot.
+    """
+    global _last_snapshot
+    with _memory_lock:
+        if stop:
+            tracemalloc.stop()
+            _last_snapshot = None
+            return {"tracing": False}
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start(10)
+        snap = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+        current, peak = tracemalloc.get_traced_memory()
+        out = {
+            "tracing": True,
+            "just_started": started,
+            "traced_bytes": current,
+            "peak_bytes": peak,
+            "top": [{"where": str(s.traceback[0]), "bytes": s.size, "count": s.count}
+                    for s in snap.statistics("lineno")[:limit]],
+            "diff": [],
+        }
+        if _last_snapshot is not None:
+            out["diff"] = [{"where": str(d.traceback[0]), "bytes": d.size_diff, "count": d.count_diff}
+                           for d in snap.compare_to(_last_snapshot, "lineno")[:limit]]
+        _last_snapshot = snap
+        return out
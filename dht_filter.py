@@ -0,0 +1,216 @@
+# streaming statistics and outlier rejection for DHT readings
+# every good DHT sample goes through a per-channel filter before it reaches
+# `latest`, so one spurious spike can no longer push the temperature over
+# TEMP_THRESHOLD and start the pump. Per sample, over a rolling window:
+#   - mean and variance from running sums                          O(1)
+#   - median from a sorted copy of the window                       O(1) read
+#     kept by bisect: O(log n) to find the slot, but the list insert and
+#     delete shift O(n) entries (a memmove of a few dozen pointers at WINDOW = 15)
+#   - MAD (median absolute deviation) as the k-th smallest of two
+#     sorted sequences read off that sorted window                  O(log n)
+#   - EWMA of the accepted values                                   O(1)
+# Hampel rule: a sample further than K * 1.4826 * MAD from the median is an
+# outlier and is replaced by the median. Outliers still enter the window, so a
+# real step change is accepted once it fills half of it.
+#
+#   python3 dht_filter.py --bench        (per-sample cost)
+#   python3 dht_filter.py --replay       (false pump triggers on a noisy replayed season)
+
+import time
+import random
+import bisect
+import argparse
+from collections import deque
+
+WINDOW = 15                # samples (30 s at SENSOR_POLL = 2)
+K = 3.0                    # Hampel threshold in robust standard deviations
+MIN_SAMPLES = 5            # no rejection until the window has this many samples
+EWMA_ALPHA = 0.2
+MAD_TO_SIGMA = 1.4826      # MAD of a normal distribution -> its standard deviation
+
+# DHT11 reports whole degrees / percent and often sits on one value, so the MAD
+# is frequently 0; the floor keeps normal 1-2 step changes from being rejected
+CHANNELS = {
+    "temperature": {"window": WINDOW, "k": K, "mad_floor": 1.0},
+    "humidity": {"window": WINDOW, "k": K, "mad_floor": 3.0},
+}
+
+_INF = float("inf")
+
+
+def _kth_of_two(a, na, b, nb, k):
+    """k-th smallest (0-based) of two ascending sequences given as index functions."""
+    lo, hi = max(0, k + 1 - nb), min(k + 1, na)
+    while True:
+        i = (lo + hi) // 2          # taken from a
+        j = k + 1 - i               # taken from b
+        if i < na and j > 0 and b(j - 1) > a(i):
+            lo = i + 1
+        elif i > 0 and j < nb and a(i - 1) > b(j):
+            hi = i - 1
+        else:
+            return max(a(i - 1) if i > 0 else -_INF, b(j - 1) if j > 0 else -_INF)
+
+
+class StreamFilter:
+    """Rolling statistics and Hampel outlier rejection for one channel."""
+
+    def __init__(self, window=WINDOW, k=K, mad_floor=0.0, alpha=EWMA_ALPHA, min_samples=MIN_SAMPLES):
+        self.window = window
+        self.k = k
+        self.mad_floor = mad_floor
+        self.alpha = alpha
+        self.min_samples = min_samples
+        self.buf = deque()          # window in arrival order
+        self.sorted = []            # same values, ascending
+        self.sum = 0.0
+        self.sumsq = 0.0
+        self.ewma = None
+        self.raw = None
+        self.value = None
+        self.samples = 0
+        self.rejected = 0
+
+    def median(self):
+        s = self.sorted
+        n = len(s)
+        if not n:
+            return None
+        return s[n // 2] if n % 2 else (s[n // 2 - 1] + s[n // 2]) / 2
+
+    def mad(self):
+        s = self.sorted
+        n = len(s)
+        if not n:
+            return None
+        m = self.median()
+        p = bisect.bisect_left(s, m)                  # s[:p] < m <= s[p:]
+        below = lambda t: m - s[p - 1 - t]            # ascending distances below the median
+        above = lambda t: s[p + t] - m                # ascending distances above it
+        d = _kth_of_two(below, p, above, n - p, n // 2)
+        if n % 2 == 0:
+            d = (d + _kth_of_two(below, p, above, n - p, n // 2 - 1)) / 2
+        return d
+
+    def update(self, x):
+        """Add a raw sample; returns (published value, was_outlier)."""
+        self.samples += 1
+        self.raw = x
+        outlier = False
+        if len(self.buf) >= self.min_samples:
+            m = self.median()
+            limit = self.k * MAD_TO_SIGMA * max(self.mad(), self.mad_floor)
+            outlier = abs(x - m) > limit
+        if len(self.buf) == self.window:
+            old = self.buf.popleft()
+            del self.sorted[bisect.bisect_left(self.sorted, old)]
+            self.sum -= old
+            self.sumsq -= old * old
+        self.buf.append(x)
+        bisect.insort(self.sorted, x)
+        self.sum += x
+        self.sumsq += x * x
+        if outlier:
+            self.rejected += 1
+            value = m
+        else:
+            value = x
+            self.ewma = x if self.ewma is None else self.ewma + self.alpha * (x - self.ewma)
+        self.value = value
+        return value, outlier
+
+    def stats(self):
+        n = len(self.buf)
+        mean = self.sum / n if n else None
+        var = max(0.0, self.sumsq / n - mean * mean) if n else None
+        r = lambda v: None if v is None else round(v, 3)
+        return {"raw": self.raw, "value": self.value, "mean": r(mean), "std": r(var ** 0.5 if n else None),
+                "median": self.median(), "mad": self.mad(), "ewma": r(self.ewma), "window": n,
+                "samples": self.samples, "rejected": self.rejected}
+
+
+class DHTFilter:
+    """One StreamFilter per DHT channel."""
+
+    def __init__(self, channels=CHANNELS):
+        self.channels = {name: StreamFilter(**cfg) for name, cfg in channels.items()}
+
+    def update(self, temperature, humidity):
+        """Filtered (temperature, humidity) for one good reading."""
+        t, _ = self.channels["temperature"].update(temperature)
+        h, _ = self.channels["humidity"].update(humidity)
+        return t, h
+
+    def stats(self):
+        return {name: f.stats() for name, f in self.channels.items()}
+
+
+# ------------ BENCHMARK / REPLAY ------------
+
+def _bench(n):
+    rnd = random.Random(1)
+    xs = [round(27 + rnd.gauss(0, 1)) if rnd.random() > 0.01 else 60.0 for _ in range(n)]
+    for window in (15, 101, 1001):
+        f = StreamFilter(window, mad_floor=1.0)
+        t = time.perf_counter()
+        for x in xs:
+            f.update(x)
+        dt = time.perf_counter() - t
+        print(f"window {window:5d}: {dt / n * 1e6:6.2f} us/sample  ({f.rejected} of {n} rejected)")
+
+def _replay(days, spike_rate, seed, temp_th):
+    import replay
+
+    clean, rain = replay.synthetic_season(days, seed)
+    rnd = random.Random(seed + 1)
+    noisy = replay.Timeline(clean.poll)
+    filtered = replay.Timeline(clean.poll)
+    f = StreamFilter(**CHANNELS["temperature"])
+    spikes = 0
+    t_filter = 0.0
+    for a, b, temp, soil in clean.segments():
+        ts = a
+        while ts < b:              # back to one sample per minute, as synthesised
+            x = temp
+            if rnd.random() < spike_rate:
+                x = temp + rnd.choice((-1, 1)) * rnd.randint(8, 25)   # DHT11 glitch
+                spikes += 1
+            noisy.append(ts, x, soil)
+            t0 = time.perf_counter()
+            v, _ = f.update(x)
+            t_filter += time.perf_counter() - t0
+            filtered.append(ts, v, soil)
+            ts += 60
+    for tl in (noisy, filtered):
+        tl.end = clean.end
+
+    base = replay.replay(clean, rain, temp_th)["pump_runs"]
+    raw_runs = replay.replay(noisy, rain, temp_th)["pump_runs"]
+    filt_runs = replay.replay(filtered, rain, temp_th)["pump_runs"]
+    print(f"{days} days, {f.samples} samples, {spikes} injected spikes ({spike_rate * 100:g}%), "
+          f"filter {t_filter / f.samples * 1e6:.2f} us/sample, {f.rejected} rejected")
+    print(f"  pump runs clean trace:    {base}")
+    print(f"  pump runs noisy, raw:     {raw_runs}  ({raw_runs - base:+d} false triggers)")
+    print(f"  pump runs noisy, Hampel:  {filt_runs}  ({filt_runs - base:+d})")
+    return base, raw_runs, filt_runs
+
+def main():
+    ap = argparse.ArgumentParser(description="DHT streaming filter")
+    ap.add_argument("--bench", action="store_true", help="per-sample cost")
+    ap.add_argument("--replay", action="store_true", help="false triggers on a noisy replayed season")
+    ap.add_argument("-n", type=int, default=200000)
+    ap.add_argument("--days", type=int, default=90)
+    ap.add_argument("--spike-rate", type=float, default=0.01)
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--temp", type=float, default=35.0,
+                    help="TEMP_THRESHOLD; above the usual afternoon peak, so spikes are what crosses it")
+    args = ap.parse_args()
+    if args.bench:
+        _bench(args.n)
+    if args.replay:
+        _replay(args.days, args.spike_rate, args.seed, args.temp)
+    if not (args.bench or args.replay):
+        ap.print_help()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+# forecasts shared between nearby farms
+# a farm location (lat, lon) is bucketed into a geohash cell; one upstream
+# fetch per cell is cached for WEATHER_TTL and reused by every farm in it, so
+# outbound API calls grow with the number of cells, not the number of farms
+#
+#   python3 geoweather.py --farms 5000      (call-count simulation, no network)
+
+import time
+import random
+import argparse
+import threading
+
+CELL_PRECISION = 4        # geohash length: 4 -> cells of about 39 x 20 km
+WEATHER_TTL = 300         # seconds a cell forecast is reused (matches WEATHER_POLL)
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+# ------------ GEOHASH ------------
+
+def encode(lat, lon, precision=CELL_PRECISION):
+    """Geohash of a point."""
+    lat_lo, lat_hi, lon_lo, lon_hi = -90.0, 90.0, -180.0, 180.0
+    out = []
+    bits = 0
+    ch = 0
+    even = True
+    while len(out) < precision:
+        if even:
+            mid = (lon_lo + lon_hi) / 2
+            if lon >= mid:
+                ch = ch * 2 + 1
+                lon_lo = mid
+            else:
+                ch = ch * 2
+                lon_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                ch = ch * 2 + 1
+                lat_lo = mid
+            else:
+                ch = ch * 2
+                lat_hi = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            out.append(_BASE32[ch])
+            bits = ch = 0
+    return "".join(out)
+
+def bounds(cell):
+    """(lat_lo, lat_hi, lon_lo, lon_hi) of a geohash cell."""
+    lat_lo, lat_hi, lon_lo, lon_hi = -90.0, 90.0, -180.0, 180.0
+    even = True
+    for c in cell:
+        v = _BASE32.index(c)
+        for shift in range(4, -1, -1):
+            bit = (v >> shift) & 1
+            if even:
+                mid = (lon_lo + lon_hi) / 2
+                if bit:
+                    lon_lo = mid
+                else:
+                    lon_hi = mid
+            else:
+                mid = (lat_lo + lat_hi) / 2
+                if bit:
+                    lat_lo = mid
+                else:
+                    lat_hi = mid
+            even = not even
+    return lat_lo, lat_hi, lon_lo, lon_hi
+
+def center(cell):
+    lat_lo, lat_hi, lon_lo, lon_hi = bounds(cell)
+    return (lat_lo + lat_hi) / 2, (lon_lo + lon_hi) / 2
+
+
+# ------------ CELL CACHE ------------
+
+class CellCache:
+    """Per-cell cache in front of an upstream fetch(lat, lon) -> data.
+
+    fetch is called with the cell centre, at most once per cell per ttl; farms
+    asking for the same cell while a fetch is in flight wait for it instead of
+    fetching again. A failed fetch (None) keeps serving the previous data.
+    """
+
+    def __init__(self, fetch, ttl=WEATHER_TTL, precision=CELL_PRECISION, clock=time.time):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.precision = precision
+        self.clock = clock
+        self.cells = {}           # cell -> (fetched_at, data)
+        self.locks = {}
+        self.lock = threading.Lock()
+        self.calls = 0
+
+    def cell_of(self, lat, lon):
+        return encode(lat, lon, self.precision)
+
+    def get(self, lat, lon):
+        """Data for the cell containing (lat, lon)."""
+        return self.get_cell(self.cell_of(lat, lon))
+
+    def get_cell(self, cell):
+        now = self.clock()
+        with self.lock:
+            hit = self.cells.get(cell)
+            if hit and now - hit[0] < self.ttl:
+                return hit[1]
+            cell_lock = self.locks.setdefault(cell, threading.Lock())
+        with cell_lock:
+            with self.lock:
+                hit = self.cells.get(cell)
+                if hit and self.clock() - hit[0] < self.ttl:
+                    return hit[1]      # fetched by another farm while we waited
+                self.calls += 1
+            data = self.fetch(*center(cell))
+            with self.lock:
+                if data is not None or not hit:
+                    self.cells[cell] = (self.clock(), data)
+                    return data
+                return hit[1]
+
+
+# ------------ SIMULATION ------------
+
+def simulate(farms=5000, hours=24, poll=WEATHER_TTL, seed=1, precision=CELL_PRECISION):
+    """Count upstream calls for per-farm fetching vs shared cells over `hours`."""
+    rnd = random.Random(seed)
+    # farms clustered around a handful of agricultural districts
+    hubs = [(12.97, 77.59), (13.34, 77.10), (12.30, 76.64), (15.36, 75.12), (14.47, 75.92)]
+    locs = []
+    for _ in range(farms):
+        lat, lon = rnd.choice(hubs)
+        locs.append((lat + rnd.gauss(0, 0.15), lon + rnd.gauss(0, 0.15)))
+
+    now = [0.0]
+    cache = CellCache(lambda lat, lon: {"temp": 25.0}, ttl=poll, precision=precision,
+                      clock=lambda: now[0])
+    cells = [cache.cell_of(lat, lon) for lat, lon in locs]   # a farm's cell never changes
+    rounds = int(hours * 3600 // poll)
+    for k in range(rounds):
+        now[0] = k * poll
+        for cell in cells:
+            cache.get_cell(cell)
+    return {
+        "farms": farms,
+        "cells": len(cache.cells),
+        "per_farm_calls": farms * rounds,
+        "shared_calls": cache.calls,
+        "reduction": round(farms * rounds / max(cache.calls, 1), 1),
+    }
+
+def main():
+    ap = argparse.ArgumentParser(description="Simulate shared forecast fetching")
+    ap.add_argument("--farms", type=int, default=5000)
+    ap.add_argument("--hours", type=float, default=24)
+    ap.add_argument("--precision", type=int, default=CELL_PRECISION)
+    args = ap.parse_args()
+    t0 = time.perf_counter()
+    res = simulate(args.farms, args.hours, precision=args.precision)
+    for k, v in res.items():
+        print(f"  {k}: {v}")
+    print(f"simulated in {time.perf_counter() - t0:.1f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+# load governor: keeps a constrained Pi responsive for the work that matters
+# every GOVERNOR_POLL seconds it reads CPU use, load, SoC temperature, memory,
+# the firmware throttling flags and battery state from /proc and /sys, and
+# maps them to a pressure level:
+#   0 normal       everything at its configured rate
+#   1 constrained  non-critical intervals x2, dashboard polling rate-limited
+#   2 degraded     non-critical intervals x4, polling throttled hard, heavy requests refused
+# CPU use is smoothed (EWMA) so a burst of a few seconds (an export, a profile)
+# does not count; the level rises once RAISE_SAMPLES reads in a row call for it
+# and drops one step at a time after RECOVER_HOLD seconds below it, so it does
+# not flap. Only the governor thread reads the signals. Loops that take
+# interval() (weather polling, history commits) sleep longer under pressure. Sensor
+# acquisition, auto_loop, the scheduler, the pump journal and every pump/settings
+# request are never stretched or shed; shed requests get 503 with Retry-After.
+#
+#   python3 governor.py --watch          (live signals and level on this machine)
+#   python3 governor.py --simulate       (scripted heat/memory/battery episode, simulated clock)
+
+import os
+import glob
+import time
+import argparse
+import threading
+
+from alerts import TokenBucket
+
+GOVERNOR_POLL = 5          # seconds between signal reads
+RAISE_SAMPLES = 2          # consecutive reads above a limit before the level rises
+RECOVER_HOLD = 60          # seconds below the limits before stepping a level down
+CPU_ALPHA = 0.3            # EWMA weight of each CPU read (~15 s time constant at GOVERNOR_POLL)
+STRETCH = {0: 1, 1: 2, 2: 4}
+
+# signal -> (constrained, degraded); for mem_free and battery lower is worse
+LIMITS = {
+    "cpu": (0.85, 0.97),           # busy fraction, smoothed
+    "load": (1.5, 3.0),            # 1-minute load average per core
+    "temp": (70.0, 80.0),          # SoC C (the Pi firmware throttles from 80-85)
+    "mem_free": (0.15, 0.07),      # MemAvailable / MemTotal
+    "battery": (30.0, 15.0),       # %, only while discharging
+}
+LOWER_IS_WORSE = ("mem_free", "battery")
+
+# request kind -> per level: None = always served, (count, per) = token bucket, 0 = refused
+SHED = {
+    "control": {0: None, 1: None, 2: None},
+    "poll": {0: None, 1: (4, 4), 2: (2, 10)},
+    "heavy": {0: None, 1: None, 2: 0},
+}
+RETRY_AFTER = {"poll": 5, "heavy": 60}     # seconds, multiplied by the stretch for polls
+
+
+# ------------ SIGNALS ------------
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+class ProcSignals:
+    """Reads the pressure signals from /proc and /sys; missing ones are None."""
+
+    def __init__(self, root=""):
+        self.root = root                # prefix for tests against a fake tree
+        self.prev_cpu = None
+
+    def _cpu(self):
+        line = _read(self.root + "/proc/stat")
+        if not line:
+            return None
+        vals = [int(v) for v in line.split("\n", 1)[0].split()[1:]]
+        idle = vals[3] + (vals[4] if len(vals) > 4 else 0)        # idle + iowait
+        total = sum(vals[:8])
+        prev, self.prev_cpu = self.prev_cpu, (idle, total)
+        if prev is None or total == prev[1]:
+            return None
+        return round(1 - (idle - prev[0]) / (total - prev[1]), 3)
+
+    def read(self):
+        s = {"cpu": self._cpu(), "load": None, "temp": None, "mem_free": None,
+             "throttled": None, "on_battery": False, "battery": None}
+        la = _read(self.root + "/proc/loadavg")
+        if la:
+            s["load"] = round(float(la.split()[0]) / (os.cpu_count() or 1), 2)
+        t = _read(self.root + "/sys/class/thermal/thermal_zone0/temp")
+        if t:
+            s["temp"] = int(t) / 1000
+        mem = _read(self.root + "/proc/meminfo")
+        if mem:
+            info = {k: int(v.split()[0]) for k, v in (l.split(":", 1) for l in mem.splitlines() if ":" in l)}
+            if info.get("MemTotal") and "MemAvailable" in info:
+                s["mem_free"] = round(info["MemAvailable"] / info["MemTotal"], 3)
+        th = _read(self.root + "/sys/devices/platform/soc/soc:firmware/get_throttled")
+        if th:
+            s["throttled"] = bool(int(th, 16) & 0xF)     # under-voltage / capped / throttled now
+        for ps in glob.glob(self.root + "/sys/class/power_supply/*"):
+            if _read(ps + "/type") == "Battery":
+                s["on_battery"] = _read(ps + "/status") == "Discharging"
+                cap = _read(ps + "/capacity")
+                s["battery"] = float(cap) if cap else None
+        return s
+
+
+# ------------ GOVERNOR ------------
+
+def pressure(signals):
+    """(level, [reasons]) the signals alone call for."""
+    level = 0
+    reasons = []
+    for name, (mid, high) in LIMITS.items():
+        v = signals.get(name)
+        if v is None or (name == "battery" and not signals.get("on_battery")):
+            continue
+        worse = (lambda a, b: a < b) if name in LOWER_IS_WORSE else (lambda a, b: a > b)
+        if worse(v, high):
+            level = 2
+            reasons.append(f"{name}={v}")
+        elif worse(v, mid):
+            level = max(level, 1)
+            reasons.append(f"{name}={v}")
+    if signals.get("throttled"):
+        level = 2
+        reasons.append("throttled")
+    if signals.get("on_battery"):
+        level = max(level, 1)
+        reasons.append("on battery")
+    return level, reasons
+
+
+class Governor:
+    def __init__(self, source=None, clock=time.time):
+        self.source = source or ProcSignals().read
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.level = 0
+        self.reasons = []
+        self.signals = {}
+        self.overrides = {}             # simulated signals layered over the real ones
+        self.calm_since = None
+        self.raise_count = 0
+        self.cpu = 0.0                  # smoothed CPU use; starts idle so boot work does not count
+        self.since = clock()
+        self.buckets = {}               # kind -> TokenBucket for the current level
+        self.counts = {k: {"served": 0, "shed": 0} for k in SHED}
+        self.transitions = []           # last level changes: (ts, from, to, reasons)
+        self.time_in = {0: 0.0, 1: 0.0, 2: 0.0}
+
+    def start(self):
+        threading.Thread(target=self._run, name="governor", daemon=True).start()
+
+    def _run(self):
+        while True:
+            try:
+                self.update()
+            except Exception as e:
+                print("Governor error:", e)
+            time.sleep(GOVERNOR_POLL)
+
+    def simulate(self, **signals):
+        """Override signals (e.g. temp=82) from the next update() until clear_simulation()."""
+        with self.lock:
+            self.overrides.update(signals)
+
+    def clear_simulation(self):
+        with self.lock:
+            self.overrides = {}
+
+    def update(self, now=None):
+        """Read the signals and move the level; called by the governor thread only."""
+        now = self.clock() if now is None else now
+        real = self.source()
+        with self.lock:
+            if real.get("cpu") is not None:
+                self.cpu += CPU_ALPHA * (real["cpu"] - self.cpu)
+                real = dict(real, cpu=round(self.cpu, 3), cpu_now=real["cpu"])
+            signals = dict(real, **self.overrides)
+            wanted, reasons = pressure(signals)
+            self.signals = signals
+            level = self.level
+            if wanted > level:
+                self.raise_count += 1
+                if self.raise_count >= RAISE_SAMPLES:
+                    level = wanted
+                    self.raise_count = 0
+                self.calm_since = None
+                wanted = level
+            else:
+                self.raise_count = 0
+            if wanted < level:
+                if self.calm_since is None:
+                    self.calm_since = now
+                elif now - self.calm_since >= RECOVER_HOLD:
+                    level -= 1                      # recover one step at a time
+                    self.calm_since = now
+            else:
+                self.calm_since = None
+            if level != self.level:
+                self._set_level(level, now, reasons)
+            self.reasons = reasons
+        return self.level
+
+    def _set_level(self, level, now, reasons):
+        self.time_in[self.level] += now - self.since
+        self.transitions = (self.transitions + [(round(now, 1), self.level, level, reasons)])[-20:]
+        print(f"Governor: level {self.level} -> {level}", f"({', '.join(reasons)})" if reasons else "")
+        self.level = level
+        self.since = now
+        self.buckets = {}
+
+    # ---- used by the loops and the HTTP handler ----
+
+    def interval(self, base, critical=False):
+        """Sleep for a loop: stretched under pressure unless critical."""
+        return base if critical else base * STRETCH[self.level]
+
+    def admit(self, kind, now=None):
+        """(served?, Retry-After seconds) for a request of `kind` (see SHED)."""
+        now = self.clock() if now is None else now
+        with self.lock:
+            rule = SHED.get(kind, SHED["control"])[self.level]
+            ok = True
+            if rule == 0:
+                ok = False
+            elif rule is not None:
+                b = self.buckets.get(kind)
+                if b is None:
+                    b = self.buckets[kind] = TokenBucket(*rule, now)
+                ok = b.take(now)
+            self.counts.setdefault(kind, {"served": 0, "shed": 0})["served" if ok else "shed"] += 1
+            if ok:
+                return True, 0
+            return False, RETRY_AFTER.get(kind, 10) * (STRETCH[self.level] if kind == "poll" else 1)
+
+    def metrics(self, now=None):
+        now = self.clock() if now is None else now
+        with self.lock:
+            time_in = dict(self.time_in)
+            time_in[self.level] += now - self.since
+            return {"level": self.level, "reasons": self.reasons, "signals": self.signals,
+                    "simulated": dict(self.overrides), "stretch": STRETCH[self.level],
+                    "requests": {k: dict(v) for k, v in self.counts.items()},
+                    "seconds_in_level": {k: round(v) for k, v in time_in.items()},
+                    "transitions": self.transitions}
+
+
+# ------------ SIMULATION ------------
+
+def simulate(dashboards=3):
+    """Heat, memory and battery episode on a simulated clock; dashboards honour Retry-After."""
+    now = [0.0]
+    g = Governor(source=lambda: {"cpu": 0.3, "load": 0.5, "temp": 55.0, "mem_free": 0.5,
+                                 "throttled": False, "on_battery": False, "battery": None},
+                 clock=lambda: now[0])
+    phases = [                       # (label, minutes, simulated signals)
+        ("normal", 10, {}),
+        ("hot afternoon", 10, {"temp": 74.0, "cpu": 0.7}),
+        ("thermal throttle", 10, {"temp": 83.0, "throttled": True}),
+        ("cooling", 5, {"temp": 66.0}),
+        ("low memory", 10, {"mem_free": 0.05}),
+        ("hotspot on battery", 10, {"on_battery": True, "battery": 40.0}),
+        ("recovered", 10, {}),
+    ]
+    weather_poll = 300
+    print(f"{dashboards} dashboards polling 2 endpoints every 2 s; weather every {weather_poll} s at level 0")
+    print(f"{'phase':<20}{'level':>6}{'weather s':>11}{'offered':>9}{'served':>8}{'shed':>6}")
+    for label, minutes, sig in phases:
+        g.clear_simulation()
+        g.simulate(**sig)
+        next_poll = [0.0] * dashboards
+        offered = served = shed = 0
+        levels = set()
+        end = now[0] + minutes * 60
+        next_gov = now[0]
+        while now[0] < end:
+            if now[0] >= next_gov:
+                levels.add(g.update())
+                next_gov += GOVERNOR_POLL
+            for d in range(dashboards):
+                if now[0] >= next_poll[d]:
+                    wait = 2
+                    for _ in range(2):
+                        offered += 1
+                        ok, retry = g.admit("poll")
+                        if ok:
+                            served += 1
+                        else:
+                            shed += 1
+                            wait = retry
+                            break
+                    next_poll[d] = now[0] + wait
+            now[0] += 0.5
+        lv = "/".join(str(l) for l in sorted(levels))
+        print(f"{label:<20}{lv:>6}{g.interval(weather_poll):>11}{offered:>9}{served:>8}{shed:>6}")
+    m = g.metrics()
+    print("transitions:")
+    for ts, a, b, why in m["transitions"]:
+        print(f"  t={ts / 60:5.1f} min  {a} -> {b}  {', '.join(why)}")
+    print("minutes in level:", {k: round(v / 60, 1) for k, v in m["seconds_in_level"].items()})
+
+def main():
+    ap = argparse.ArgumentParser(description="Adaptive load governor")
+    ap.add_argument("--watch", action="store_true", help="print live signals and level")
+    ap.add_argument("--simulate", action="store_true", help="scripted episode on a simulated clock")
+    ap.add_argument("--dashboards", type=int, default=3)
+    args = ap.parse_args()
+    if args.simulate:
+        simulate(args.dashboards)
+    elif args.watch:
+        g = Governor()
+        while True:
+            g.update()
+            print(g.level, g.reasons, g.signals)
+            time.sleep(GOVERNOR_POLL)
+    else:
+        ap.print_help()
+
+if __name__ == "__main__":
+    main()
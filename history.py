@@ -0,0 +1,201 @@
+# sensor history kept on the Pi, streamed out by the /export endpoint
+# (pump runs live in the same database, see journal.py)
+# rows go into SQLite (WAL mode) from a background writer thread, so the sensor
+# loop only pays for a queue put; exports read with a separate connection in
+# fixed-size batches, so memory stays flat whatever the time range
+#
+#   python3 history.py --bench      (year of 2 s readings -> csv/ndjson/gzip export)
+
+import io
+import csv
+import sys
+import json
+import math
+import time
+import zlib
+import queue
+import sqlite3
+import argparse
+import threading
+
+DB_PATH = "history.db"
+FLUSH_INTERVAL = 5        # seconds between writer commits
+BATCH_ROWS = 2000         # rows per fetch / per output chunk
+
+TABLES = {
+    "readings": ("ts", "temperature", "humidity", "soil"),
+    "journal": ("seq", "ts", "zone", "run_id", "kind", "seconds", "ok", "data"),
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS readings (ts REAL, temperature REAL, humidity REAL, soil INTEGER);
+CREATE INDEX IF NOT EXISTS readings_ts ON readings (ts);
+"""
+
+
+def connect(path, **kw):
+    conn = sqlite3.connect(path, **kw)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class History:
+    """Append-only store of sensor readings."""
+
+    def __init__(self, path=DB_PATH, pace=None):
+        self.path = path
+        self.pace = pace            # base seconds -> seconds to wait (Governor.interval), or None
+        self.q = queue.Queue()
+        conn = connect(path)
+        conn.executescript(SCHEMA)
+        conn.close()
+
+    def start(self):
+        threading.Thread(target=self._writer, name="history_writer", daemon=True).start()
+
+    def add_reading(self, ts, temperature, humidity, soil):
+        self.q.put(("readings", (ts, temperature, humidity, soil)))
+
+    def _writer(self):
+        conn = connect(self.path)
+        while True:
+            try:
+                rows = {"readings": []}
+                deadline = time.time() + (self.pace(FLUSH_INTERVAL) if self.pace else FLUSH_INTERVAL)
+                while True:
+                    left = deadline - time.time()
+                    if left <= 0:
+                        break
+                    try:
+                        name, row = self.q.get(timeout=left)
+                    except queue.Empty:
+                        break
+                    rows[name].append(row)
+                with conn:
+                    for name, batch in rows.items():
+                        if batch:
+                            marks = ",".join("?" * len(TABLES[name]))
+                            conn.executemany(f"INSERT INTO {name} VALUES ({marks})", batch)
+            except Exception as e:
+                print("History writer error:", e)
+
+    def iter_batches(self, table, start=None, end=None, batch=BATCH_ROWS):
+        """Yield lists of row tuples from `table` with start <= ts < end, oldest first."""
+        if table not in TABLES:
+            raise ValueError(f"unknown table {table}")
+        conn = connect(self.path)
+        try:
+            cur = conn.execute(
+                f"SELECT {', '.join(TABLES[table])} FROM {table} WHERE ts >= ? AND ts < ? ORDER BY ts",
+                (start if start is not None else float("-inf"), end if end is not None else float("inf")))
+            while True:
+                rows = cur.fetchmany(batch)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            conn.close()
+
+
+# ------------ EXPORT ------------
+
+def _json_value(v):
+    if v is None:
+        return "null"
+    if isinstance(v, str):
+        return json.dumps(v)
+    if isinstance(v, float) and not math.isfinite(v):
+        return "null"           # JSON has no NaN/Infinity
+    return repr(v)
+
+def encode_csv(batches, columns):
+    """CSV bytes, one chunk per batch of rows."""
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    w.writerow(columns)
+    for rows in batches:
+        w.writerows(rows)
+        yield buf.getvalue().encode()
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode()   # empty range: just the header
+
+def encode_ndjson(batches, columns):
+    """Newline-delimited JSON bytes, one chunk per batch of rows."""
+    line = "{" + ",".join(f'"{c}":%s' for c in columns) + "}\n"
+    for rows in batches:
+        yield "".join(line % tuple(map(_json_value, r)) for r in rows).encode()
+
+ENCODERS = {
+    "csv": (encode_csv, "text/csv"),
+    "ndjson": (encode_ndjson, "application/x-ndjson"),
+}
+
+def gzip_chunks(chunks, level=6):
+    """Compress a stream of byte chunks into a single gzip member on the fly."""
+    z = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        out = z.compress(chunk)
+        if out:
+            yield out
+    yield z.flush()
+
+def export(history, table, start=None, end=None, fmt="csv", gz=False):
+    """Return (content_type, byte chunk generator) for an export."""
+    encode, ctype = ENCODERS[fmt]
+    chunks = encode(history.iter_batches(table, start, end), TABLES[table])
+    if gz:
+        chunks = gzip_chunks(chunks)
+    return ctype, chunks
+
+
+# ------------ BENCHMARK ------------
+
+def _bench(path, days):
+    import os
+    import random
+    import resource
+
+    if os.path.exists(path):
+        os.remove(path)
+    h = History(path)
+    conn = connect(path)
+    rnd = random.Random(1)
+    t0 = time.perf_counter()
+    n = int(days * 86400 / 2)
+    with conn:
+        step = 100000
+        for i in range(0, n, step):
+            conn.executemany("INSERT INTO readings VALUES (?,?,?,?)",
+                             ((1.7e9 + 2 * k, float(25 + rnd.randint(-5, 5)), float(60 + rnd.randint(-9, 9)),
+                               100 if k % 5000 < 2500 else 0) for k in range(i, min(n, i + step))))
+    conn.close()
+    print(f"Wrote {n} readings in {time.perf_counter() - t0:.1f}s ({os.path.getsize(path) / 1e6:.0f} MB)")
+
+    for fmt, gz in (("csv", False), ("ndjson", False), ("csv", True)):
+        rss0 = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        t0 = time.perf_counter()
+        size = 0
+        _, chunks = export(h, "readings", fmt=fmt, gz=gz)
+        for c in chunks:
+            size += len(c)
+        dt = time.perf_counter() - t0
+        rss1 = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        print(f"{fmt}{'+gzip' if gz else ''}: {size / 1e6:.0f} MB in {dt:.1f}s "
+              f"({n / dt / 1e6:.2f} M rows/s, {size / dt / 1e6:.0f} MB/s), peak RSS +{(rss1 - rss0) / 1024:.1f} MB")
+
+def main():
+    ap = argparse.ArgumentParser(description="History store tools")
+    ap.add_argument("--bench", action="store_true", help="benchmark export of synthetic data")
+    ap.add_argument("--db", default="history_bench.db")
+    ap.add_argument("--days", type=float, default=365)
+    args = ap.parse_args()
+    if args.bench:
+        _bench(args.db, args.days)
+    else:
+        ap.print_help(sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+# append-only journal of pump runs and auto-watering decisions
+# entries are queued by the control loops and written by a background thread,
+# which commits (and fsyncs, synchronous=FULL) once per batch, so the decision
+# path only pays for a queue put. The one exception is "start": it is committed
+# before the pump command goes out (write-ahead), so a reboot can never lose a
+# run the node may be executing. On startup reconcile() finds runs whose window
+# has not passed yet, e.g. because the Pi rebooted mid-run.
+#
+# entry kinds:
+#   decision    auto_loop outcome changed (water / veto / idle), data = inputs
+#   start       about to send the pump command, data = decision inputs
+#   end         node answered, ok = ESP acknowledged; the node keeps the relay
+#               on until start + seconds, so this does not mean the pump is off
+#   reconciled  start without end found at startup
+
+import json
+import time
+import uuid
+import queue
+import threading
+
+from history import connect, DB_PATH, TABLES
+
+FSYNC_INTERVAL = 0.5      # max seconds an entry waits before its batch is committed
+
+COLUMNS = TABLES["journal"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS journal (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts REAL NOT NULL,
+    zone TEXT NOT NULL,
+    run_id TEXT,
+    kind TEXT NOT NULL,
+    seconds INTEGER,
+    ok INTEGER,
+    data TEXT
+);
+CREATE INDEX IF NOT EXISTS journal_ts ON journal (ts);
+CREATE INDEX IF NOT EXISTS journal_zone_ts ON journal (zone, ts);
+CREATE INDEX IF NOT EXISTS journal_run ON journal (run_id);
+"""
+
+
+class Journal:
+    def __init__(self, path=DB_PATH):
+        self.path = path
+        self.q = queue.Queue()
+        self.last_decision = {}     # zone -> last journalled outcome
+        conn = connect(path)
+        conn.executescript(SCHEMA)
+        conn.close()
+
+    def start(self):
+        threading.Thread(target=self._writer, name="journal_writer", daemon=True).start()
+
+    def _put(self, zone, run_id, kind, seconds=None, ok=None, data=None):
+        self.q.put((time.time(), zone, run_id, kind, seconds,
+                    None if ok is None else int(bool(ok)),
+                    None if data is None else json.dumps(data)))
+
+    # ---- hot path: queue puts only ----
+
+    def decision(self, zone, outcome, inputs):
+        """Journal an auto_loop outcome, but only when it differs from the last one."""
+        if self.last_decision.get(zone) == outcome:
+            return
+        self.last_decision[zone] = outcome
+        self._put(zone, None, "decision", data=dict(inputs, outcome=outcome))
+
+    def run_started(self, zone, seconds, source, inputs=None):
+        """Commit the start entry now (not via the writer); call before sending the command."""
+        run_id = uuid.uuid4().hex
+        conn = connect(self.path)
+        conn.execute("PRAGMA synchronous=FULL")
+        try:
+            with conn:
+                conn.execute("INSERT INTO journal (ts, zone, run_id, kind, seconds, ok, data) "
+                             "VALUES (?,?,?,?,?,?,?)",
+                             (time.time(), zone, run_id, "start", seconds, None,
+                              json.dumps(dict(inputs or {}, source=source))))
+        finally:
+            conn.close()
+        return run_id
+
+    def run_finished(self, zone, run_id, seconds, ok, duration):
+        self._put(zone, run_id, "end", seconds, ok, {"duration": round(duration, 3)})
+
+    # ---- writer ----
+
+    def _writer(self):
+        conn = connect(self.path)
+        conn.execute("PRAGMA synchronous=FULL")
+        while True:
+            try:
+                batch = [self.q.get()]
+                deadline = time.time() + FSYNC_INTERVAL
+                while True:
+                    left = deadline - time.time()
+                    if left <= 0:
+                        break
+                    try:
+                        batch.append(self.q.get(timeout=left))
+                    except queue.Empty:
+                        break
+                with conn:
+                    conn.executemany("INSERT INTO journal (ts, zone, run_id, kind, seconds, ok, data) "
+                                     "VALUES (?,?,?,?,?,?,?)", batch)
+            except Exception as e:
+                print("Journal writer error:", e)
+
+    # ---- queries ----
+
+    def query(self, start=None, end=None, zone=None, kind=None, limit=1000):
+        """Entries with start <= ts < end, newest first, as dicts."""
+        sql = "SELECT " + ", ".join(COLUMNS) + " FROM journal WHERE ts >= ? AND ts < ?"
+        args = [start if start is not None else float("-inf"), end if end is not None else float("inf")]
+        if zone is not None:
+            sql += " AND zone = ?"
+            args.append(zone)
+        if kind is not None:
+            sql += " AND kind = ?"
+            args.append(kind)
+        sql += " ORDER BY ts DESC LIMIT ?"
+        args.append(int(limit))
+        conn = connect(self.path)
+        try:
+            rows = conn.execute(sql, args).fetchall()
+        finally:
+            conn.close()
+        out = []
+        for r in rows:
+            e = dict(zip(COLUMNS, r))
+            e["data"] = json.loads(e["data"]) if e["data"] else None
+            out.append(e)
+        return out
+
+    def reconcile(self, now=None):
+        """Close runs that have a start but no end; return those plus any run still in its window.
+
+        The ESP8266 times each run itself and acks at once, so an end entry
+        only says the command arrived: any run with started + seconds > now
+        may have the pump on right now, whatever was journalled after it.
+        Each returned dict has zone, run_id, started, seconds, closed and still_running.
+        """
+        now = now or time.time()
+        conn = connect(self.path)
+        conn.execute("PRAGMA synchronous=FULL")
+        try:
+            rows = conn.execute(
+                "SELECT s.zone, s.run_id, s.ts, s.seconds, EXISTS ("
+                "  SELECT 1 FROM journal e WHERE e.run_id = s.run_id AND e.kind IN ('end', 'reconciled')) "
+                "FROM journal s WHERE s.kind = 'start' AND (s.ts + COALESCE(s.seconds, 0) > ? OR NOT EXISTS ("
+                "  SELECT 1 FROM journal e WHERE e.run_id = s.run_id AND e.kind IN ('end', 'reconciled')))",
+                (now,)).fetchall()
+            out = []
+            for zone, run_id, started, seconds, closed in rows:
+                running = started + (seconds or 0) > now
+                out.append({"zone": zone, "run_id": run_id, "started": started, "seconds": seconds,
+                            "closed": bool(closed), "still_running": running})
+            with conn:
+                conn.executemany(
+                    "INSERT INTO journal (ts, zone, run_id, kind, seconds, ok, data) VALUES (?,?,?,?,?,?,?)",
+                    [(now, r["zone"], r["run_id"], "reconciled", r["seconds"], None,
+                      json.dumps({"still_running": r["still_running"]})) for r in out if not r["closed"]])
+        finally:
+            conn.close()
+        return out
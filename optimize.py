@@ -0,0 +1,134 @@
+# threshold search for the auto-watering settings, run off the Pi
+# every candidate is replayed over the same season (see replay.py) on all cores:
+#
+#   python3 optimize.py --days 365                          (synthetic season)
+#   python3 optimize.py --sensors s.csv --forecast f.csv --max-dry 200 --push raspberrypi.local:5000
+#
+# prints the Pareto front of water used vs hours of dry soil and, with --push,
+# sends the chosen candidate to the running agent's /settings.
+# SOIL_DRY_THRESHOLD is not searched: the replayed soil signal is the digital
+# sensor's 0/100, so every threshold in between behaves the same.
+
+import os
+import time
+import json
+import argparse
+import itertools
+import multiprocessing as mp
+
+import requests
+
+import replay
+
+# ---------------- DEFAULT GRID ----------------
+
+TEMP_GRID = [28.0, 29.0, 30.0, 31.0, 32.0, 33.0, 34.0, 35.0, 36.0, 38.0]
+PUMP_GRID = [2, 3, 5, 8, 10, 15, 20]     # ESP8266 accepts 1..20 s
+HORIZON_GRID = [0, 3, 6, 12, 24, 48]
+
+CHUNK = 16            # candidates per task
+
+# ----------------------------------------------
+
+# season data, set in the parent before the pool forks; workers only read it,
+# so it is shared copy-on-write instead of pickled into every task
+_timeline = None
+_vetoes = {}
+
+def _evaluate(chunk):
+    out = []
+    for temp_th, pump, horizon in chunk:
+        rep = replay.replay(_timeline, temp_th=temp_th, pump_time=pump, vetoes=_vetoes[horizon])
+        out.append(((temp_th, pump, horizon), rep["water_litres"], rep["dry_hours"]))
+    return out
+
+def pareto_front(results):
+    """Candidates not beaten on both water and dry hours, sorted by water used.
+
+    Ties are broken on the candidate itself, so the front does not depend on
+    the order the workers returned results in.
+    """
+    front = []
+    best_dry = float("inf")
+    for cand, water, dry in sorted(results, key=lambda r: (r[1], r[2], r[0])):
+        if dry < best_dry:
+            front.append((cand, water, dry))
+            best_dry = dry
+    return front
+
+def search(timeline, rain_slots, temps=TEMP_GRID, pumps=PUMP_GRID,
+           horizons=HORIZON_GRID, workers=None):
+    """Replay every grid candidate and return [(candidate, water_litres, dry_hours)]."""
+    global _timeline, _vetoes
+    _timeline = timeline
+    _vetoes = {h: replay.veto_intervals(rain_slots, h) for h in horizons}
+
+    cands = list(itertools.product(temps, pumps, horizons))
+    chunks = [cands[i:i + CHUNK] for i in range(0, len(cands), CHUNK)]
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        return [r for ch in chunks for r in _evaluate(ch)]
+    ctx = mp.get_context("fork")
+    with ctx.Pool(workers) as pool:
+        results = []
+        for part in pool.imap_unordered(_evaluate, chunks):
+            results.extend(part)
+    return results
+
+def pick(front, max_dry=None):
+    """Least water within the dry-hours budget, or the knee of the front if none is given."""
+    if max_dry is not None:
+        ok = [f for f in front if f[2] <= max_dry]
+        return ok[0] if ok else front[-1]
+    # knee: furthest point from the line joining both ends, on normalised axes
+    (_, w0, d0), (_, w1, d1) = front[0], front[-1]
+    sw = (w1 - w0) or 1
+    sd = (d0 - d1) or 1
+    return max(front, key=lambda f: (d0 - f[2]) / sd - (f[1] - w0) / sw)
+
+def push_settings(host, cand):
+    """POST the candidate to the agent's /settings (SOIL_DRY_THRESHOLD is left alone). host is 'name:port'."""
+    temp_th, pump, horizon = cand
+    data = {
+        "TEMP_THRESHOLD": temp_th,
+        "PUMP_TIME": pump,
+        "RAIN_HORIZON": horizon,
+    }
+    r = requests.post(f"http://{host}/settings", data=json.dumps(data),
+                      headers={"Content-Type": "application/json"}, timeout=5)
+    return r.status_code == 200
+
+def main():
+    ap = argparse.ArgumentParser(description="Search auto-watering thresholds")
+    ap.add_argument("--sensors", help="sensor csv (ts,temperature,humidity,soil)")
+    ap.add_argument("--forecast", help="forecast csv (ts,rain)")
+    ap.add_argument("--days", type=int, default=365, help="length of the synthetic season")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--workers", type=int, default=None)
+    ap.add_argument("--max-dry", type=float, default=None, help="dry-hours budget for the pick")
+    ap.add_argument("--push", metavar="HOST:PORT", help="send the pick to a running agent")
+    args = ap.parse_args()
+
+    if args.sensors:
+        tl = replay.load_sensor_csv(args.sensors)
+        rain = replay.load_forecast_csv(args.forecast) if args.forecast else []
+    else:
+        tl, rain = replay.synthetic_season(args.days, args.seed)
+
+    t0 = time.perf_counter()
+    results = search(tl, rain, workers=args.workers)
+    dt = time.perf_counter() - t0
+    print(f"Replayed {len(results)} candidates in {dt:.1f}s")
+
+    front = pareto_front(results)
+    print("Pareto front (temp, pump, horizon) -> water L, dry h:")
+    for cand, water, dry in front:
+        print(f"  {cand} -> {water:.1f} L, {dry:.1f} h")
+
+    best = pick(front, args.max_dry)
+    print("Chosen:", best[0], f"{best[1]:.1f} L, {best[2]:.1f} h")
+    if args.push:
+        print("Pushed" if push_settings(args.push, best[0]) else "Push failed")
+
+if __name__ == "__main__":
+    main()
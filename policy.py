@@ -0,0 +1,17 @@
+# auto-watering decision rule, shared by the agent (app.py) and the offline tools (replay.py)
+# kept free of hardware imports so it can run on any machine
+
+COOLDOWN = 3       # minimum seconds between the end of an auto pump run and the next one
+
+RAIN_WORDS = ("rain", "shower", "drizzle", "thunder")
+
+def is_rain_description(desc):
+    """True if an OpenWeather description text means rain."""
+    d = (desc or "").lower()
+    return any(k in d for k in RAIN_WORDS)
+
+def should_water(temp, soil, temp_th, soil_th, rain):
+    """The auto_loop rule: hot or dry soil, and no rain expected. Missing readings never water."""
+    if temp is None or soil is None:
+        return False
+    return (temp > temp_th or soil < soil_th) and not rain
@@ -0,0 +1,161 @@
+# Python stand-in for the ESP8266 pump node, speaking the pumplink.py protocol
+# lets the control channel be benchmarked and tested without hardware:
+#
+#   python3 pump_emulator.py --port 5002 [--drop-every 30] [--latency 0.005]
+
+import json
+import time
+import socket
+import random
+import argparse
+import threading
+
+STATE_EVERY = 5.0          # seconds between unsolicited state pushes
+MAX_SECONDS = 20           # same limit as the ESP8266 firmware
+
+
+class Emulator:
+    def __init__(self, host="127.0.0.1", port=5002, latency=0.0):
+        self.latency = latency            # extra one-way delay to mimic Wi-Fi
+        self.srv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.srv.bind((host, port))
+        self.srv.listen(4)
+        self.port = self.srv.getsockname()[1]
+        self.lock = threading.Lock()
+        self.clients = []
+        self.relay_off_at = 0.0
+        self.started = time.monotonic()
+        self.running = False
+
+    @property
+    def relay(self):
+        return 1 if time.monotonic() < self.relay_off_at else 0
+
+    def start(self):
+        self.running = True
+        threading.Thread(target=self._accept, name="emu_accept", daemon=True).start()
+        threading.Thread(target=self._pusher, name="emu_push", daemon=True).start()
+
+    def stop(self):
+        self.running = False
+        self.kick()
+        self.srv.close()
+
+    def kick(self):
+        """Drop every connection, as a Wi-Fi hiccup or node reboot would."""
+        with self.lock:
+            clients, self.clients = self.clients, []
+        for c in clients:
+            try:
+                c.shutdown(socket.SHUT_RDWR)
+                c.close()
+            except OSError:
+                pass
+
+    def _state(self):
+        now = time.monotonic()
+        return {"type": "state", "relay": self.relay,
+                "remaining": round(max(0.0, self.relay_off_at - now), 1),
+                "rssi": -55 - random.randint(0, 15), "uptime": int(now - self.started)}
+
+    def _send(self, conn, msg):
+        if self.latency:
+            time.sleep(self.latency)
+        try:
+            conn.sendall((json.dumps(msg, separators=(",", ":")) + "\n").encode())
+        except OSError:
+            pass
+
+    def _broadcast(self, msg):
+        with self.lock:
+            clients = list(self.clients)
+        for c in clients:
+            self._send(c, msg)
+
+    def _accept(self):
+        while self.running:
+            try:
+                conn, _ = self.srv.accept()
+            except OSError:
+                return
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            with self.lock:
+                self.clients.append(conn)
+            threading.Thread(target=self._serve, args=(conn,), name="emu_client", daemon=True).start()
+            self._send(conn, self._state())
+
+    def _pusher(self):
+        last_relay = 0
+        last_push = time.monotonic()
+        while self.running:
+            time.sleep(0.05)
+            relay = self.relay
+            if relay != last_relay or time.monotonic() - last_push >= STATE_EVERY:
+                last_relay = relay
+                last_push = time.monotonic()
+                self._broadcast(self._state())
+
+    def _serve(self, conn):
+        buf = b""
+        try:
+            while self.running:
+                data = conn.recv(4096)
+                if not data:
+                    break
+                buf += data
+                while b"\n" in buf:
+                    line, buf = buf.split(b"\n", 1)
+                    if line.strip():
+                        self._handle(conn, json.loads(line))
+        except (OSError, ValueError):
+            pass
+        finally:
+            with self.lock:
+                if conn in self.clients:
+                    self.clients.remove(conn)
+            conn.close()
+
+    def _handle(self, conn, msg):
+        if self.latency:
+            time.sleep(self.latency)
+        cid = msg.get("id", 0)
+        cmd = msg.get("cmd")
+        if cmd == "water":
+            secs = int(msg.get("seconds", 0))
+            if not 0 < secs <= MAX_SECONDS:
+                self._send(conn, {"ack": cid, "ok": False, "error": "invalid seconds"})
+                return
+            self.relay_off_at = time.monotonic() + secs
+            print(f"Pump ON for {secs}s")
+            self._send(conn, {"ack": cid, "ok": True, "relay": 1})
+        elif cmd == "stop":
+            self.relay_off_at = 0.0
+            self._send(conn, {"ack": cid, "ok": True, "relay": 0})
+        elif cmd == "ping":
+            self._send(conn, {"ack": cid, "ok": True, "relay": self.relay})
+        else:
+            self._send(conn, {"ack": cid, "ok": False, "error": "unknown command"})
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Emulated pump node")
+    ap.add_argument("--host", default="0.0.0.0")
+    ap.add_argument("--port", type=int, default=5002)
+    ap.add_argument("--latency", type=float, default=0.0, help="extra one-way delay in seconds")
+    ap.add_argument("--drop-every", type=float, default=0, help="drop connections every N seconds")
+    args = ap.parse_args()
+    emu = Emulator(args.host, args.port, args.latency)
+    emu.start()
+    print(f"Pump node emulator listening on {args.host}:{emu.port}")
+    try:
+        while True:
+            time.sleep(args.drop_every or 3600)
+            if args.drop_every:
+                print("Dropping connections")
+                emu.kick()
+    except KeyboardInterrupt:
+        emu.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+# persistent control channel between the agent and a pump node (ESP8266)
+# one long-lived TCP connection per node carrying newline-delimited JSON:
+#
+#   agent -> node   {"id": 7, "cmd": "water", "seconds": 5}
+#                   {"id": 8, "cmd": "stop"}
+#                   {"id": 9, "cmd": "ping"}
+#   node -> agent   {"ack": 7, "ok": true, "relay": 1}          reply to a command
+#                   {"type": "state", "relay": 0, "remaining": 0, "rssi": -61, "uptime": 1234}
+#
+# the node pushes a state message whenever the relay changes and every few
+# seconds; the agent pings when the line is quiet and reconnects when nothing
+# has been heard for DEAD_AFTER seconds. A command costs one round trip.
+#
+#   python3 pumplink.py --bench        (latency + reconnection against pump_emulator.py)
+
+import json
+import time
+import socket
+import argparse
+import threading
+
+LINK_PORT = 5002
+HEARTBEAT = 2.0            # ping when nothing was received for this long
+DEAD_AFTER = 6.0           # reconnect when nothing was received for this long
+ACK_TIMEOUT = 2.0
+RECONNECT_MIN = 0.5
+RECONNECT_MAX = 10.0
+
+
+class PumpLink:
+    def __init__(self, host, port=LINK_PORT, on_state=None, name="pump_link"):
+        self.host = host
+        self.port = port
+        self.on_state = on_state          # called with the state dict on every push
+        self.name = name
+        self.sock = None
+        self.send_lock = threading.Lock()
+        self.lock = threading.Lock()
+        self.pending = {}                 # command id -> [Event, reply]
+        self.next_id = 1
+        self.state = {}
+        self.connected = False
+        self.last_rx = 0.0
+        self.reconnects = 0
+        self.running = False
+
+    def start(self):
+        self.running = True
+        threading.Thread(target=self._run, name=self.name, daemon=True).start()
+
+    def stop(self):
+        self.running = False
+        self._drop()
+
+    # ---- commands ----
+
+    def command(self, cmd, timeout=ACK_TIMEOUT, **args):
+        """Send a command and wait for its ack. Returns the reply dict, or None."""
+        with self.lock:
+            if not self.connected:
+                return None
+            cid = self.next_id
+            self.next_id += 1
+            slot = [threading.Event(), None]
+            self.pending[cid] = slot
+        try:
+            self._send(dict(args, id=cid, cmd=cmd))
+            if not slot[0].wait(timeout):
+                return None
+            return slot[1]
+        except OSError:
+            return None
+        finally:
+            with self.lock:
+                self.pending.pop(cid, None)
+
+    def water(self, seconds):
+        reply = self.command("water", seconds=int(seconds))
+        return bool(reply and reply.get("ok"))
+
+    def _send(self, msg):
+        data = (json.dumps(msg, separators=(",", ":")) + "\n").encode()
+        with self.send_lock:
+            sock = self.sock
+            if sock is None:
+                raise OSError("not connected")
+            sock.sendall(data)
+
+    # ---- connection ----
+
+    def _drop(self):
+        with self.lock:
+            self.connected = False
+            sock, self.sock = self.sock, None
+            for slot in self.pending.values():
+                slot[0].set()             # wake waiters; reply stays None
+        if sock:
+            try:
+                sock.close()
+            except OSError:
+                pass
+
+    def _run(self):
+        backoff = RECONNECT_MIN
+        while self.running:
+            try:
+                sock = socket.create_connection((self.host, self.port), timeout=5)
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                sock.settimeout(HEARTBEAT / 2)
+                with self.lock:
+                    self.sock = sock
+                    self.connected = True
+                self.last_rx = time.monotonic()
+                backoff = RECONNECT_MIN
+                self._read(sock)
+            except OSError:
+                pass
+            except Exception as e:
+                print("Pump link error:", e)
+            was_connected = self.connected or self.sock is not None
+            self._drop()
+            if not self.running:
+                break
+            if was_connected:
+                # the link was up: try again right away, back off only if that fails
+                self.reconnects += 1
+                time.sleep(0.05)
+                continue
+            time.sleep(backoff)
+            backoff = min(backoff * 2, RECONNECT_MAX)
+
+    def _read(self, sock):
+        buf = b""
+        last_ping = 0.0
+        while self.running:
+            try:
+                data = sock.recv(4096)
+                if not data:
+                    return                # closed by the node
+                self.last_rx = time.monotonic()
+                buf += data
+                while b"\n" in buf:
+                    line, buf = buf.split(b"\n", 1)
+                    if line.strip():
+                        self._dispatch(json.loads(line))
+            except socket.timeout:
+                pass
+            now = time.monotonic()
+            if now - self.last_rx > DEAD_AFTER:
+                return
+            if now - self.last_rx > HEARTBEAT and now - last_ping > HEARTBEAT:
+                last_ping = now
+                self._send({"id": 0, "cmd": "ping"})
+
+    def _dispatch(self, msg):
+        if "ack" in msg:
+            with self.lock:
+                slot = self.pending.get(msg["ack"])
+            if slot:
+                slot[1] = msg
+                slot[0].set()
+            if "relay" in msg:
+                self.state["relay"] = msg["relay"]
+            return
+        if msg.get("type") == "state":
+            self.state = dict(msg, received=time.time())
+            if self.on_state:
+                self.on_state(self.state)
+
+
+# ------------ BENCHMARK ------------
+
+def _bench(n, host=None, port=None):
+    import pump_emulator
+
+    if host is None:
+        emu = pump_emulator.Emulator(port=0)
+        emu.start()
+        host, port = "127.0.0.1", emu.port
+    else:
+        emu = None
+    link = PumpLink(host, port)
+    link.start()
+    end = time.time() + 5
+    while not link.connected and time.time() < end:
+        time.sleep(0.01)
+    if not link.connected:
+        print("could not connect")
+        return
+
+    lat = []
+    for _ in range(n):
+        t = time.perf_counter()
+        link.command("ping")
+        lat.append(time.perf_counter() - t)
+    lat.sort()
+    print(f"{n} commands: p50 {lat[n // 2] * 1000:.2f} ms  p99 {lat[int(n * .99)] * 1000:.2f} ms")
+
+    t = time.perf_counter()
+    ok = link.water(1)
+    print(f"water(1): ok={ok} in {(time.perf_counter() - t) * 1000:.2f} ms, relay={link.state.get('relay')}")
+
+    if emu:
+        emu.kick()
+        t = time.perf_counter()
+        while link.connected and time.perf_counter() - t < 5:
+            time.sleep(0.001)
+        while not link.connected and time.perf_counter() - t < 30:
+            time.sleep(0.001)
+        print(f"reconnected after node dropped the link in {(time.perf_counter() - t) * 1000:.0f} ms "
+              f"(reconnects={link.reconnects})")
+        print("after reconnect water(1):", link.water(1))
+        emu.stop()
+    link.stop()
+
+def main():
+    ap = argparse.ArgumentParser(description="Pump node control channel")
+    ap.add_argument("--bench", action="store_true", help="latency/reconnect benchmark")
+    ap.add_argument("--host", help="benchmark a real node instead of the emulator")
+    ap.add_argument("--port", type=int, default=LINK_PORT)
+    ap.add_argument("-n", type=int, default=1000)
+    args = ap.parse_args()
+    if args.bench:
+        _bench(args.n, args.host, args.port if args.host else None)
+    else:
+        ap.print_help()
+
+if __name__ == "__main__":
+    main()
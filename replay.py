@@ -0,0 +1,268 @@
+# offline replay of the auto-watering policy against recorded or synthetic timelines
+# runs the same decision rule as auto_loop (policy.should_water) on a simulated clock,
+# so a whole season replays in seconds on a laptop:
+#
+#   python3 replay.py --days 365                      (synthetic year)
+#   python3 replay.py --sensors s.csv --forecast f.csv --temp 32 --soil 30 --pump 5
+#
+# sensors csv: ts,temperature,humidity,soil   (unix seconds, one row per sample)
+# forecast csv: ts,rain                       (start of each 3-hour slot, rain 0/1 or mm)
+
+import csv
+import math
+import time
+import random
+import argparse
+
+from policy import should_water, COOLDOWN
+
+# ---------------- DEFAULTS (mirror app.py) ----------------
+
+TEMP_THRESHOLD = 30.0
+SOIL_DRY_THRESHOLD = 30
+PUMP_TIME = 5
+RAIN_HORIZON = 24      # hours of forecast that veto watering
+
+SENSOR_POLL = 2
+AUTO_POLL = 10
+ZONE_STAGGER = 30      # scheduler gap between the end of one run and the start of the next
+SLOT = 3 * 3600        # OpenWeather forecast slot length
+
+FLOW_LPM = 1.5         # pump flow, litres per minute
+WET_PER_PUMP_SECOND = 600   # seconds the soil stays wet per second of pumping (0 = open loop)
+DRY_LEVEL = 30         # soil % below which an hour counts as dry in the report
+WET_SOIL = 100         # reading the digital sensor gives for wet soil
+
+# ----------------------------------------------------------
+
+
+class Timeline:
+    """Run-length encoded sensor timeline.
+
+    Sample i holds from times[i] until times[i+1] (the last one until end), the same
+    way `latest` holds a reading until sensor_loop replaces it. Consecutive samples
+    with equal temperature and soil are merged, so the replay cost follows the number
+    of changes rather than the number of samples.
+    """
+
+    def __init__(self, poll=SENSOR_POLL):
+        self.poll = poll
+        self.times = []
+        self.temps = []
+        self.soils = []
+        self.end = None
+
+    def append(self, ts, temp, soil):
+        if self.times and self.temps[-1] == temp and self.soils[-1] == soil:
+            self.end = ts + self.poll
+            return
+        self.times.append(ts)
+        self.temps.append(temp)
+        self.soils.append(soil)
+        self.end = ts + self.poll
+
+    def __len__(self):
+        return len(self.times)
+
+    def segments(self):
+        """Yield (start, end, temperature, soil) for every run."""
+        n = len(self.times)
+        for i in range(n):
+            b = self.times[i + 1] if i + 1 < n else self.end
+            yield self.times[i], b, self.temps[i], self.soils[i]
+
+
+def _num(v):
+    v = (v or "").strip()
+    return float(v) if v else None
+
+def load_sensor_csv(path, poll=SENSOR_POLL):
+    """Load a ts,temperature,humidity,soil csv into a Timeline."""
+    tl = Timeline(poll)
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            tl.append(float(row["ts"]), _num(row.get("temperature")), _num(row.get("soil")))
+    return tl
+
+def load_forecast_csv(path):
+    """Load a ts,rain csv and return the sorted start times of rainy slots."""
+    slots = []
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            rain = _num(row.get("rain"))
+            if rain:
+                slots.append(float(row["ts"]))
+    slots.sort()
+    return slots
+
+def synthetic_season(days=365, seed=1, start=0.0, poll=SENSOR_POLL):
+    """Generate a plausible (timeline, rain_slots) pair.
+
+    Temperature follows a daily cycle with noise; DHT11 only reports whole degrees,
+    so the reading is re-drawn once a minute. The digital soil probe goes dry a
+    couple of days after the last rain.
+    """
+    rnd = random.Random(seed)
+    tl = Timeline(poll)
+    rain = {}                     # rainy slot start -> seconds the soil stays wet after it
+    for k in range(int(days * 86400 // SLOT)):
+        s = start + k * SLOT
+        season = math.sin(2 * math.pi * s / (365 * 86400))
+        if rnd.random() < 0.06 + 0.08 * max(season, 0):
+            rain[s] = rnd.uniform(1, 3) * 86400
+    wet_until = start
+    for m in range(int(days * 1440)):
+        ts = start + m * 60
+        day = (ts % 86400) / 86400
+        base = 27 + 4 * math.sin(2 * math.pi * ts / (365 * 86400))
+        temp = round(base + 6 * math.sin(2 * math.pi * (day - 0.3)) + rnd.gauss(0, 0.7))
+        slot = start + (ts - start) // SLOT * SLOT
+        if slot in rain:
+            wet_until = max(wet_until, slot + SLOT + rain[slot])
+        soil = WET_SOIL if ts < wet_until else 0
+        tl.append(ts, float(temp), soil)
+    tl.end = start + days * 86400
+    return tl, sorted(rain)
+
+
+def veto_intervals(rain_slots, horizon_hours=RAIN_HORIZON):
+    """Merged [start, end) intervals during which the agent would see rain.
+
+    At time t auto_loop vetoes when the current slot is rainy or any rainy slot
+    starts within the next `horizon_hours`, i.e. slot s vetoes [s - horizon, s + SLOT).
+    """
+    h = horizon_hours * 3600
+    out = []
+    for s in sorted(rain_slots):
+        a, b = s - h, s + SLOT
+        if out and a <= out[-1][1]:
+            if b > out[-1][1]:
+                out[-1][1] = b
+        else:
+            out.append([a, b])
+    return out
+
+
+def replay(timeline, rain_slots=(), temp_th=TEMP_THRESHOLD, soil_th=SOIL_DRY_THRESHOLD,
+           pump_time=PUMP_TIME, horizon_hours=RAIN_HORIZON, auto_poll=AUTO_POLL,
+           cooldown=COOLDOWN, stagger=ZONE_STAGGER, flow_lpm=FLOW_LPM, wet_per_pump_second=WET_PER_PUMP_SECOND,
+           dry_level=DRY_LEVEL, vetoes=None):
+    """Replay auto_loop over a Timeline and return a report dict.
+
+    The clock only moves between points where something can change (a new reading,
+    a rain-veto boundary, the end of a wet spell), and runs of identical auto_loop
+    cycles inside one such stretch are counted arithmetically instead of stepped.
+    `vetoes` may be passed in precomputed (see veto_intervals) when replaying the
+    same forecast many times.
+    """
+    if vetoes is None:
+        vetoes = veto_intervals(rain_slots, horizon_hours)
+    # one watering cycle: auto_loop queues the next run at its first check after
+    # this one, and the scheduler starts it once the run is over and both the
+    # zone's min_interval (cooldown) and the stagger have passed
+    period = max(pump_time + max(cooldown, stagger), auto_poll)
+    wet_span = wet_per_pump_second * pump_time
+
+    runs = 0
+    vetoed_checks = 0
+    dry = 0.0
+    wet_until = float("-inf")
+    nv = len(vetoes)
+    j = 0
+    c = None                                      # time of the next auto_loop check
+
+    for a, b, t, s in timeline.segments():
+        if c is None:
+            c = a
+        pos = a
+        while pos < b:
+            while j < nv and vetoes[j][1] <= pos:
+                j += 1
+            vetoed = j < nv and vetoes[j][0] <= pos
+            nxt = b
+            if j < nv:
+                nxt = min(nxt, vetoes[j][1] if vetoed else vetoes[j][0])
+            wet = pos < wet_until
+            if wet:
+                nxt = min(nxt, wet_until)
+            soil = WET_SOIL if (wet and s is not None) else s
+            is_dry = soil is not None and soil < dry_level
+
+            if not should_water(t, soil, temp_th, soil_th, vetoed):
+                if c < nxt:
+                    n = math.ceil((nxt - c) / auto_poll)
+                    if vetoed and should_water(t, soil, temp_th, soil_th, False):
+                        vetoed_checks += n
+                    c += n * auto_poll
+                if is_dry:
+                    dry += nxt - pos
+                pos = nxt
+                continue
+
+            if c >= nxt:
+                if is_dry:
+                    dry += nxt - pos
+                pos = nxt
+                continue
+
+            if wet_span == 0 or (wet_span >= period and
+                                 should_water(t, WET_SOIL, temp_th, soil_th, vetoed)):
+                # every cycle until nxt waters, whatever the soil reads; from the
+                # first run on the soil stays wet past nxt
+                n = math.ceil((nxt - c) / period)
+                runs += n
+                if is_dry:
+                    dry += (c - pos) if wet_span else (nxt - pos)
+                if wet_span:
+                    wet_until = max(wet_until, c + (n - 1) * period + wet_span)
+                c += n * period
+                pos = nxt
+                continue
+
+            # a single run that wets the soil and changes the decision
+            if is_dry:
+                dry += c - pos
+            runs += 1
+            wet_until = max(wet_until, c + wet_span)
+            pos = c
+            c += period
+
+    pump_seconds = runs * pump_time
+    return {
+        "pump_runs": runs,
+        "pump_seconds": pump_seconds,
+        "water_litres": round(pump_seconds / 60 * flow_lpm, 2),
+        "dry_hours": round(dry / 3600, 2),
+        "vetoed_checks": vetoed_checks,
+        "simulated_hours": round((timeline.end - timeline.times[0]) / 3600, 2) if len(timeline) else 0,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Replay the auto-watering policy")
+    ap.add_argument("--sensors", help="sensor csv (ts,temperature,humidity,soil)")
+    ap.add_argument("--forecast", help="forecast csv (ts,rain)")
+    ap.add_argument("--days", type=int, default=365, help="length of the synthetic season")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--temp", type=float, default=TEMP_THRESHOLD)
+    ap.add_argument("--soil", type=int, default=SOIL_DRY_THRESHOLD)
+    ap.add_argument("--pump", type=int, default=PUMP_TIME)
+    ap.add_argument("--horizon", type=float, default=RAIN_HORIZON)
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    if args.sensors:
+        tl = load_sensor_csv(args.sensors)
+        rain = load_forecast_csv(args.forecast) if args.forecast else []
+    else:
+        tl, rain = synthetic_season(args.days, args.seed)
+    t1 = time.perf_counter()
+    rep = replay(tl, rain, args.temp, args.soil, args.pump, args.horizon)
+    t2 = time.perf_counter()
+
+    print(f"Loaded {len(tl)} runs in {t1 - t0:.2f}s, replayed in {t2 - t1:.3f}s")
+    for k, v in rep.items():
+        print(f"  {k}: {v}")
+
+if __name__ == "__main__":
+    main()
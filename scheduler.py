@@ -0,0 +1,457 @@
+# irrigation scheduler: calendar windows, per-zone minimum intervals and staggered pump runs
+# jobs ("water zone Z for S seconds at T, optionally every E seconds") sit in a
+# min-heap keyed on due time, so adding, cancelling or firing a job is O(log n)
+# however many are pending. When a job comes due it is checked against its
+# zone's rules:
+#   - windows: local "HH:MM-HH:MM" ranges the run must fit in (may wrap midnight);
+#     outside them the job moves to the next opening
+#   - min_interval: seconds between the end of one run and the start of the next
+#     in the zone
+# jobs that pass go to a FIFO ready queue drained one run at a time, with STAGGER
+# seconds between runs so zones never draw from the supply together. Reactive jobs
+# (kind "auto", submitted by auto_loop) are re-checked against the sensor/weather
+# rules if they had to wait. Jobs and zone rules live in SQLite (schedule tables
+# of the history DB), so they survive restarts.
+#
+#   python3 scheduler.py --bench --jobs 50000 --zones 1000     (simulated clock)
+
+import os
+import json
+import math
+import time
+import heapq
+import sqlite3
+import random
+import argparse
+import tempfile
+import threading
+from collections import deque
+
+from history import connect, DB_PATH
+
+STAGGER = 30               # seconds between the end of one run and the start of the next
+MAX_WAIT = 60              # longest the scheduler thread sleeps without re-checking
+REACTIVE = ("auto",)       # job kinds re-checked before running
+MAX_SECONDS = 20           # longest run the pump node accepts (MAX_SECONDS in arduino.c)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS schedule (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    zone TEXT NOT NULL,
+    due REAL NOT NULL,
+    seconds INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    every REAL,
+    data TEXT
+);
+CREATE TABLE IF NOT EXISTS schedule_zones (
+    zone TEXT PRIMARY KEY,
+    windows TEXT,
+    min_interval REAL,
+    last_run REAL
+);
+"""
+
+
+# ------------ WINDOWS ------------
+
+def parse_windows(spec):
+    """["05:00-07:00", ...] -> [(start_minute, end_minute)] of the day."""
+    out = []
+    for w in spec or []:
+        a, b = w.split("-")
+        ends = []
+        for h, m in (a.split(":"), b.split(":")):
+            h, m = int(h), int(m)
+            if not (0 <= h < 24 and 0 <= m < 60):
+                raise ValueError(f"bad time in window {w!r}")
+            ends.append(h * 60 + m)
+        out.append(tuple(ends))
+    return out
+
+def _number(v):
+    return isinstance(v, (int, float)) and not isinstance(v, bool) and math.isfinite(v)
+
+def check_job(spec):
+    """Raise ValueError unless a job dict has seconds in 1..MAX_SECONDS and a positive (or no) period."""
+    seconds, every, due = spec.get("seconds"), spec.get("every"), spec.get("due")
+    if not _number(seconds) or not 1 <= seconds <= MAX_SECONDS:
+        raise ValueError(f"seconds must be 1-{MAX_SECONDS}, got {seconds!r}")
+    if every is not None and not (_number(every) and every > 0):
+        raise ValueError(f"every must be a positive number of seconds, got {every!r}")
+    if due is not None and not _number(due):
+        raise ValueError(f"bad due time {due!r}")
+
+def window_start(t, windows, seconds=0):
+    """Earliest time >= t at which a run of `seconds` fits inside one of the windows."""
+    if not windows:
+        return t
+    lt = time.localtime(t)
+    day = t - (lt.tm_hour * 3600 + lt.tm_min * 60 + lt.tm_sec + (t % 1))   # local midnight
+    now = t - day
+    best = None
+    for a, b in windows:
+        a, b = a * 60, b * 60
+        if b <= a:
+            b += 86400                       # wraps midnight
+        latest = b - seconds                 # last start that still ends inside
+        if latest < a:
+            continue                         # window shorter than the run
+        for shift in (-86400, 0, 86400):     # yesterday's wrapped window, today's, tomorrow's
+            lo, hi = a + shift, latest + shift
+            cand = now if lo <= now <= hi else lo
+            if cand >= now and (best is None or cand < best):
+                best = cand
+    return t if best is None else day + best
+
+
+# ------------ SCHEDULER ------------
+
+class Job:
+    __slots__ = ("id", "zone", "due", "seconds", "kind", "every", "data")
+
+    def __init__(self, id, zone, due, seconds, kind, every=None, data=None):
+        self.id = id
+        self.zone = zone
+        self.due = due
+        self.seconds = seconds
+        self.kind = kind
+        self.every = every
+        self.data = data
+
+    def as_dict(self):
+        return {"id": self.id, "zone": self.zone, "due": self.due, "seconds": self.seconds,
+                "kind": self.kind, "every": self.every, "data": self.data}
+
+
+class Scheduler:
+    def __init__(self, run, check=None, path=DB_PATH, clock=time.time, stagger=STAGGER):
+        # run(job) -> ok waters the zone; check(job) -> bool re-evaluates a reactive job
+        self.run = run
+        self.check = check
+        self.path = path
+        self.clock = clock
+        self.stagger = stagger
+        self.cv = threading.Condition()
+        self.jobs = {}              # id -> Job
+        self.heap = []              # (due, id); entries whose due != jobs[id].due are stale
+        self.ready = deque()        # ids cleared to run, waiting for the pump
+        self.zones = {}             # zone -> {"windows": [(a, b)], "spec": [...], "min_interval": s, "last_run": t}
+        self.reactive = {}          # zone -> id of its pending reactive job
+        self.pump_free = 0.0        # earliest start of the next run (staggering)
+        self.stats = {"runs": 0, "failed": 0, "deferred": 0, "skipped": 0}
+        self.conn = connect(path, check_same_thread=False)     # only used under self.cv
+        self.conn.executescript(SCHEMA)
+        self._load()
+
+    def _load(self):
+        for zone, windows, min_interval, last_run in self.conn.execute("SELECT * FROM schedule_zones"):
+            spec = json.loads(windows or "[]")
+            try:
+                parsed = parse_windows(spec)
+            except ValueError as e:
+                # saved before windows were range-checked; keep the zone, drop its windows
+                print(f"Scheduler: ignoring windows of zone {zone}: {e}")
+                parsed, spec = [], []
+            self.zones[zone] = {"windows": parsed, "spec": spec,
+                                "min_interval": min_interval or 0, "last_run": last_run}
+        for row in self.conn.execute("SELECT id, zone, due, seconds, kind, every, data FROM schedule"):
+            job = Job(*row[:6], json.loads(row[6]) if row[6] else None)
+            self.jobs[job.id] = job
+            if job.kind in REACTIVE:
+                self.reactive[job.zone] = job.id
+        self.heap = [(j.due, j.id) for j in self.jobs.values()]
+        heapq.heapify(self.heap)
+
+    def start(self):
+        threading.Thread(target=self._loop, name="scheduler", daemon=True).start()
+
+    # ---- zones and jobs ----
+
+    def set_zone(self, zone, windows=None, min_interval=0):
+        spec = list(windows or [])
+        parsed = parse_windows(spec)          # raises ValueError on a bad window
+        if not (_number(min_interval) and min_interval >= 0):
+            raise ValueError(f"min_interval must be a non-negative number of seconds, got {min_interval!r}")
+        with self.cv:
+            z = self.zones.setdefault(zone, {"last_run": None})
+            z.update(windows=parsed, spec=spec, min_interval=float(min_interval))
+            with self.conn:
+                self.conn.execute("INSERT OR REPLACE INTO schedule_zones VALUES (?,?,?,?)",
+                                  (zone, json.dumps(spec), z["min_interval"], z["last_run"]))
+            self.cv.notify()
+
+    def add(self, zone, seconds, due=None, kind="scheduled", every=None, data=None):
+        return self.add_many([{"zone": zone, "seconds": seconds, "due": due, "kind": kind,
+                               "every": every, "data": data}])[0]
+
+    def add_many(self, specs):
+        """Add jobs from dicts (zone, seconds, due, kind, every, data) in one transaction; returns ids.
+
+        Every spec is checked (check_job) before any is added, so a bad one adds nothing.
+        """
+        for s in specs:
+            check_job(s)
+        now = self.clock()
+        ids = []
+        with self.cv:
+            with self.conn:
+                cur = self.conn.cursor()
+                for s in specs:
+                    due = now if s.get("due") is None else float(s["due"])
+                    job = Job(None, s["zone"], due, int(s["seconds"]), s.get("kind") or "scheduled",
+                              s.get("every"), s.get("data"))
+                    cur.execute("INSERT INTO schedule (zone, due, seconds, kind, every, data) VALUES (?,?,?,?,?,?)",
+                                (job.zone, job.due, job.seconds, job.kind, job.every,
+                                 None if job.data is None else json.dumps(job.data)))
+                    job.id = cur.lastrowid
+                    self.jobs[job.id] = job
+                    heapq.heappush(self.heap, (job.due, job.id))
+                    ids.append(job.id)
+            self.cv.notify()
+        return ids
+
+    def submit_reactive(self, zone, seconds, data=None):
+        """Queue a sensor/weather-triggered run; at most one is pending per zone."""
+        with self.cv:
+            jid = self.reactive.get(zone)
+            if jid in self.jobs:
+                return jid
+        jid = self.add(zone, seconds, kind="auto", data=data)
+        with self.cv:
+            self.reactive[zone] = jid
+        return jid
+
+    def hold(self, until):
+        """Start no run before `until`, e.g. while a run from before a restart may still be on."""
+        with self.cv:
+            self.pump_free = max(self.pump_free, until)
+            self.cv.notify()
+
+    def cancel(self, jid):
+        with self.cv:
+            job = self.jobs.pop(jid, None)
+            if job is None:
+                return False
+            with self.conn:
+                self.conn.execute("DELETE FROM schedule WHERE id = ?", (jid,))
+            self._compact()
+            return True
+
+    def upcoming(self, limit=50, zone=None):
+        """Pending jobs in the order they are due, as dicts."""
+        with self.cv:
+            ready = [self.jobs[j] for j in self.ready if j in self.jobs]
+            live = (self.jobs[jid] for due, jid in self.heap
+                    if jid in self.jobs and self.jobs[jid].due == due)
+            if zone is not None:
+                ready = [j for j in ready if j.zone == zone]
+                live = (j for j in live if j.zone == zone)
+            jobs = ready + heapq.nsmallest(max(0, limit - len(ready)), live, key=lambda j: j.due)
+            return [dict(j.as_dict(), ready=i < len(ready)) for i, j in enumerate(jobs[:limit])]
+
+    def status(self):
+        with self.cv:
+            return dict(self.stats, pending=len(self.jobs), ready=len(self.ready),
+                        pump_free=self.pump_free if self.pump_free > self.clock() else None,
+                        zones={z: {"windows": c["spec"], "min_interval": c["min_interval"],
+                                   "last_run": c["last_run"]} for z, c in self.zones.items()})
+
+    # ---- dispatch ----
+
+    def _earliest(self, job, now):
+        """Earliest time >= now the zone's rules allow this job to start."""
+        z = self.zones.get(job.zone)
+        if not z:
+            return now
+        t = now
+        if z["last_run"] is not None and z["min_interval"]:
+            t = max(t, z["last_run"] + z["min_interval"])
+        return window_start(t, z["windows"], job.seconds)
+
+    def _compact(self):
+        # drop stale heap entries once they outnumber the live ones
+        if len(self.heap) > 2 * len(self.jobs) + 64:
+            self.heap = [(j.due, j.id) for j in self.jobs.values()]
+            heapq.heapify(self.heap)
+
+    def _write(self, sql, args):
+        # dispatch-time persistence: a failed write (e.g. database is locked) is
+        # logged and the in-memory state stays authoritative, so no job gets stuck
+        try:
+            with self.conn:
+                self.conn.execute(sql, args)
+        except sqlite3.Error as e:
+            print("Scheduler: could not persist:", e)
+
+    def _reschedule(self, job, due, persist=True):
+        job.due = due
+        heapq.heappush(self.heap, (due, job.id))
+        if persist:
+            self._write("UPDATE schedule SET due = ? WHERE id = ?", (due, job.id))
+
+    def _finish(self, job, now):
+        if job.every:
+            nxt = job.due + job.every
+            if nxt <= now:                    # missed occurrences are not made up
+                nxt += ((now - nxt) // job.every + 1) * job.every
+            self._reschedule(job, nxt)
+            return
+        del self.jobs[job.id]
+        if self.reactive.get(job.zone) == job.id:
+            del self.reactive[job.zone]
+        self._write("DELETE FROM schedule WHERE id = ?", (job.id,))
+
+    def step(self, now):
+        """Release due jobs and start at most one run. Returns the next time step() has work."""
+        with self.cv:
+            heap = self.heap
+            while heap and heap[0][0] <= now:
+                due, jid = heapq.heappop(heap)
+                job = self.jobs.get(jid)
+                if job is None or job.due != due:
+                    continue                  # cancelled or moved
+                t = self._earliest(job, now)
+                if t > now:
+                    # not written back: after a restart the stored due time is
+                    # in the past and the same rules defer it again
+                    self.stats["deferred"] += 1
+                    self._reschedule(job, t, persist=False)
+                else:
+                    self.ready.append(jid)
+
+            job = None
+            while self.ready and now >= self.pump_free:
+                job = self.jobs.get(self.ready.popleft())
+                if job is None:
+                    continue
+                t = self._earliest(job, now)
+                if t > now:                   # window closed while it waited for the pump
+                    self.stats["deferred"] += 1
+                    self._reschedule(job, t, persist=False)
+                    job = None
+                    continue
+                break
+
+        if job is not None:
+            waited = now - job.due > 1
+            ok = True
+            if job.kind in REACTIVE and waited and self.check:
+                try:
+                    wanted = self.check(job)
+                except Exception as e:
+                    print(f"Scheduler: check of job {job.id} failed:", e)
+                    wanted = False
+                if not wanted:
+                    self.stats["skipped"] += 1    # conditions changed while it waited
+                    ok = None
+            if ok is not None:
+                try:
+                    ok = self.run(job)
+                except Exception as e:
+                    # counted as a failed run: the command may have gone out, so
+                    # the zone interval and the stagger still apply
+                    print(f"Scheduler: job {job.id} failed:", e)
+                    ok = False
+            with self.cv:
+                if ok is not None:
+                    z = self.zones.setdefault(job.zone, {"windows": [], "spec": [], "min_interval": 0})
+                    z["last_run"] = now + job.seconds
+                    self._write("INSERT OR REPLACE INTO schedule_zones VALUES (?,?,?,?)",
+                                (job.zone, json.dumps(z["spec"]), z["min_interval"], z["last_run"]))
+                    self.pump_free = now + job.seconds + self.stagger
+                    self.stats["runs" if ok else "failed"] += 1
+                if job.id in self.jobs:
+                    self._finish(job, now)
+
+        with self.cv:
+            nxt = self.heap[0][0] if self.heap else float("inf")
+            if self.ready:
+                nxt = min(nxt, self.pump_free)
+            return max(nxt, now) if job is None else now
+
+    def _loop(self):
+        while True:
+            try:
+                nxt = self.step(self.clock())
+                with self.cv:
+                    wait = nxt - self.clock()
+                    if wait > 0:
+                        self.cv.wait(min(wait, MAX_WAIT))
+            except Exception as e:
+                print("Scheduler error:", e)
+                time.sleep(1)
+
+
+# ------------ BENCHMARK ------------
+
+def _bench(n, zones, seconds, stagger, seed=1):
+    rnd = random.Random(seed)
+    path = os.path.join(tempfile.mkdtemp(), "schedule.db")
+    now = [1_700_000_000.0]
+    runs = []
+
+    def run(job):
+        runs.append((job.zone, now[0], job.seconds))
+        return True
+
+    s = Scheduler(run, path=path, clock=lambda: now[0], stagger=stagger)
+    windows = ["05:00-07:00", "18:00-20:00", "22:00-02:00"]
+    for z in range(zones):
+        s.set_zone(f"z{z}", [windows[z % 3]] if z % 4 else [], min_interval=rnd.choice((0, 3600, 6 * 3600)))
+
+    specs = [{"zone": f"z{rnd.randrange(zones)}", "seconds": seconds,
+              "due": now[0] + rnd.uniform(0, 86400)} for _ in range(n)]
+    t = time.perf_counter()
+    s.add_many(specs)
+    add_us = (time.perf_counter() - t) / n * 1e6
+
+    t = time.perf_counter()
+    Scheduler(run, path=path, clock=lambda: now[0])
+    load_ms = (time.perf_counter() - t) * 1000
+
+    t = time.perf_counter()
+    steps = 0
+    while s.jobs:
+        now[0] = max(now[0], s.step(now[0]))
+        steps += 1
+    loop = time.perf_counter() - t
+
+    # every run inside its zone's window, min_interval and stagger respected
+    by_zone = {}
+    violations = 0
+    prev_end = None
+    for zone, start, secs in runs:
+        z = s.zones[zone]
+        if window_start(start, z["windows"], secs) != start:
+            violations += 1
+        last = by_zone.get(zone)
+        if last is not None and start < last + z["min_interval"]:
+            violations += 1
+        if prev_end is not None and start < prev_end + stagger:
+            violations += 1
+        by_zone[zone] = prev_end = start + secs
+
+    print(f"{n} jobs over {zones} zones (runs of {seconds}s, stagger {stagger}s)")
+    print(f"  add:      {add_us:.1f} us/job (one transaction)")
+    print(f"  restart:  {load_ms:.0f} ms to reload {n} jobs")
+    print(f"  dispatch: {len(runs)} runs, {s.stats['deferred']} deferrals, {steps} steps, "
+          f"{loop / max(1, steps) * 1e6:.1f} us/step")
+    print(f"  simulated span: {(runs[-1][1] - runs[0][1]) / 86400:.1f} days, rule violations: {violations}")
+    os.remove(path)
+
+def main():
+    ap = argparse.ArgumentParser(description="Irrigation scheduler")
+    ap.add_argument("--bench", action="store_true")
+    ap.add_argument("--jobs", type=int, default=50000)
+    ap.add_argument("--zones", type=int, default=1000)
+    ap.add_argument("--seconds", type=int, default=5)
+    ap.add_argument("--stagger", type=int, default=1)
+    args = ap.parse_args()
+    if args.bench:
+        _bench(args.jobs, args.zones, args.seconds, args.stagger)
+    else:
+        ap.print_help()
+
+if __name__ == "__main__":
+    main()
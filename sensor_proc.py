@@ -0,0 +1,377 @@
+# DHT acquisition in its own process, handing samples over through shared memory
+# the DHT11 is bit-banged from Python (use_pulseio=False): a read has to poll the
+# data pin through ~4 ms of 26-70 us pulses, and any pause longer than a pulse
+# corrupts it. In the agent process that read competes for the GIL with the HTTP
+# server and the other loops, so under dashboard load reads fail more often.
+# Here a child process owns the sensor (optionally pinned to a core and given a
+# higher priority) and publishes every attempt into a ring in
+# multiprocessing.shared_memory. Each slot is guarded by a seqlock-style version:
+#
+#   writer: version += 1 (odd) -> write fields -> version += 1 (even) -> head += 1
+#   reader: v1 = version; unpack fields in place; v2 = version; retry if v1 odd or v1 != v2
+#
+# readers never take a lock and never block the writer; struct.unpack_from reads
+# straight out of the mapping, so there is no intermediate copy. A reader yields
+# between retries and gives up on a slot after READ_RETRIES (a writer killed
+# mid-update leaves its version odd for good). The segment's name is unlinked
+# as soon as it is created: the forked child uses the inherited mapping, so
+# nothing is left in /dev/shm however the agent exits.
+#
+#   python3 sensor_proc.py --bench      (success rate + jitter under HTTP load, thread vs process)
+
+import os
+import time
+import atexit
+import math
+import json
+import struct
+import random
+import argparse
+import threading
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+SLOTS = 64                 # ring size; readers only need the newest few samples
+NICE = -10                 # priority boost for the acquisition process (needs root; ignored otherwise)
+READ_RETRIES = 100         # attempts at a consistent read of one slot before giving up on it
+
+_HEADER = struct.Struct("<QQQQ")       # slots, head (samples written), attempts, good reads
+_SLOT = struct.Struct("<QQdddd")       # version, n, ts, temperature, humidity, read_ms
+_VERSION = struct.Struct("<Q")
+NAN = float("nan")
+
+
+# ------------ SHARED RING ------------
+
+class SampleRing:
+    """Single-writer ring of DHT samples in shared memory (failed reads have NaN values)."""
+
+    def __init__(self, slots=SLOTS, name=None):
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=_HEADER.size + slots * _SLOT.size)
+            _HEADER.pack_into(self.shm.buf, 0, slots, 0, 0, 0)
+            self.owner = True
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+        self.linked = self.owner
+        self.buf = self.shm.buf
+        self.slots = _HEADER.unpack_from(self.buf, 0)[0]
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def unlink(self):
+        """Remove the name; processes that already map the ring keep using it."""
+        if self.linked:
+            self.shm.unlink()
+            self.linked = False
+
+    def close(self):
+        if self.buf is None:
+            return
+        self.buf = None
+        self.shm.close()
+        self.unlink()
+
+    # ---- writer (one process only) ----
+
+    def publish(self, ts, temp, hum, read_ms):
+        buf = self.buf
+        _, head, attempts, good = _HEADER.unpack_from(buf, 0)
+        off = _HEADER.size + (head % self.slots) * _SLOT.size
+        version = _VERSION.unpack_from(buf, off)[0]
+        _VERSION.pack_into(buf, off, version + 1)                      # odd: being written
+        _SLOT.pack_into(buf, off, version + 1, head, ts,
+                        NAN if temp is None else temp, NAN if hum is None else hum, read_ms)
+        _VERSION.pack_into(buf, off, version + 2)                      # even: stable
+        _HEADER.pack_into(buf, 0, self.slots, head + 1, attempts + 1, good + (temp is not None))
+
+    # ---- readers (any process, any thread) ----
+
+    def _slot(self, n):
+        buf = self.buf
+        off = _HEADER.size + (n % self.slots) * _SLOT.size
+        for _ in range(READ_RETRIES):
+            v1 = _VERSION.unpack_from(buf, off)[0]
+            if not v1 & 1:                   # odd: writer is mid-update (a few us)
+                rec = _SLOT.unpack_from(buf, off)
+                if _VERSION.unpack_from(buf, off)[0] == v1:
+                    return rec[1:] if rec[1] == n else None  # None: overwritten by a newer lap
+            time.sleep(0)                    # let the writer finish
+        return None
+
+    def head(self):
+        return _HEADER.unpack_from(self.buf, 0)[1]
+
+    def counters(self):
+        """(attempts, good reads) since the ring was created."""
+        return _HEADER.unpack_from(self.buf, 0)[2:]
+
+    def since(self, n):
+        """Samples numbered >= n still in the ring: [(n, ts, temp, hum, read_ms)]."""
+        head = self.head()
+        out = []
+        for i in range(max(n, head - self.slots), head):
+            rec = self._slot(i)
+            if rec is not None:
+                out.append(rec)
+        return out
+
+    def latest_good(self):
+        """Newest successful sample (n, ts, temp, hum, read_ms), or None."""
+        head = self.head()
+        for i in range(head - 1, max(-1, head - self.slots - 1), -1):
+            rec = self._slot(i)
+            if rec is not None and not math.isnan(rec[2]):
+                return rec
+        return None
+
+
+# ------------ ACQUISITION PROCESS ------------
+
+def _acquire(ring, make_sensor, period, cpu, nice, parent):
+    if cpu is not None:
+        try:
+            os.sched_setaffinity(0, {cpu})
+        except (AttributeError, OSError) as e:
+            print("Sensor process: could not pin to core", cpu, e)
+    if nice:
+        try:
+            os.nice(nice)
+        except OSError:
+            pass
+    sensor = make_sensor()
+    next_t = time.monotonic()
+    while os.getppid() == parent:           # exit with the agent
+        t = time.time()
+        t0 = time.perf_counter()
+        temp = hum = None
+        try:
+            temp = sensor.temperature
+            hum = sensor.humidity
+        except RuntimeError:
+            pass                            # normal intermittent DHT failure
+        except Exception as e:
+            print("Sensor process error:", e)
+        ring.publish(t, None if temp is None else float(temp),
+                     None if hum is None else float(hum), (time.perf_counter() - t0) * 1000)
+        next_t += period
+        delay = next_t - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            next_t = time.monotonic()
+
+
+class SensorProcess:
+    """Runs make_sensor() in a child process and exposes its samples through a SampleRing.
+
+    make_sensor is called in the child, so the sensor's pins are only opened there.
+    """
+
+    def __init__(self, make_sensor, period, cpu=None, nice=NICE, slots=SLOTS):
+        self.make_sensor = make_sensor
+        self.period = period
+        self.cpu = cpu
+        self.nice = nice
+        self.ring = SampleRing(slots)
+        self.ring.unlink()      # the forked child inherits the mapping; nothing to leak
+        self.proc = None
+        self.seen = 0           # next sample number not yet returned by poll()
+
+    def start(self):
+        ctx = mp.get_context("fork")        # the child inherits make_sensor and the ring as-is
+        self.proc = ctx.Process(target=_acquire, name="sensor_proc", daemon=True,
+                                args=(self.ring, self.make_sensor, self.period,
+                                      self.cpu, self.nice, os.getpid()))
+        self.proc.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        if self.proc:
+            self.proc.terminate()
+            self.proc.join()
+            self.proc = None
+        self.ring.close()
+
+    @property
+    def alive(self):
+        return bool(self.proc and self.proc.is_alive())
+
+    def poll(self):
+        """(temperature, humidity) of the newest good sample since the last poll, else (None, None)."""
+        new = self.ring.since(self.seen)
+        if new:
+            self.seen = new[-1][0] + 1
+        for rec in reversed(new):
+            if not math.isnan(rec[2]):
+                return rec[2], rec[3]
+        return None, None
+
+    def stats(self):
+        attempts, good = self.ring.counters()
+        return {"alive": self.alive, "attempts": attempts, "good": good,
+                "success_rate": round(good / attempts, 3) if attempts else None}
+
+
+# ------------ BENCHMARK ------------
+
+class SimulatedDHT:
+    """Timing-sensitive stand-in for a bit-banged DHT11.
+
+    A read polls for READ_MS, like the real driver walking the 40 data bits;
+    if the polling loop is ever paused for longer than MAX_GAP_US (preempted,
+    or waiting for the GIL) a pulse was missed and the read fails.
+    """
+
+    READ_MS = 4.0
+    MAX_GAP_US = 100
+
+    def __init__(self, seed=1):
+        self.rnd = random.Random(seed)
+        self._hum = None
+
+    @property
+    def temperature(self):
+        end = time.perf_counter() + self.READ_MS / 1000
+        max_gap = self.MAX_GAP_US / 1e6
+        last = time.perf_counter()
+        while last < end:
+            now = time.perf_counter()
+            if now - last > max_gap:
+                raise RuntimeError("A full buffer was not returned. Try again.")
+            last = now
+        self._hum = 60 + self.rnd.randint(-3, 3)
+        return 25 + self.rnd.randint(-2, 2)
+
+    @property
+    def humidity(self):
+        return self._hum
+
+
+def _load_server():
+    """HTTP server doing dashboard-like work (JSON of a few thousand history rows)."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    rows = [{"ts": 1700000000 + i * 2, "temperature": 25.0 + i % 7, "humidity": 60.0, "soil": i % 2 * 100}
+            for i in range(3000)]
+
+    class H(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = json.dumps(json.loads(json.dumps(rows))).encode()
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *a):
+            pass
+
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), H)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return srv
+
+def _load_client(port, clients, stop):
+    import http.client
+
+    def hammer():
+        conn = http.client.HTTPConnection("127.0.0.1", port)
+        while not stop.is_set():
+            try:
+                conn.request("GET", "/")
+                conn.getresponse().read()
+            except OSError:
+                conn = http.client.HTTPConnection("127.0.0.1", port)
+
+    ts = [threading.Thread(target=hammer) for _ in range(clients)]
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+
+def _summary(label, samples, period):
+    good = sum(1 for s in samples if s[1] is not None)
+    gaps = sorted(abs((b[0] - a[0]) - period) * 1000 for a, b in zip(samples, samples[1:]))
+
+    def pct(q):
+        return gaps[min(len(gaps) - 1, int(q * len(gaps)))] if gaps else 0.0
+
+    print(f"  {label:<22} reads {len(samples):4d}  success {good / max(1, len(samples)) * 100:5.1f}%  "
+          f"jitter p50 {pct(.5):6.2f} ms  p99 {pct(.99):6.2f} ms")
+
+def _bench(seconds, period, clients, cpu):
+    srv = _load_server()
+    port = srv.server_address[1]
+
+    def thread_run():
+        dht = SimulatedDHT()
+        samples = []
+        end = time.monotonic() + seconds
+        next_t = time.monotonic()
+        while time.monotonic() < end:
+            t = time.time()
+            try:
+                temp = dht.temperature
+            except RuntimeError:
+                temp = None
+            samples.append((t, temp))
+            next_t += period
+            time.sleep(max(0.0, next_t - time.monotonic()))
+        return samples
+
+    def process_run():
+        sp = SensorProcess(SimulatedDHT, period, cpu=cpu)
+        sp.start()
+        recs = []
+        end = time.monotonic() + seconds
+        while time.monotonic() < end:
+            time.sleep(0.5)                 # well inside one lap of the ring
+            recs += sp.ring.since(recs[-1][0] + 1 if recs else 0)
+        t = time.perf_counter()
+        for _ in range(10000):
+            sp.poll()
+        poll_us = (time.perf_counter() - t) / 10000 * 1e6
+        sp.stop()
+        return [(r[1], None if math.isnan(r[2]) else r[2]) for r in recs], poll_us
+
+    def with_load(fn):
+        stop = mp.Event()
+        p = mp.get_context("fork").Process(target=_load_client, args=(port, clients, stop))
+        if clients:
+            p.start()
+            time.sleep(0.5)
+        try:
+            return fn()
+        finally:
+            stop.set()
+            if clients:
+                p.join()
+
+    print(f"{seconds:.0f} s per run, one read every {period * 1000:.0f} ms, "
+          f"{clients} HTTP load clients, {os.cpu_count()} CPU(s)")
+    _summary("thread, idle", thread_run(), period)
+    _summary("thread, HTTP load", with_load(thread_run), period)
+    recs, _ = process_run()
+    _summary("process, idle", recs, period)
+    recs, poll_us = with_load(process_run)
+    _summary("process, HTTP load", recs, period)
+    print(f"  reader cost: {poll_us:.2f} us per poll()")
+    srv.shutdown()
+
+def main():
+    ap = argparse.ArgumentParser(description="Isolated DHT acquisition process")
+    ap.add_argument("--bench", action="store_true", help="compare thread vs process under HTTP load")
+    ap.add_argument("--seconds", type=float, default=10)
+    ap.add_argument("--period", type=float, default=0.05, help="seconds between reads (bench only)")
+    ap.add_argument("--clients", type=int, default=4, help="concurrent HTTP load clients")
+    ap.add_argument("--cpu", type=int, help="pin the acquisition process to this core")
+    args = ap.parse_args()
+    if args.bench:
+        _bench(args.seconds, args.period, args.clients, args.cpu)
+    else:
+        ap.print_help()
+
+if __name__ == "__main__":
+    main()
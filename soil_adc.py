@@ -0,0 +1,214 @@
+# analog soil moisture acquisition through an ADC (MCP3008 on the Pi's SPI bus)
+# a dedicated reader thread oversamples every probe in short bursts, takes the
+# median of each burst (decimation), smooths the result with a first-order IIR
+# filter and converts it to moisture % with a per-probe lookup table built once
+# from the calibration points. Between bursts the reader sleeps and the HTTP
+# server and the other loops run freely; during a burst they wait for the GIL,
+# for up to the interpreter's switch interval (5 ms). On the bench a thread
+# sleeping 5 ms at a time saw its p99 wake-up lag go from 0.49 ms to 4.29 ms
+# while 8 probes were read (p50 barely moves).
+#
+#   python3 soil_adc.py --bench       (simulated ADC: sample rate + scheduling delay)
+
+import time
+import math
+import random
+import argparse
+import threading
+
+ADC_BITS = 10              # MCP3008
+OVERSAMPLE = 16            # raw samples per probe per burst (median -> 1 value)
+BURST_HZ = 10              # bursts per second; aggregate rate = probes * OVERSAMPLE * BURST_HZ
+IIR_ALPHA = 0.2            # weight of the newest burst in the smoothed value
+
+# capacitive probes read high in dry soil and low in wet soil
+DEFAULT_CALIBRATION = [(820, 0.0), (380, 100.0)]
+
+
+# ------------ ADC DRIVERS ------------
+# a driver has read(channel) -> raw int in [0, 2**bits)
+
+class MCP3008:
+    """8-channel 10-bit SPI ADC."""
+
+    bits = 10
+
+    def __init__(self, bus=0, device=0, speed_hz=1350000):
+        import spidev       # only needed on the Pi
+        self.spi = spidev.SpiDev()
+        self.spi.open(bus, device)
+        self.spi.max_speed_hz = speed_hz
+
+    def read(self, channel):
+        r = self.spi.xfer2([1, (8 + channel) << 4, 0])
+        return ((r[1] & 3) << 8) | r[2]
+
+
+class SimulatedADC:
+    """ADC stand-in for tests and benchmarks.
+
+    levels maps channel -> raw level, or a function of time returning one;
+    Gaussian noise and occasional spikes are added to every read.
+    """
+
+    def __init__(self, levels, bits=ADC_BITS, noise=6.0, spike_rate=0.01, seed=1):
+        self.levels = levels
+        self.bits = bits
+        self.noise = noise
+        self.spike_rate = spike_rate
+        self.rnd = random.Random(seed)
+
+    def read(self, channel):
+        level = self.levels[channel]
+        v = level(time.monotonic()) if callable(level) else level
+        v += self.rnd.gauss(0, self.noise)
+        if self.rnd.random() < self.spike_rate:
+            v = self.rnd.choice((0, 2 ** self.bits - 1))
+        return max(0, min(2 ** self.bits - 1, int(v)))
+
+
+# ------------ CALIBRATION ------------
+
+def build_lut(points, bits=ADC_BITS):
+    """Lookup table raw -> moisture %, piecewise linear through points, clamped at the ends."""
+    pts = sorted(points)
+    lut = []
+    for raw in range(2 ** bits):
+        if raw <= pts[0][0]:
+            pct = pts[0][1]
+        elif raw >= pts[-1][0]:
+            pct = pts[-1][1]
+        else:
+            for (r0, p0), (r1, p1) in zip(pts, pts[1:]):
+                if r0 <= raw <= r1:
+                    pct = p0 + (p1 - p0) * (raw - r0) / (r1 - r0)
+                    break
+        lut.append(round(min(100.0, max(0.0, pct)), 1))
+    return lut
+
+
+# ------------ READER ------------
+
+class SoilProbes:
+    """Oversampled, decimated and calibrated moisture for a set of ADC channels."""
+
+    def __init__(self, adc, calibrations, oversample=OVERSAMPLE, burst_hz=BURST_HZ, alpha=IIR_ALPHA):
+        # calibrations: channel -> [(raw, pct), ...] (None for DEFAULT_CALIBRATION)
+        self.adc = adc
+        self.channels = sorted(calibrations)
+        self.luts = {ch: build_lut(pts or DEFAULT_CALIBRATION, adc.bits) for ch, pts in calibrations.items()}
+        self.oversample = oversample
+        self.period = 1.0 / burst_hz
+        self.alpha = alpha
+        self.lock = threading.Lock()
+        self.filtered = {}          # channel -> smoothed raw value
+        self.values = {}            # channel -> moisture %
+        self.samples = 0
+        self.error = None
+        self.running = False
+
+    def start(self):
+        self.running = True
+        threading.Thread(target=self._reader, name="soil_adc", daemon=True).start()
+
+    def stop(self):
+        self.running = False
+
+    def _burst(self):
+        read = self.adc.read
+        n = self.oversample
+        mid = n // 2
+        out = {}
+        for ch in self.channels:
+            raw = sorted(read(ch) for _ in range(n))
+            out[ch] = raw[mid]
+        return out
+
+    def _update(self, medians):
+        """Fold one burst's medians into the IIR filter and the moisture values."""
+        with self.lock:
+            for ch, m in medians.items():
+                prev = self.filtered.get(ch)
+                f = m if prev is None else prev + self.alpha * (m - prev)
+                self.filtered[ch] = f
+                self.values[ch] = self.luts[ch][int(f + 0.5)]
+            self.samples += len(medians) * self.oversample
+            self.error = None
+
+    def _reader(self):
+        next_t = time.monotonic()
+        while self.running:
+            try:
+                self._update(self._burst())
+            except Exception as e:
+                with self.lock:
+                    self.error = f"ADC read error: {e}"
+            next_t += self.period
+            delay = next_t - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_t = time.monotonic()    # overran: don't try to catch up
+
+    def read(self):
+        """(per-probe moisture % dict, error or None)."""
+        with self.lock:
+            return dict(self.values), self.error
+
+    def mean(self):
+        vals, _ = self.read()
+        return round(sum(vals.values()) / len(vals)) if vals else None
+
+
+# ------------ BENCHMARK ------------
+
+def _bench(probes, seconds, oversample, burst_hz):
+    levels = {ch: (lambda t, ch=ch: 600 + 200 * math.sin(t / 5 + ch)) for ch in range(probes)}
+    sp = SoilProbes(SimulatedADC(levels), {ch: None for ch in range(probes)}, oversample, burst_hz)
+
+    # a thread standing in for the HTTP server: how late does it wake up?
+    lags = []
+    def waker():
+        end = time.monotonic() + seconds
+        while time.monotonic() < end:
+            t = time.monotonic()
+            time.sleep(0.005)
+            lags.append(time.monotonic() - t - 0.005)
+
+    w = threading.Thread(target=waker)
+    w.start()
+    w.join()
+    idle = sorted(lags)
+    lags.clear()
+
+    sp.start()
+    w = threading.Thread(target=waker)
+    w.start()
+    w.join()
+    sp.stop()
+    busy = sorted(lags)
+
+    def pct(xs, q):
+        return xs[min(len(xs) - 1, int(q * len(xs)))] * 1000
+
+    print(f"{probes} probes x {oversample} samples x {burst_hz} Hz: "
+          f"{sp.samples / seconds:.0f} samples/s aggregate")
+    print(f"wake-up lag idle    p50 {pct(idle, .5):.2f} ms  p99 {pct(idle, .99):.2f} ms")
+    print(f"wake-up lag reading p50 {pct(busy, .5):.2f} ms  p99 {pct(busy, .99):.2f} ms")
+    print("moisture %:", sp.read()[0])
+
+def main():
+    ap = argparse.ArgumentParser(description="Analog soil probe tools")
+    ap.add_argument("--bench", action="store_true")
+    ap.add_argument("--probes", type=int, default=8)
+    ap.add_argument("--seconds", type=float, default=5)
+    ap.add_argument("--oversample", type=int, default=OVERSAMPLE)
+    ap.add_argument("--burst-hz", type=float, default=BURST_HZ)
+    args = ap.parse_args()
+    if args.bench:
+        _bench(args.probes, args.seconds, args.oversample, args.burst_hz)
+    else:
+        ap.print_help()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+# edge-triggered input for the digital soil sensor (DO pin)
+# instead of sampling the pin every SENSOR_POLL seconds, RPi.GPIO calls us on
+# every edge. Contacts and comparator outputs bounce, so an edge only starts a
+# burst: once the pin has been quiet for DEBOUNCE seconds the level is read and,
+# if it differs from the last stable level, the transition is reported with the
+# time of the first edge of the burst. A slow re-read catches edges the kernel
+# missed (e.g. the pin changed while the agent was starting).
+#
+#   python3 soil_edge.py --bench       (simulated bouncy edges: detection latency vs polling)
+
+import time
+import random
+import argparse
+import threading
+
+DEBOUNCE = 0.05            # seconds the pin must be quiet before a level counts
+RESYNC = 60.0              # seconds between safety re-reads of the pin
+
+
+class EdgeInput:
+    """Debounced level of one GPIO input; on_change(level, ts) runs on each stable transition."""
+
+    def __init__(self, gpio, pin, on_change, debounce=DEBOUNCE, resync=RESYNC):
+        self.gpio = gpio
+        self.pin = pin
+        self.on_change = on_change
+        self.debounce = debounce
+        self.resync = resync
+        self.cv = threading.Condition()
+        self.level = None           # last stable level
+        self.changed_at = None      # wall-clock time of the last stable transition
+        self.burst_start = None     # monotonic time of the first edge of the current burst
+        self.last_edge = 0.0
+        self.edges = 0
+        self.running = False
+
+    def start(self):
+        self.level = self.gpio.input(self.pin)
+        self.changed_at = time.time()
+        self.running = True
+        threading.Thread(target=self._settle, name="soil_edge", daemon=True).start()
+        self.gpio.add_event_detect(self.pin, self.gpio.BOTH, callback=self._edge)
+
+    def stop(self):
+        self.running = False
+        self.gpio.remove_event_detect(self.pin)
+        with self.cv:
+            self.cv.notify()
+
+    def _edge(self, channel):
+        # called on the GPIO library's thread: record and hand off, nothing else
+        now = time.monotonic()
+        with self.cv:
+            self.edges += 1
+            self.last_edge = now
+            if self.burst_start is None:
+                self.burst_start = now
+                self.cv.notify()
+
+    def _settle(self):
+        next_resync = time.monotonic() + self.resync
+        while self.running:
+            with self.cv:
+                if self.burst_start is None:
+                    self.cv.wait(max(0.0, next_resync - time.monotonic()))
+                    if self.burst_start is None:
+                        first = None             # timeout: safety re-read
+                    else:
+                        continue
+                else:
+                    quiet = self.last_edge + self.debounce - time.monotonic()
+                    if quiet > 0:
+                        self.cv.wait(quiet)
+                        continue
+                    first, self.burst_start = self.burst_start, None
+            try:
+                level = self.gpio.input(self.pin)
+            except Exception as e:
+                print("Soil edge read error:", e)
+                continue
+            if first is None:
+                next_resync = time.monotonic() + self.resync
+            if level != self.level:
+                # a missed edge (resync) is dated now; a debounced one at its first edge
+                ts = time.time() - (0 if first is None else time.monotonic() - first)
+                self.level = level
+                self.changed_at = ts
+                try:
+                    self.on_change(level, ts)
+                except Exception as e:
+                    print("Soil edge callback error:", e)
+
+
+# ------------ SIMULATION ------------
+
+class SimulatedGPIO:
+    """The parts of RPi.GPIO EdgeInput uses, driven by drive() instead of a pin."""
+
+    BOTH = 33
+
+    def __init__(self, level=1):
+        self.levels = {}
+        self.default = level
+        self.callbacks = {}
+
+    def input(self, pin):
+        return self.levels.get(pin, self.default)
+
+    def add_event_detect(self, pin, edge, callback=None, bouncetime=None):
+        self.callbacks[pin] = callback
+
+    def remove_event_detect(self, pin):
+        self.callbacks.pop(pin, None)
+
+    def drive(self, pin, level, bounces=4, gap=0.002, rnd=random):
+        """Move the pin to `level` with a few bounces, firing callbacks like the GPIO thread would."""
+        cb = self.callbacks.get(pin)
+        seq = [level]
+        for _ in range(bounces):
+            seq[:0] = [level, 1 - level]
+        for i, lv in enumerate(seq):
+            if i:
+                time.sleep(rnd.uniform(0, gap))
+            if self.levels.get(pin, self.default) != lv:
+                self.levels[pin] = lv
+                if cb:
+                    cb(pin)
+
+
+def _bench(transitions, sensor_poll, auto_poll, debounce, seed=1):
+    rnd = random.Random(seed)
+    gpio = SimulatedGPIO(level=1)
+    seen = []
+    wake = threading.Event()
+
+    def on_change(level, ts):
+        seen.append((level, ts, time.time()))
+        wake.set()
+
+    e = EdgeInput(gpio, 17, on_change, debounce)
+    e.start()
+    lat = []
+    level = 1
+    for _ in range(transitions):
+        level = 1 - level
+        wake.clear()
+        t = time.time()
+        gpio.drive(17, level, bounces=rnd.randint(0, 6), rnd=rnd)
+        if not wake.wait(2):
+            print("transition missed")
+            continue
+        lat.append((seen[-1][2] - t, abs(seen[-1][1] - t)))
+        time.sleep(rnd.uniform(0, 0.02))
+    e.stop()
+
+    # fixed-interval polling: a change waits for the next sensor_loop sample,
+    # then for the next auto_loop pass (both at random phase)
+    poll = sorted(rnd.uniform(0, sensor_poll) + rnd.uniform(0, auto_poll) for _ in range(100000))
+    wakeup = sorted(x[0] for x in lat)
+    stamp = sorted(x[1] for x in lat)
+
+    def pct(xs, q):
+        return xs[min(len(xs) - 1, int(q * len(xs)))] * 1000
+
+    print(f"{transitions} bouncy transitions ({e.edges} edges), debounce {debounce * 1000:.0f} ms")
+    print(f"  edge-triggered: decision woken p50 {pct(wakeup, .5):8.1f} ms  p99 {pct(wakeup, .99):8.1f} ms; "
+          f"timestamp error p99 {pct(stamp, .99):.2f} ms")
+    print(f"  polling {sensor_poll:g}s + {auto_poll:g}s: p50 {pct(poll, .5):8.1f} ms  p99 {pct(poll, .99):8.1f} ms")
+
+def main():
+    ap = argparse.ArgumentParser(description="Edge-triggered soil input")
+    ap.add_argument("--bench", action="store_true")
+    ap.add_argument("--transitions", type=int, default=200)
+    ap.add_argument("--sensor-poll", type=float, default=2)
+    ap.add_argument("--auto-poll", type=float, default=10)
+    ap.add_argument("--debounce", type=float, default=DEBOUNCE)
+    args = ap.parse_args()
+    if args.bench:
+        _bench(args.transitions, args.sensor_poll, args.auto_poll, args.debounce)
+    else:
+        ap.print_help()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import alerts
+from alerts import Alerts, StubGateway, TokenBucket, BATCH_WINDOW, CLEAR_HOLD, REPEAT_INTERVAL, RETRY_BASE
+
+
+def dispatcher(clock, gw, rate_limits=alerts.RATE_LIMITS):
+    return Alerts([("sms", "+910000000000")], {"sms": gw}, clock=clock, rate_limits=rate_limits)
+
+def drain(a):
+    while not a.q.empty():
+        a._handle(*a.q.get_nowait())
+
+def advance(a, seconds, step=1.0):
+    end = a.clock() + seconds
+    while a.clock() < end:
+        a.process(a.clock.advance(step))
+
+
+def test_flapping_condition_is_one_alert_and_one_resolution(clock):
+    gw = StubGateway()
+    a = dispatcher(clock, gw)
+    for _ in range(500):
+        a.event("esp_unreachable", "ESP pump node unreachable")
+        drain(a)
+        clock.advance(2)
+        a.clear("esp_unreachable")
+        drain(a)
+        a.process(clock.advance(2))
+    advance(a, CLEAR_HOLD + BATCH_WINDOW + 5)
+    texts = [t for _, t in gw.sent]
+    assert texts == ["ALERT: ESP pump node unreachable",
+                     "RESOLVED: esp_unreachable (occurred 500x)"]
+
+
+def test_reminder_at_most_once_per_repeat_interval(clock):
+    gw = StubGateway()
+    a = dispatcher(clock, gw)
+    for _ in range(3 * REPEAT_INTERVAL // 60):
+        a.event("dht", "DHT sensor not responding")
+        drain(a)
+        advance(a, 60, step=10)
+    texts = [t for _, t in gw.sent]
+    assert texts[0] == "ALERT: DHT sensor not responding"
+    assert len([t for t in texts if t.startswith("STILL ACTIVE")]) == 2
+    assert len(texts) == 3
+
+
+def test_messages_in_batch_window_go_out_together(clock):
+    gw = StubGateway()
+    a = dispatcher(clock, gw)
+    a.event("dht", "DHT sensor not responding")
+    a.event("esp_error", "Pump node did not acknowledge command")
+    drain(a)
+    advance(a, BATCH_WINDOW - 2)
+    assert gw.sent == []
+    advance(a, 3)
+    assert gw.sent == [("+910000000000", "ALERT: DHT sensor not responding\n"
+                                          "ALERT: Pump node did not acknowledge command")]
+
+
+def test_channel_rate_limit(clock):
+    gw = StubGateway()
+    a = dispatcher(clock, gw, rate_limits={"sms": (2, 3600)})
+    for i in range(6):
+        a.event(f"c{i}", f"condition {i}")
+        drain(a)
+        advance(a, BATCH_WINDOW + 1)
+    assert len(gw.sent) == 2                     # the rest keep collecting
+    advance(a, 1800, step=10)               # one token back per 1800 s
+    assert len(gw.sent) == 3
+    assert gw.sent[-1][1].count("\n") == 3       # the 4 held alerts in one message
+
+
+def test_failed_sends_are_retried_with_backoff(clock):
+    gw = StubGateway(fail_first=2)
+    a = dispatcher(clock, gw)
+    a.event("dht", "DHT sensor not responding")
+    drain(a)
+    advance(a, BATCH_WINDOW + 1)
+    assert gw.sent == [] and a.stats["retries"] == 1
+    advance(a, RETRY_BASE + 2 * RETRY_BASE + 1)
+    assert len(gw.sent) == 1 and a.stats["retries"] == 2 and a.stats["failed"] == 0
+
+
+def test_no_recipients_is_a_no_op():
+    a = Alerts([], {})
+    a.event("dht", "x")
+    assert a.q.empty() and not a.enabled
+
+
+def test_token_bucket_refills():
+    b = TokenBucket(2, 10, 0.0)
+    assert b.take(0.0) and b.take(0.0) and not b.take(0.0)
+    assert not b.take(4.0) and b.take(5.0)
+
+
+def test_clear_before_dispatcher_saw_the_event_is_kept(clock):
+    gw = StubGateway()
+    a = dispatcher(clock, gw)
+    a.event("esp_unreachable", "ESP pump node unreachable")
+    a.clear("esp_unreachable")                   # both still queued
+    drain(a)
+    advance(a, CLEAR_HOLD + BATCH_WINDOW + 5)
+    assert [t for _, t in gw.sent] == ["ALERT: ESP pump node unreachable",
+                                       "RESOLVED: esp_unreachable (occurred 1x)"]
+    assert a.conditions == {}
+
+
+def test_clear_of_unknown_condition_queues_nothing(clock):
+    a = dispatcher(clock, StubGateway())
+    a.clear("never_raised")
+    assert a.q.empty()
@@ -0,0 +1,60 @@
+import random
+import statistics
+
+import dht_filter
+from dht_filter import StreamFilter, DHTFilter, CHANNELS
+
+
+def test_median_and_mad_match_brute_force():
+    rnd = random.Random(3)
+    for window in (1, 2, 5, 15, 16):
+        f = StreamFilter(window, min_samples=10 ** 9)      # never rejects
+        for _ in range(300):
+            f.update(float(rnd.randint(0, 40)))
+            w = list(f.buf)
+            m = statistics.median(w)
+            assert f.median() == m
+            assert f.mad() == statistics.median(abs(x - m) for x in w)
+
+
+def test_running_mean_and_std():
+    f = StreamFilter(10, min_samples=10 ** 9)
+    xs = [float(x) for x in range(25)]
+    for x in xs:
+        f.update(x)
+    st = f.stats()
+    assert st["mean"] == statistics.fmean(xs[-10:])
+    assert abs(st["std"] - statistics.pstdev(xs[-10:])) < 1e-3
+
+
+def test_spike_replaced_by_median():
+    f = StreamFilter(**CHANNELS["temperature"])
+    for x in (27, 27, 28, 27, 27, 28, 27, 27):
+        assert f.update(x) == (x, False)
+    assert f.update(60) == (27, True)
+    assert f.update(27) == (27, False)
+    assert f.rejected == 1
+
+
+def test_step_change_accepted_once_it_fills_half_the_window():
+    f = StreamFilter(**CHANNELS["temperature"])
+    for _ in range(15):
+        f.update(25)
+    out = [f.update(35) for _ in range(10)]
+    flagged = [o for _, o in out]
+    assert flagged[0] and not flagged[-1]
+    assert flagged.index(False) <= 8                      # ceil(15 / 2) samples at most
+    assert out[-1] == (35, False)
+
+
+def test_normal_dht11_steps_pass():
+    f = DHTFilter()
+    seq = [(27, 60), (27, 61), (28, 60), (28, 62), (29, 63), (28, 62), (29, 60), (30, 61)]
+    assert [f.update(t, h) for t, h in seq] == seq
+
+
+def test_fewer_false_pump_triggers_on_spiky_season():
+    for seed in (1, 2):
+        base, raw, filtered = dht_filter._replay(30, 0.01, seed, 35.0)
+        assert raw > base                 # the spikes do cause false triggers
+        assert filtered - base <= (raw - base) // 10
@@ -0,0 +1,87 @@
+import threading
+
+import pytest
+
+from geoweather import CellCache, encode, bounds, center, simulate
+
+
+def test_encode_known_points():
+    assert encode(57.64911, 10.40744, 11) == "u4pruydqqvj"
+    assert encode(12.97, 77.59, 4) == "tdr1"
+    assert encode(-90, -180, 3) == "000"
+
+
+@pytest.mark.parametrize("lat, lon", [(12.97, 77.59), (-33.87, 151.21), (51.5, -0.12), (0, 0)])
+def test_cell_contains_point(lat, lon):
+    for precision in range(1, 8):
+        cell = encode(lat, lon, precision)
+        lat_lo, lat_hi, lon_lo, lon_hi = bounds(cell)
+        assert lat_lo <= lat < lat_hi and lon_lo <= lon < lon_hi
+        assert encode(*center(cell), precision) == cell
+
+
+class Upstream:
+    """fetch(lat, lon) for the cache: counts calls, returns `data` (None = failure)."""
+
+    def __init__(self, data="sunny"):
+        self.data = data
+        self.calls = []
+
+    def __call__(self, lat, lon):
+        self.calls.append((lat, lon))
+        return self.data
+
+
+def test_one_fetch_per_cell_per_ttl(clock):
+    up = Upstream()
+    cache = CellCache(up, ttl=300, clock=clock)
+    assert cache.get(12.97, 77.59) == "sunny"
+    assert cache.get(12.98, 77.60) == "sunny"          # same cell
+    assert len(up.calls) == 1 and cache.calls == 1
+    assert up.calls[0] == center(cache.cell_of(12.97, 77.59))
+    cache.get(13.34, 77.10)                            # another cell
+    assert len(up.calls) == 2
+    clock.advance(299)
+    cache.get(12.97, 77.59)
+    assert len(up.calls) == 2
+    clock.advance(1)
+    cache.get(12.97, 77.59)
+    assert len(up.calls) == 3
+
+
+def test_failed_fetch_keeps_previous_data(clock):
+    up = Upstream()
+    cache = CellCache(up, ttl=300, clock=clock)
+    cache.get(12.97, 77.59)
+    up.data = None
+    clock.advance(300)
+    assert cache.get(12.97, 77.59) == "sunny"
+    assert cache.calls == 2
+    fresh = CellCache(Upstream(None), clock=clock)
+    assert fresh.get(12.97, 77.59) is None
+
+
+def test_concurrent_callers_share_one_fetch():
+    release = threading.Event()
+    up = Upstream()
+
+    def slow(lat, lon):
+        release.wait(5)
+        return up(lat, lon)
+
+    cache = CellCache(slow)
+    out = []
+    threads = [threading.Thread(target=lambda: out.append(cache.get(12.97, 77.59))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    release.set()
+    for t in threads:
+        t.join(5)
+    assert out == ["sunny"] * 8
+    assert len(up.calls) == 1 and cache.calls == 1
+
+
+def test_simulation_counts():
+    res = simulate(farms=200, hours=1)
+    assert res["per_farm_calls"] == 200 * 12
+    assert res["shared_calls"] == res["cells"] * 12
@@ -0,0 +1,86 @@
+import governor
+from governor import Governor, ProcSignals, RECOVER_HOLD, GOVERNOR_POLL
+
+CALM = {"cpu": 0.1, "load": 0.2, "temp": 50.0, "mem_free": 0.6,
+        "throttled": False, "on_battery": False, "battery": None}
+
+
+def governed(clock, signals):
+    return Governor(source=lambda: dict(signals), clock=clock)
+
+def run(g, seconds):
+    end = g.clock() + seconds
+    while g.clock() < end:
+        g.clock.advance(GOVERNOR_POLL)
+        g.update()
+    return g.level
+
+
+def test_cpu_burst_does_not_raise_level(clock):
+    sig = dict(CALM)
+    g = governed(clock, sig)
+    run(g, 60)
+    sig["cpu"] = 1.0                  # one 5 s burst (an export)
+    run(g, GOVERNOR_POLL)
+    sig["cpu"] = 0.1
+    assert run(g, 60) == 0
+    assert g.transitions == []
+
+
+def test_sustained_cpu_raises_then_degrades(clock):
+    g = governed(clock, dict(CALM, cpu=1.0))
+    assert run(g, 10) == 0       # smoothed value still low
+    assert run(g, 30) == 1
+    assert run(g, 60) == 2
+
+
+def test_simulated_heat_and_step_down_recovery(clock):
+    g = governed(clock, CALM)
+    g.simulate(temp=83.0)
+    assert run(g, GOVERNOR_POLL) == 0          # needs RAISE_SAMPLES reads
+    assert run(g, GOVERNOR_POLL) == 2
+    assert g.interval(300) == 1200 and g.interval(2, critical=True) == 2
+    g.clear_simulation()
+    assert run(g, RECOVER_HOLD - GOVERNOR_POLL) == 2
+    assert run(g, 2 * GOVERNOR_POLL) == 1      # one step at a time
+    assert run(g, RECOVER_HOLD) == 0
+
+
+def test_shedding_by_kind(clock):
+    g = governed(clock, CALM)
+    g.simulate(throttled=True)
+    run(g, 2 * GOVERNOR_POLL)
+    assert g.level == 2
+    served = [g.admit("poll")[0] for _ in range(10)]
+    assert served[:2] == [True, True] and not any(served[2:])
+    ok, retry = g.admit("poll")
+    assert not ok and retry == governor.RETRY_AFTER["poll"] * governor.STRETCH[2]
+    assert g.admit("heavy") == (False, governor.RETRY_AFTER["heavy"])
+    assert all(g.admit("control")[0] for _ in range(100))
+    m = g.metrics()
+    assert m["requests"]["poll"] == {"served": 2, "shed": 9}
+    assert m["requests"]["control"]["shed"] == 0
+
+
+def test_proc_signals_from_fake_tree(tmp_path):
+    def put(rel, text):
+        p = tmp_path / rel.lstrip("/")
+        p.parent.mkdir(parents=True, exist_ok=True)
+        p.write_text(text)
+
+    put("/proc/stat", "cpu  100 0 100 800 0 0 0 0 0 0\n")
+    put("/proc/loadavg", "0.50 0.40 0.30 1/100 1234\n")
+    put("/proc/meminfo", "MemTotal:       1000 kB\nMemFree:  50 kB\nMemAvailable:    100 kB\n")
+    put("/sys/class/thermal/thermal_zone0/temp", "71500\n")
+    put("/sys/devices/platform/soc/soc:firmware/get_throttled", "0x50005\n")
+    put("/sys/class/power_supply/BAT0/type", "Battery\n")
+    put("/sys/class/power_supply/BAT0/status", "Discharging\n")
+    put("/sys/class/power_supply/BAT0/capacity", "12\n")
+    src = ProcSignals(str(tmp_path))
+    s = src.read()
+    assert s["cpu"] is None                        # needs two reads
+    assert s["temp"] == 71.5 and s["mem_free"] == 0.1
+    assert s["throttled"] is True and s["on_battery"] is True and s["battery"] == 12.0
+    put("/proc/stat", "cpu  200 0 200 900 0 0 0 0 0 0\n")
+    assert src.read()["cpu"] == round(200 / 300, 3)
+    assert governor.pressure(s)[0] == 2
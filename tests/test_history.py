@@ -0,0 +1,107 @@
+import csv
+import gzip
+import io
+import json
+import time
+
+import pytest
+
+from history import History, connect, export, gzip_chunks, FLUSH_INTERVAL, TABLES
+from journal import Journal
+
+
+def count(path):
+    conn = connect(path)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM readings").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_writer_flush_follows_pace(tmp_path):
+    asked = []
+
+    def pace(base):
+        asked.append(base)
+        return 0.05
+
+    path = str(tmp_path / "h.db")
+    h = History(path, pace)
+    h.start()
+    h.add_reading(1.0, 25.0, 50.0, 0)
+    deadline = time.monotonic() + 2         # well before an unpaced FLUSH_INTERVAL
+    while time.monotonic() < deadline and count(path) == 0:
+        time.sleep(0.02)
+    assert count(path) == 1
+    assert asked and set(asked) == {FLUSH_INTERVAL}
+
+
+@pytest.fixture
+def store(tmp_path):
+    path = str(tmp_path / "h.db")
+    h = History(path)
+    conn = connect(path)
+    with conn:
+        conn.executemany("INSERT INTO readings VALUES (?,?,?,?)",
+                         [(100.0 + 2 * i, 20.0 + i % 7, 55.5, i % 2 * 100) for i in range(5000)])
+        conn.execute("INSERT INTO readings VALUES (?,?,?,?)", (20000.0, float("inf"), None, None))
+        conn.execute("INSERT INTO readings VALUES (?,?,?,?)", (20002.0, float("nan"), -float("inf"), 0))
+    conn.close()
+    return h
+
+
+def body(chunks):
+    return b"".join(chunks)
+
+
+def test_csv_export_range(store):
+    ctype, chunks = export(store, "readings", 200, 300, "csv")
+    assert ctype == "text/csv"
+    rows = list(csv.reader(io.StringIO(body(chunks).decode())))
+    assert rows[0] == ["ts", "temperature", "humidity", "soil"]
+    assert [float(r[0]) for r in rows[1:]] == [200.0 + 2 * i for i in range(50)]   # to is exclusive
+    assert rows[1] == ["200.0", "21.0", "55.5", "0"]
+
+
+def test_ndjson_export_is_valid_json(store):
+    ctype, chunks = export(store, "readings", fmt="ndjson")
+    assert ctype == "application/x-ndjson"
+    chunks = list(chunks)
+    assert len(chunks) > 1                          # streamed in batches
+    lines = b"".join(chunks).decode().splitlines()
+    recs = [json.loads(line) for line in lines]
+    assert len(recs) == 5002
+    assert recs[0] == {"ts": 100.0, "temperature": 20.0, "humidity": 55.5, "soil": 0}
+    assert recs[-2] == {"ts": 20000.0, "temperature": None, "humidity": None, "soil": None}
+    assert recs[-1] == {"ts": 20002.0, "temperature": None, "humidity": None, "soil": 0}
+
+
+def test_gzip_export_matches_plain(store):
+    _, plain = export(store, "readings", 100, 5000, "ndjson")
+    _, packed = export(store, "readings", 100, 5000, "ndjson", gz=True)
+    assert gzip.decompress(body(packed)) == body(plain)
+
+
+def test_gzip_chunks_single_member():
+    data = [b"a" * 1000, b"", b"b" * 70000]
+    assert gzip.decompress(body(gzip_chunks(iter(data)))) == b"".join(data)
+
+
+def test_journal_export(store):
+    Journal(store.path)                                   # creates the journal table
+    conn = connect(store.path)
+    with conn:
+        conn.execute("INSERT INTO journal (ts, zone, run_id, kind, seconds, ok, data) VALUES (?,?,?,?,?,?,?)",
+                     (150.0, "bed", "r1", "start", 5, None, json.dumps({"soil": 0, "note": "a\nb"})))
+    conn.close()
+    _, chunks = export(store, "journal", 100, 200, "ndjson")
+    recs = [json.loads(line) for line in body(chunks).decode().splitlines()]
+    assert len(recs) == 1 and recs[0]["run_id"] == "r1" and recs[0]["ok"] is None
+    assert json.loads(recs[0]["data"]) == {"soil": 0, "note": "a\nb"}
+    _, chunks = export(store, "journal", 200, None, "csv")
+    assert body(chunks).decode().splitlines() == [",".join(TABLES["journal"])]
+
+
+def test_unknown_table(store):
+    with pytest.raises(ValueError):
+        body(store.iter_batches("sqlite_master"))
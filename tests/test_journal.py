@@ -0,0 +1,73 @@
+import time
+
+import pytest
+
+from journal import Journal
+
+
+@pytest.fixture
+def journal(tmp_path):
+    j = Journal(str(tmp_path / "j.db"))
+    j.start()
+    return j
+
+
+def settle(j, kind, count):
+    """Wait for the writer to commit `count` entries of `kind`."""
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        if len(j.query(kind=kind)) >= count:
+            return
+        time.sleep(0.05)
+    raise AssertionError(f"writer did not commit {count} {kind} entries")
+
+
+def test_start_is_committed_before_returning(tmp_path):
+    j = Journal(str(tmp_path / "j.db"))           # no writer thread
+    run = j.run_started("bed", 5, "manual", {"soil": 0})
+    [e] = j.query()
+    assert (e["run_id"], e["kind"], e["seconds"]) == (run, "start", 5)
+    assert e["data"] == {"soil": 0, "source": "manual"}
+
+
+def test_reconcile_unfinished_run(journal):
+    run = journal.run_started("bed", 10, "auto")
+    started = journal.query(kind="start")[0]["ts"]
+    [r] = journal.reconcile(now=started + 60)
+    assert (r["run_id"], r["closed"], r["still_running"]) == (run, False, False)
+    [e] = journal.query(kind="reconciled")
+    assert e["run_id"] == run and e["data"] == {"still_running": False}
+    assert journal.reconcile(now=started + 120) == []
+
+
+def test_reconcile_run_in_its_window(journal):
+    run = journal.run_started("bed", 10, "auto")
+    started = journal.query(kind="start")[0]["ts"]
+    [r] = journal.reconcile(now=started + 4)
+    assert (r["run_id"], r["closed"], r["still_running"]) == (run, False, True)
+    # still reported while the window is open, but closed only once
+    [r] = journal.reconcile(now=started + 6)
+    assert (r["closed"], r["still_running"]) == (True, True)
+    assert len(journal.query(kind="reconciled")) == 1
+    assert journal.reconcile(now=started + 11) == []
+
+
+def test_acknowledged_run(journal):
+    run = journal.run_started("bed", 10, "manual")
+    journal.run_finished("bed", run, 10, True, 0.2)
+    settle(journal, "end", 1)
+    started = journal.query(kind="start")[0]["ts"]
+    # the node keeps the relay on until start + seconds, whatever it acked
+    [r] = journal.reconcile(now=started + 5)
+    assert (r["closed"], r["still_running"]) == (True, True)
+    assert journal.reconcile(now=started + 30) == []
+    assert journal.query(kind="reconciled") == []
+
+
+def test_decisions_only_on_change(journal):
+    for outcome in ("idle", "idle", "water", "water", "veto", "idle"):
+        journal.decision("bed", outcome, {"soil": 0})
+    settle(journal, "decision", 4)
+    time.sleep(0.6)
+    assert [e["data"]["outcome"] for e in reversed(journal.query(kind="decision"))] == \
+        ["idle", "water", "veto", "idle"]
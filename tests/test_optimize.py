@@ -0,0 +1,17 @@
+import random
+
+from optimize import pareto_front, pick
+
+
+def test_front_does_not_depend_on_result_order():
+    results = [((30.0, 5, 24), 10.0, 5.0), ((31.0, 5, 24), 10.0, 5.0), ((28.0, 2, 0), 8.0, 9.0),
+               ((29.0, 3, 12), 12.0, 1.0), ((35.0, 8, 6), 12.0, 1.0), ((36.0, 20, 48), 14.0, 2.0)]
+    fronts = set()
+    for seed in range(20):
+        shuffled = results[:]
+        random.Random(seed).shuffle(shuffled)
+        front = pareto_front(shuffled)
+        fronts.add((tuple(front), pick(front)))
+    assert len(fronts) == 1
+    front, _ = fronts.pop()
+    assert [c for c, _, _ in front] == [(28.0, 2, 0), (30.0, 5, 24), (29.0, 3, 12)]
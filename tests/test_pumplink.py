@@ -0,0 +1,130 @@
+import json
+import socket
+import threading
+import time
+
+import pytest
+
+from pump_emulator import Emulator
+from pumplink import PumpLink
+
+
+def wait_for(cond, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if cond():
+            return True
+        time.sleep(0.005)
+    return False
+
+
+@pytest.fixture
+def node():
+    emu = Emulator(port=0)
+    emu.start()
+    yield emu
+    emu.stop()
+
+
+@pytest.fixture
+def link(node):
+    states = []
+    ln = PumpLink("127.0.0.1", node.port, on_state=states.append)
+    ln.states = states
+    ln.start()
+    assert wait_for(lambda: ln.connected)
+    yield ln
+    ln.stop()
+
+
+def test_water_and_state(node, link):
+    assert wait_for(lambda: link.states)           # the node pushes its state on connect
+    assert link.water(2)
+    assert link.state["relay"] == 1 and node.relay == 1
+    assert not link.water(25)                       # the node refuses runs over its limit
+    assert link.command("ping")["ok"]
+
+
+def test_replies_matched_by_id(node, link):
+    out = {}
+
+    def ask(i):
+        out[i] = link.command("water" if i % 2 else "bogus", seconds=1)
+
+    threads = [threading.Thread(target=ask, args=(i,)) for i in range(20)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5)
+    for i, reply in out.items():
+        assert reply["ok"] is bool(i % 2)
+    assert len({r["ack"] for r in out.values()}) == 20
+    assert link.pending == {}
+
+
+def test_reconnects_after_node_drops(node, link):
+    assert wait_for(lambda: node.clients)          # accepted on the node's side too
+    node.kick()
+    assert wait_for(lambda: link.reconnects == 1 and link.connected)
+    assert link.water(1)
+
+
+def test_command_while_down(node):
+    ln = PumpLink("127.0.0.1", node.port)
+    assert ln.command("ping") is None               # never started
+    assert not ln.water(1)
+
+
+class Node:
+    """A bare node that answers the link's commands in reverse order, or not at all."""
+
+    def __init__(self, batch=2, answer=True):
+        self.srv = socket.socket()
+        self.srv.bind(("127.0.0.1", 0))
+        self.srv.listen(1)
+        self.port = self.srv.getsockname()[1]
+        self.batch = batch
+        self.answer = answer
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _serve(self):
+        conn, _ = self.srv.accept()
+        f = conn.makefile("rb")
+        msgs = [json.loads(f.readline()) for _ in range(self.batch)]
+        if self.answer:
+            for m in reversed(msgs):
+                conn.sendall(json.dumps({"ack": m["id"], "ok": True, "echo": m["seconds"]}).encode() + b"\n")
+        time.sleep(0.2)
+        conn.close()
+        self.srv.close()
+
+
+def test_out_of_order_acks():
+    node = Node()
+    ln = PumpLink("127.0.0.1", node.port)
+    ln.start()
+    try:
+        assert wait_for(lambda: ln.connected)
+        out = {}
+        threads = [threading.Thread(target=lambda s=s: out.__setitem__(s, ln.command("water", seconds=s)))
+                   for s in (3, 7)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(5)
+        assert out[3]["echo"] == 3 and out[7]["echo"] == 7
+    finally:
+        ln.stop()
+
+
+def test_dropped_link_wakes_waiters():
+    node = Node(batch=1, answer=False)
+    ln = PumpLink("127.0.0.1", node.port)
+    ln.start()
+    try:
+        assert wait_for(lambda: ln.connected)
+        t = time.monotonic()
+        assert ln.command("water", timeout=5, seconds=1) is None
+        assert time.monotonic() - t < 2                 # woken by the drop, not the timeout
+    finally:
+        ln.stop()
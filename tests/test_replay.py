@@ -0,0 +1,80 @@
+import random
+
+import pytest
+
+from policy import should_water
+from replay import Timeline, replay, veto_intervals, synthetic_season, SLOT, WET_SOIL
+
+
+def stepped(tl, rain_slots, temp_th, soil_th, pump_time, horizon_hours, auto_poll,
+            cooldown, stagger, wet_per_pump_second, dry_level):
+    """The same season one second at a time: what replay() is meant to shortcut."""
+    vetoes = veto_intervals(rain_slots, horizon_hours)
+    period = max(pump_time + max(cooldown, stagger), auto_poll)
+    wet_span = wet_per_pump_second * pump_time
+    segs = list(tl.segments())
+    runs = vetoed_checks = dry = 0
+    wet_until = float("-inf")
+    c = segs[0][0]
+    for a, b, temp, s in segs:
+        for t in range(int(a), int(b)):
+            vetoed = any(lo <= t < hi for lo, hi in vetoes)
+            soil = WET_SOIL if (t < wet_until and s is not None) else s
+            if t == c:
+                if should_water(temp, soil, temp_th, soil_th, vetoed):
+                    runs += 1
+                    wet_until = max(wet_until, t + wet_span)
+                    c += period
+                else:
+                    if vetoed and should_water(temp, soil, temp_th, soil_th, False):
+                        vetoed_checks += 1
+                    c += auto_poll
+            soil = WET_SOIL if (t < wet_until and s is not None) else s
+            if soil is not None and soil < dry_level:
+                dry += 1
+    return runs, vetoed_checks, round(dry / 3600, 2)
+
+
+def random_season(seed, hours=36, poll=60):
+    rnd = random.Random(seed)
+    tl = Timeline(poll)
+    temp, soil = 28.0, 0
+    for k in range(hours * 3600 // poll):
+        if rnd.random() < 0.3:
+            temp = rnd.choice([None, 26.0, 29.0, 31.0, 33.0])
+        if rnd.random() < 0.1:
+            soil = rnd.choice([None, 0, 0, WET_SOIL])
+        tl.append(k * poll, temp, soil)
+    rain = [k * SLOT for k in range(hours * 3600 // SLOT) if rnd.random() < 0.3]
+    return tl, rain
+
+
+@pytest.mark.parametrize("seed", range(4))
+@pytest.mark.parametrize("wet_per_pump_second, horizon", [(0, 6), (2, 6), (600, 6), (600, 0)])
+def test_replay_matches_stepped_clock(seed, wet_per_pump_second, horizon):
+    tl, rain = random_season(seed)
+    params = dict(temp_th=30, soil_th=30, pump_time=5, horizon_hours=horizon, auto_poll=10,
+                  cooldown=3, stagger=30, wet_per_pump_second=wet_per_pump_second, dry_level=30)
+    rep = replay(tl, rain, **params)
+    runs, vetoed_checks, dry_hours = stepped(tl, rain, **params)
+    assert (rep["pump_runs"], rep["vetoed_checks"], rep["dry_hours"]) == (runs, vetoed_checks, dry_hours)
+    assert runs > 0
+
+
+def test_timeline_merges_repeats():
+    tl = Timeline(2)
+    for ts, temp, soil in [(0, 30.0, 0), (2, 30.0, 0), (4, 31.0, 0), (6, 31.0, 0)]:
+        tl.append(ts, temp, soil)
+    assert len(tl) == 2
+    assert list(tl.segments()) == [(0, 4, 30.0, 0), (4, 8, 31.0, 0)]
+
+
+def test_veto_intervals_merge():
+    assert veto_intervals([0, SLOT, 10 * SLOT], 3) == [[-3 * 3600, 2 * SLOT], [10 * SLOT - 3 * 3600, 11 * SLOT]]
+
+
+def test_synthetic_season_report():
+    tl, rain = synthetic_season(days=7)
+    rep = replay(tl, rain)
+    assert rep["simulated_hours"] == 7 * 24
+    assert rep["pump_seconds"] == rep["pump_runs"] * 5
@@ -0,0 +1,116 @@
+import random
+
+import pytest
+
+from rules import (CROPS, RuleEngine, RuleError, CompiledProfile, MAX_DEPTH,
+                   default_profile, _interpret, _expr)
+
+
+def walk(profile, f):
+    """Decide one zone by walking its stage's rule tree (the --bench reference)."""
+    stage = profile.spec.get("stages", [profile.spec])[profile.stage(f.get("day"))]
+    params = profile.spec.get("params", {})
+    used = {}
+    _expr(["and", stage["when"], stage.get("unless", False)], params, used)
+    if any(f.get(k) is None for k in used) or not _interpret(stage["when"], params, f):
+        return "idle"
+    if stage.get("unless") is not None and _interpret(stage["unless"], params, f):
+        return "veto"
+    return "water"
+
+
+def test_compiled_matches_tree_walk():
+    rnd = random.Random(7)
+    engine = RuleEngine(CROPS + [default_profile(30, 30, 5)])
+    names = list(engine.profiles)
+    n = 2000
+    zones = [(f"z{i}", rnd.choice(names)) for i in range(n)]
+    features = {
+        "temperature": [rnd.choice((None,) + tuple(range(20, 40))) for _ in range(n)],
+        "humidity": [rnd.uniform(40, 95) for _ in range(n)],
+        "soil": [rnd.choice((None, rnd.uniform(0, 100))) for _ in range(n)],
+        "rain": [rnd.random() < 0.2 for _ in range(n)],
+        "hour": [rnd.randrange(24) for _ in range(n)],
+        "day": [rnd.randrange(120) for _ in range(n)],
+        "since_water": [rnd.uniform(0, 48) for _ in range(n)],
+    }
+    out = engine.evaluate(zones, features)
+    for i, (_, name) in enumerate(zones):
+        f = {k: v[i] for k, v in features.items()}
+        assert out[i][0] == walk(engine.profiles[name], f), (name, f)
+    assert {o for o, _, _ in out} == {"idle", "water", "veto"}
+
+
+def test_stage_selection_and_seconds():
+    engine = RuleEngine(CROPS)
+    zones = [("a", "tomato"), ("b", "tomato"), ("c", "tomato")]
+    features = {"soil": [10] * 3, "temperature": [25] * 3, "rain": [False] * 3,
+                "humidity": [50] * 3, "since_water": [10] * 3, "day": [5, 21, 90]}
+    out = engine.evaluate(zones, features)
+    assert out == [("water", 4, "seedling"), ("water", 8, "vegetative"), ("water", 8, "fruiting")]
+
+
+def test_missing_feature_never_waters():
+    engine = RuleEngine([default_profile(30, 30, 5)])
+    out = engine.evaluate([("a", "default")], {"temperature": [None], "soil": [10], "rain": [False]})
+    assert out == [("idle", 0, "all")]
+
+
+def test_unknown_profile_is_idle():
+    engine = RuleEngine([])
+    assert engine.evaluate([("a", "nope")], {}) == [("idle", 0, None)]
+
+
+def test_unknown_feature_rejected():
+    with pytest.raises(RuleError, match="unknown feature"):
+        CompiledProfile({"name": "x", "when": ["<", "__import__", 1]})
+
+
+def test_unknown_param_rejected():
+    with pytest.raises(RuleError, match="unknown param"):
+        CompiledProfile({"name": "x", "when": ["<", "soil", "$dry"]})
+
+
+def test_compiled_code_has_no_builtins():
+    p = CompiledProfile({"name": "x", "when": ["<", "soil", 30]})
+    rule = p.stages[0][3]
+    assert rule.fn.__globals__["__builtins__"] == {"zip": zip}
+    assert rule.features == ["soil"]
+
+
+@pytest.mark.parametrize("spec, match", [
+    ({"name": "x", "seconds": 0, "when": "rain"}, "1-20"),
+    ({"name": "x", "seconds": 21, "when": "rain"}, "1-20"),
+    ({"name": "x"}, "no 'when'"),
+    ({"when": "rain"}, "needs a name"),
+    ({"name": "x", "when": ["<", "soil", float("nan")]}, "bad number"),
+    ({"name": "x", "when": ["<", "soil", float("inf")]}, "bad number"),
+    ({"name": "x", "when": ["~", "soil", 1]}, "unknown operator"),
+    ({"name": "x", "when": ["between", "soil", 1]}, "between"),
+    ({"name": "x", "stages": [{"when": "rain"}, {"when": "rain"}]}, "until_day"),
+    ({"name": "x", "stages": [{"until_day": 30, "when": "rain"},
+                              {"until_day": 30, "when": "rain"}, {"when": "rain"}]}, "increase"),
+    ({"name": "x", "stages": [{"until_day": 30, "when": "rain"},
+                              {"until_day": 10, "when": "rain"}, {"when": "rain"}]}, "increase"),
+    ({"name": "x", "stages": [{"until_day": "soon", "when": "rain"}, {"when": "rain"}]}, "until_day"),
+    ({"name": "x", "stages": [{"until_day": float("nan"), "when": "rain"}, {"when": "rain"}]}, "until_day"),
+])
+def test_bad_specs_rejected(spec, match):
+    with pytest.raises(RuleError, match=match):
+        CompiledProfile(spec)
+
+
+def test_depth_limit():
+    node = ["<", "soil", 1]
+    for _ in range(MAX_DEPTH):
+        node = ["not", node]
+    with pytest.raises(RuleError, match="nested"):
+        CompiledProfile({"name": "x", "when": node})
+
+
+def test_load_keeps_old_table_on_error():
+    engine = RuleEngine(CROPS)
+    before = engine.profiles
+    with pytest.raises(RuleError):
+        engine.load([{"name": "bad", "when": ["<", "soil", "$nope"]}])
+    assert engine.profiles is before
@@ -0,0 +1,147 @@
+import time
+
+import pytest
+
+from scheduler import Scheduler, parse_windows, window_start, check_job
+
+DAY = time.mktime((2025, 6, 1, 0, 0, 0, 0, 0, -1))      # local midnight
+H = 3600
+
+
+class Pump:
+    """run() for the scheduler: records (zone, start, seconds), optionally raising."""
+
+    def __init__(self, clock, fail=()):
+        self.clock = clock
+        self.fail = set(fail)           # job ids whose run raises
+        self.runs = []
+
+    def __call__(self, job):
+        if job.id in self.fail:
+            raise OSError("database is locked")
+        self.runs.append((job.zone, self.clock(), job.seconds))
+        return True
+
+
+@pytest.fixture
+def sched(clock, tmp_path):
+    clock.now = DAY + 4 * H
+    pump = Pump(clock)
+    s = Scheduler(pump, path=str(tmp_path / "s.db"), clock=clock, stagger=30)
+    s.pump = pump
+    return s
+
+
+def drain(s, until):
+    while s.clock() < until:
+        nxt = s.step(s.clock())
+        s.clock.now = min(until, max(s.clock(), nxt)) if nxt > s.clock() else s.clock()
+        if nxt == float("inf"):
+            break
+
+
+def test_job_waits_for_its_window(sched):
+    sched.set_zone("bed", ["05:00-07:00"])
+    sched.add("bed", 10)
+    drain(sched, DAY + 8 * H)
+    assert sched.pump.runs == [("bed", DAY + 5 * H, 10)]
+
+
+def test_run_must_fit_inside_the_window():
+    w = parse_windows(["05:00-05:10"])
+    assert window_start(DAY + 5 * H + 595, w, 10) == DAY + 29 * H      # tomorrow 05:00
+    assert window_start(DAY + 5 * H + 590, w, 10) == DAY + 5 * H + 590
+
+
+def test_window_wrapping_midnight(sched):
+    sched.set_zone("bed", ["22:00-02:00"])
+    sched.add("bed", 5, due=DAY + 3 * H)
+    sched.add("bed", 5, due=DAY + 25 * H)                               # 01:00 next day
+    drain(sched, DAY + 30 * H)
+    assert [r[1] for r in sched.pump.runs] == [DAY + 22 * H, DAY + 25 * H]
+
+
+def test_min_interval_counts_from_the_end_of_the_run(sched):
+    sched.set_zone("bed", None, min_interval=600)
+    sched.add("bed", 10, every=60)
+    drain(sched, DAY + 4 * H + 1300)
+    starts = [r[1] for r in sched.pump.runs]
+    assert starts == [DAY + 4 * H, DAY + 4 * H + 610, DAY + 4 * H + 1220]
+
+
+def test_zones_are_staggered(sched):
+    sched.add_many([{"zone": z, "seconds": 10} for z in ("a", "b", "c")])
+    drain(sched, DAY + 5 * H)
+    assert [(z, t - DAY - 4 * H) for z, t, _ in sched.pump.runs] == [("a", 0), ("b", 40), ("c", 80)]
+
+
+def test_hold_delays_every_run(sched):
+    sched.hold(DAY + 4 * H + 100)
+    sched.add("a", 5)
+    drain(sched, DAY + 5 * H)
+    assert [r[1] for r in sched.pump.runs] == [DAY + 4 * H + 100]
+
+
+def test_failed_run_does_not_strand_the_reactive_slot(sched):
+    first = sched.submit_reactive("bed", 5)
+    sched.pump.fail.add(first)
+    drain(sched, DAY + 4 * H + 1)
+    assert sched.stats["failed"] == 1 and sched.jobs == {} and sched.reactive == {}
+    second = sched.submit_reactive("bed", 5)
+    assert second != first
+    drain(sched, DAY + 5 * H)
+    assert [r[1] for r in sched.pump.runs] == [DAY + 4 * H + 35]        # after the failed run + stagger
+
+
+def test_failing_check_skips_and_releases(sched):
+    def check(job):
+        raise RuntimeError("sensor gone")
+    sched.check = check
+    sched.add("other", 20)
+    jid = sched.submit_reactive("bed", 5)                # has to wait for "other": re-checked
+    drain(sched, DAY + 5 * H)
+    assert sched.stats["skipped"] == 1 and jid not in sched.jobs and sched.reactive == {}
+    assert [r[0] for r in sched.pump.runs] == ["other"]
+
+
+def test_failed_repeating_job_is_rescheduled(sched):
+    jid = sched.add("bed", 5, every=H)
+    sched.pump.fail.add(jid)
+    drain(sched, DAY + 4 * H + 1)
+    assert sched.jobs[jid].due == DAY + 5 * H
+    sched.pump.fail.clear()
+    drain(sched, DAY + 5 * H + 1)
+    assert [r[1] for r in sched.pump.runs] == [DAY + 5 * H]
+
+
+def test_jobs_and_zones_survive_a_restart(sched, clock, tmp_path):
+    sched.set_zone("bed", ["05:00-07:00"], min_interval=60)
+    jid = sched.add("bed", 5, due=DAY + 6 * H, every=86400)
+    again = Scheduler(Pump(clock), path=str(tmp_path / "s.db"), clock=clock)
+    assert again.jobs[jid].as_dict() == sched.jobs[jid].as_dict()
+    assert again.zones["bed"]["spec"] == ["05:00-07:00"]
+
+
+@pytest.mark.parametrize("spec", [
+    {"seconds": 0}, {"seconds": 21}, {"seconds": "5"}, {"seconds": 5, "every": -5},
+    {"seconds": 5, "every": "60"}, {"seconds": 5, "every": 0}, {"seconds": 5, "due": float("nan")},
+])
+def test_bad_jobs_rejected(sched, spec):
+    with pytest.raises(ValueError):
+        check_job(spec)
+    with pytest.raises(ValueError):
+        sched.add_many([{"zone": "a", "seconds": 5}, dict(spec, zone="b")])
+    assert sched.jobs == {}
+
+
+@pytest.mark.parametrize("window", ["25:00-26:00", "05:60-06:00", "5-6", "05:00"])
+def test_bad_windows_rejected(window):
+    with pytest.raises(ValueError):
+        parse_windows([window])
+
+
+@pytest.mark.parametrize("gap", [-1, float("nan"), float("inf"), "60", None, True])
+def test_bad_min_interval_rejected(sched, gap):
+    with pytest.raises(ValueError):
+        sched.set_zone("bed", None, min_interval=gap)
+    assert "bed" not in sched.zones
@@ -0,0 +1,55 @@
+import os
+import time
+import math
+
+from sensor_proc import SampleRing, SensorProcess, _HEADER, _VERSION
+
+
+class FixedSensor:
+    temperature = 24.0
+    humidity = 55.0
+
+
+def test_ring_keeps_the_newest_lap():
+    ring = SampleRing(4)
+    try:
+        for i in range(6):
+            ring.publish(1000.0 + i, None if i == 5 else 20.0 + i, 50.0, 4.0)
+        recs = ring.since(0)
+        assert [r[0] for r in recs] == [2, 3, 4, 5]
+        assert math.isnan(recs[-1][2])
+        assert ring.latest_good()[:3] == (4, 1004.0, 24.0)
+        assert ring.counters() == (6, 5)
+    finally:
+        ring.close()
+
+
+def test_reader_gives_up_on_a_slot_left_mid_update():
+    ring = SampleRing(4)
+    try:
+        ring.publish(1.0, 20.0, 50.0, 4.0)
+        _VERSION.pack_into(ring.buf, _HEADER.size, 3)        # writer died mid-update
+        t = time.perf_counter()
+        assert ring.since(0) == [] and ring.latest_good() is None
+        assert time.perf_counter() - t < 1
+    finally:
+        ring.close()
+
+
+def test_process_publishes_and_leaves_no_segment():
+    sp = SensorProcess(FixedSensor, 0.05, nice=0)
+    name = sp.ring.name.lstrip("/")
+    assert not os.path.exists(os.path.join("/dev/shm", name))
+    sp.start()
+    try:
+        for _ in range(100):
+            temp, hum = sp.poll()
+            if temp is not None:
+                break
+            time.sleep(0.05)
+        assert (temp, hum) == (24.0, 55.0)
+        assert sp.stats()["alive"]
+    finally:
+        sp.stop()
+    sp.stop()                                    # again, as atexit does
+    assert not sp.alive
@@ -0,0 +1,88 @@
+import time
+
+import pytest
+
+from soil_adc import SoilProbes, SimulatedADC, build_lut, DEFAULT_CALIBRATION
+
+
+def test_lut_default_calibration():
+    lut = build_lut(DEFAULT_CALIBRATION)
+    assert len(lut) == 1024
+    assert lut[820] == 0.0 and lut[380] == 100.0
+    assert lut[600] == 50.0
+    assert lut[0] == 100.0 and lut[1023] == 0.0         # clamped past the calibration points
+    assert all(a >= b for a, b in zip(lut, lut[1:]))     # wetter reads lower
+
+
+def test_lut_piecewise_points():
+    lut = build_lut([(100, 0.0), (200, 80.0), (300, 100.0)], bits=9)
+    assert len(lut) == 512
+    assert lut[150] == 40.0 and lut[200] == 80.0 and lut[250] == 90.0
+    assert lut[50] == 0.0 and lut[511] == 100.0
+
+
+def test_lut_clamps_to_percent():
+    lut = build_lut([(100, -20.0), (200, 150.0)])
+    assert min(lut) == 0.0 and max(lut) == 100.0
+
+
+def test_burst_median_rejects_spikes():
+    adc = SimulatedADC({0: 600, 1: 400}, noise=3.0, spike_rate=0.2)
+    sp = SoilProbes(adc, {0: None, 1: None})
+    for _ in range(50):
+        m = sp._burst()
+        assert abs(m[0] - 600) < 15 and abs(m[1] - 400) < 15
+
+
+def test_iir_and_lookup():
+    sp = SoilProbes(SimulatedADC({0: 0}), {0: None}, oversample=4, alpha=0.25)
+    sp._update({0: 820})
+    assert sp.filtered[0] == 820 and sp.read() == ({0: 0.0}, None)
+    sp._update({0: 380})                                 # a step moves a quarter of the way
+    assert sp.filtered[0] == 710
+    assert sp.read()[0][0] == build_lut(DEFAULT_CALIBRATION)[710]
+    for _ in range(60):
+        sp._update({0: 380})
+    assert sp.read()[0][0] == 100.0
+    assert sp.samples == 62 * 4
+
+
+def test_mean_of_probes():
+    sp = SoilProbes(SimulatedADC({}), {0: None, 1: None})
+    assert sp.mean() is None
+    sp._update({0: 820, 1: 380})
+    assert sp.mean() == 50
+
+
+class Broken:
+    bits = 10
+
+    def read(self, channel):
+        raise OSError("SPI transfer failed")
+
+
+def test_reader_thread():
+    adc = SimulatedADC({0: 600, 3: lambda t: 380}, noise=2.0)
+    sp = SoilProbes(adc, {0: None, 3: [(380, 100.0), (820, 0.0)]}, oversample=8, burst_hz=200)
+    sp.start()
+    try:
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline and sp.samples < 16 * 20:
+            time.sleep(0.01)
+    finally:
+        sp.stop()
+    vals, err = sp.read()
+    assert err is None
+    assert vals[0] == pytest.approx(50, abs=3) and vals[3] == pytest.approx(100, abs=3)
+
+
+def test_reader_reports_adc_errors():
+    sp = SoilProbes(Broken(), {0: None}, burst_hz=200)
+    sp.start()
+    try:
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline and sp.read()[1] is None:
+            time.sleep(0.01)
+    finally:
+        sp.stop()
+    assert sp.read() == ({}, "ADC read error: SPI transfer failed")
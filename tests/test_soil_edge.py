@@ -0,0 +1,67 @@
+import time
+import random
+import threading
+
+import pytest
+
+from soil_edge import EdgeInput, SimulatedGPIO
+
+PIN = 17
+
+
+class Rig:
+    """EdgeInput on a SimulatedGPIO that records every reported transition."""
+
+    def __init__(self, debounce=0.02, resync=60.0):
+        self.gpio = SimulatedGPIO(level=1)
+        self.seen = []
+        self.changed = threading.Event()
+        self.edge = EdgeInput(self.gpio, PIN, self.on_change, debounce=debounce, resync=resync)
+
+    def on_change(self, level, ts):
+        self.seen.append((level, ts))
+        self.changed.set()
+
+
+@pytest.fixture
+def rig(request):
+    r = Rig(**getattr(request, "param", {}))
+    r.edge.start()
+    yield r
+    r.edge.stop()
+
+
+def test_bouncy_transition_reported_once_dated_at_first_edge(rig):
+    t = time.time()
+    rig.gpio.drive(PIN, 0, bounces=5, rnd=random.Random(1))
+    assert rig.changed.wait(2)
+    time.sleep(0.1)
+    assert [lv for lv, _ in rig.seen] == [0]
+    assert abs(rig.seen[0][1] - t) < 0.05
+    assert rig.edge.edges == 11 and rig.edge.level == 0
+
+
+def test_glitch_back_to_same_level_is_not_a_change(rig):
+    for level in (0, 1):
+        rig.gpio.levels[PIN] = level
+        rig.gpio.callbacks[PIN](PIN)
+    time.sleep(0.15)
+    assert rig.seen == [] and rig.edge.level == 1
+
+
+def test_every_transition_of_a_sequence_is_seen(rig):
+    rnd = random.Random(2)
+    level = 1
+    for _ in range(10):
+        level = 1 - level
+        rig.changed.clear()
+        rig.gpio.drive(PIN, level, bounces=rnd.randint(0, 4), rnd=rnd)
+        assert rig.changed.wait(2)
+    assert [lv for lv, _ in rig.seen] == [0, 1] * 5
+
+
+@pytest.mark.parametrize("rig", [{"resync": 0.1}], indirect=True)
+def test_missed_edge_caught_by_resync(rig):
+    rig.gpio.levels[PIN] = 0                     # no callback: the kernel missed it
+    assert rig.changed.wait(2)
+    assert rig.seen[0][0] == 0